@@ -0,0 +1,93 @@
+"""
+Runs the benchmark suite against synthetic streams and a local fake source.
+
+    python -m benchmarks                       # Run and print the results
+    python -m benchmarks --save baseline.json  # Also save them
+    python -m benchmarks --compare benchmarks/baseline.json
+
+Each scenario is run `--repeat` times in a fresh interpreter, and the median
+of each measurement is reported. With `--compare`, exits non-zero if a
+scenario's throughput, import time or peak RSS is more than `--threshold`
+worse than the saved results. Exceeding one of the absolute `BUDGETS` (such
+as the startup time of a tap's entry point) always exits non-zero. Results are machine-dependent, so compare
+against a baseline saved on the same kind of machine.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+from benchmarks.scenarios import SCENARIOS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Measurement -> True if higher is better
+METRICS = {'rows_per_second': True,
+           'streams_per_second': True,
+           'import_seconds': False,
+           'startup_seconds': False,
+           'peak_rss_kb': False}
+
+# Absolute limits, checked on every run regardless of --compare
+BUDGETS = {'startup': {'startup_seconds': 0.5}}
+
+def run_scenario(name, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.scenarios', name],
+                                         cwd=ROOT, stderr=subprocess.DEVNULL)
+        runs.append(json.loads(output))
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        for metric, higher_is_better in METRICS.items():
+            expected = baseline.get(name, {}).get(metric)
+            actual = result.get(metric)
+            if not expected or actual is None:
+                continue
+            change = (actual - expected) / expected
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append("{} {}: {:.4g} vs. {:.4g} ({:+.0%})".format(
+                    name, metric, actual, expected, change))
+    return regressions
+
+def over_budget(results):
+    return ["{} {}: {:.4g} exceeds the budget of {:.4g}".format(name, metric, results[name][metric], budget)
+            for name, budgets in BUDGETS.items() if name in results
+            for metric, budget in budgets.items() if results[name].get(metric, 0) > budget]
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('scenarios', nargs='*', help='Scenarios to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help='Write the results to this file')
+    parser.add_argument('--compare', help='Compare against results saved with --save')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Fraction a measurement may worsen before --compare fails')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        results[name] = run_scenario(name, args.repeat)
+        print("{:<24} {}".format(name, "  ".join("{}={:.4g}".format(k, v)
+                                                  for k, v in sorted(results[name].items()))))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    regressions = over_budget(results)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions += compare(results, json.load(f), args.threshold)
+    for regression in regressions:
+        print("REGRESSION: " + regression)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Compares rows/sec of the per-record `singer.Transformer` used by the sync loop
+before `CompiledTransform`, against the compiled transform.
+
+    python -m benchmarks.bench_transform [rows]
+"""
+import sys
+import time
+
+from singer import Transformer
+from singer import metadata
+from burler.transform import CompiledTransform
+
+def make_stream(width=20):
+    properties = {'id': {'type': 'integer'},
+                  'updated_at': {'type': 'string', 'format': 'date-time'}}
+    for i in range(width):
+        properties['field_{}'.format(i)] = {'type': ['null', 'string']}
+    schema = {'type': 'object', 'properties': properties}
+
+    mdata = metadata.new()
+    mdata = metadata.write(mdata, (), 'selected', True)
+    for field_name in properties:
+        mdata = metadata.write(mdata, ('properties', field_name), 'inclusion', 'available')
+        mdata = metadata.write(mdata, ('properties', field_name), 'selected', field_name != 'field_0')
+
+    def make_record(i):
+        record = {'field_{}'.format(n): 'value {}'.format(n) for n in range(width)}
+        record.update({'id': i, 'updated_at': '2018-01-01T00:00:00Z'})
+        return record
+    return schema, metadata.to_list(mdata), make_record
+
+def per_record(rows, schema, raw_metadata, make_record):
+    """ The pre-compilation sync loop: a new Transformer, schema dict and metadata map per row. """
+    for i in range(rows):
+        with Transformer() as transformer:
+            transformer.transform(make_record(i), dict(schema), metadata.to_map(raw_metadata))
+
+def compiled(rows, schema, raw_metadata, make_record):
+    with CompiledTransform(schema, metadata.to_map(raw_metadata)) as transformer:
+        for i in range(rows):
+            transformer.transform(make_record(i))
+
+def main(rows=20000):
+    schema, raw_metadata, make_record = make_stream()
+    for name, func in [('Transformer (per record)', per_record), ('CompiledTransform', compiled)]:
+        start = time.perf_counter()
+        func(rows, schema, raw_metadata, make_record)
+        elapsed = time.perf_counter() - start
+        print("{:<28} {:>10.0f} rows/sec".format(name, rows / elapsed))
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,62 @@
+"""
+A local HTTP stand-in for a paginated JSON API, so benchmarks don't touch the network.
+
+    GET /<object>?page=0&page_size=500&pages=10&width=20
+
+Returns `{"records": [...], "next_page": 1}`, with `next_page` null on the last page.
+Each record has an `id`, an `updated_at`, and `width` string fields.
+"""
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+def make_record(record_id, width):
+    record = {'id': record_id,
+              'updated_at': '2018-01-01T00:{:02d}:{:02d}Z'.format((record_id // 60) % 60, record_id % 60)}
+    for i in range(width):
+        record['field_{}'.format(i)] = 'value {} of record {}'.format(i, record_id)
+    return record
+
+def make_page(page, page_size, pages, width):
+    start = page * page_size
+    return {'records': [make_record(i, width) for i in range(start, start + page_size)],
+            'next_page': page + 1 if page + 1 < pages else None}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self): # pylint: disable=invalid-name
+        params = {k: int(v[0]) for k, v in parse_qs(urlparse(self.path).query).items()}
+        key = (params.get('page', 0), params.get('page_size', 100),
+               params.get('pages', 1), params.get('width', 10))
+        body = self.server.pages.get(key)
+        if body is None:
+            body = self.server.pages[key] = json.dumps(make_page(*key)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+class FakeSource():
+    """ Serves the fake API on a free local port for the duration of a `with` block. """
+    def __init__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.pages = {}
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server.server_address)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,195 @@
+"""
+Benchmark scenarios, each run in a fresh interpreter by `python -m benchmarks`
+so that peak RSS and import time are measured in isolation:
+
+    python -m benchmarks.scenarios <name>
+
+prints a JSON object of the scenario's measurements.
+"""
+import io
+import os
+import sys
+import json
+import time
+import contextlib
+import subprocess
+import http.client
+from urllib.parse import urlencode, urlparse
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+CONFIG = {'start_date': '2018-01-01T00:00:00Z'}
+
+class FakeSourceClient():
+    """ Keeps a single keep-alive connection to the fake source. """
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.connection = http.client.HTTPConnection(parsed.hostname, parsed.port)
+
+    def get_page(self, obj, **params):
+        self.connection.request('GET', '/{}?{}'.format(obj, urlencode(params)))
+        return json.loads(self.connection.getresponse().read())
+
+def make_tap(**kwargs):
+    from burler.taps import Tap
+    tap = Tap(config_spec=['start_date'], **kwargs)
+    Tap._Tap__tap = tap # pylint: disable=protected-access
+    return tap
+
+def make_streams(count, width, pages=1, page_size=100):
+    """ Registers `count` synthetic INCREMENTAL streams that page through the fake source. """
+    from burler.streams import Stream
+    properties = {'id': {'type': 'integer'},
+                  'updated_at': {'type': 'string', 'format': 'date-time'}}
+    for i in range(width):
+        properties['field_{}'.format(i)] = {'type': ['null', 'string']}
+    schema = {'type': 'object', 'properties': properties}
+
+    def load_schema(self):
+        return schema
+
+    def sync(self, state):
+        page = 0
+        while page is not None:
+            response = self.client.get_page(self.object_name, page=page, pages=pages,
+                                            page_size=page_size, width=width)
+            yield from response['records']
+            page = response['next_page']
+
+    for i in range(count):
+        name = 'Object{}'.format(i)
+        type(name, (Stream,), {'object_name': name,
+                               'replication_method': 'INCREMENTAL',
+                               'replication_key': 'updated_at',
+                               'key_properties': ['id'],
+                               'load_schema': load_schema,
+                               'sync': sync})
+
+def discover(tap):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        tap.do_discover(CONFIG)
+    return json.loads(output.getvalue())
+
+def select_all(catalog):
+    for catalog_entry in catalog['streams']:
+        for mdata in catalog_entry['metadata']:
+            if not mdata['breadcrumb']:
+                mdata['metadata']['selected'] = True
+    return catalog
+
+def run_sync(width, pages, page_size, **tap_kwargs):
+    from singer.catalog import Catalog
+    from benchmarks.fake_source import FakeSource
+    with FakeSource() as source:
+        tap = make_tap(**tap_kwargs)
+        tap.create_client(lambda config: FakeSourceClient(source.url))
+        make_streams(1, width, pages=pages, page_size=page_size)
+        catalog = Catalog.from_dict(select_all(discover(tap)))
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            tap.do_sync(CONFIG, catalog, {})
+            elapsed = time.perf_counter() - start
+    rows = pages * page_size
+    return {'rows': rows, 'seconds': elapsed, 'rows_per_second': rows / elapsed}
+
+def run_sync_instrumented(width, pages, page_size):
+    """ run_sync with a sample of records timed through each stage, to track the overhead. """
+    from burler.instrumentation import Instrumentation
+    return run_sync(width, pages, page_size, instrumentation=Instrumentation(sample_every=100, sinks=[]))
+
+def run_discover(count, width):
+    tap = make_tap()
+    tap.create_client(lambda config: None)
+    make_streams(count, width)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        tap.do_discover(CONFIG)
+        elapsed = time.perf_counter() - start
+    return {'streams': count, 'seconds': elapsed, 'streams_per_second': count / elapsed}
+
+def write_catalog(path, count, width, selected):
+    """ Writes a catalog of `count` streams one stream at a time, so it's never all in memory. """
+    properties = {'id': {'type': 'integer'},
+                  'updated_at': {'type': 'string', 'format': 'date-time'}}
+    for i in range(width):
+        properties['field_{}'.format(i)] = {'type': ['null', 'string']}
+    field_metadata = [{'breadcrumb': ['properties', name], 'metadata': {'inclusion': 'available'}}
+                      for name in properties]
+    with open(path, 'w') as f:
+        f.write('{"streams": [')
+        for i in range(count):
+            name = 'object{}'.format(i)
+            mdata = [{'breadcrumb': [], 'metadata': {'selected': name in selected,
+                                                     'table-key-properties': ['id']}}]
+            f.write((', ' if i else '') + json.dumps({'tap_stream_id': name,
+                                                      'stream': name,
+                                                      'schema': {'type': 'object', 'properties': properties},
+                                                      'metadata': mdata + field_metadata}))
+        f.write(']}')
+
+def run_sync_huge_catalog(count, width):
+    """ Syncs one stream of a `count` stream catalog file, timing from loading the catalog. """
+    import tempfile
+    from burler.catalog import LazyCatalog
+    from benchmarks.fake_source import FakeSource
+    with FakeSource() as source, tempfile.TemporaryDirectory() as directory:
+        tap = make_tap()
+        tap.create_client(lambda config: FakeSourceClient(source.url))
+        make_streams(count, width, pages=1, page_size=10)
+        path = os.path.join(directory, 'catalog.json')
+        write_catalog(path, count, width, selected={'object{}'.format(count - 1)})
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            tap.do_sync(CONFIG, LazyCatalog.load(path), {})
+            elapsed = time.perf_counter() - start
+    return {'streams': count, 'seconds': elapsed}
+
+def run_import():
+    start = time.perf_counter()
+    import burler # pylint: disable=unused-import
+    return {'import_seconds': time.perf_counter() - start}
+
+def run_startup():
+    """
+    Imports `burler.entry_point` in a fresh interpreter with `-X importtime`,
+    reporting the total import time and the part spent in burler's own modules.
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'from burler import entry_point'],
+                            stderr=subprocess.PIPE, check=True, universal_newlines=True).stderr
+    total_us = burler_us = 0
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not name[1:].startswith(' '): # Top level, its cumulative time covers everything below it
+            total_us += int(cumulative_us)
+        if name.strip().split('.')[0] == 'burler':
+            burler_us += int(self_us)
+    return {'startup_seconds': total_us / 1e6, 'burler_startup_seconds': burler_us / 1e6}
+
+SCENARIOS = {
+    'import': run_import,
+    'startup': run_startup,
+    'sync_narrow': lambda: run_sync(width=5, pages=40, page_size=500),
+    'sync_wide': lambda: run_sync(width=200, pages=10, page_size=200),
+    'sync_instrumented': lambda: run_sync_instrumented(width=5, pages=40, page_size=500),
+    'discover_small_catalog': lambda: run_discover(count=50, width=20),
+    'discover_huge_catalog': lambda: run_discover(count=2000, width=20),
+    'sync_huge_catalog': lambda: run_sync_huge_catalog(count=5000, width=50),
+}
+
+def main(name):
+    result = SCENARIOS[name]()
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['peak_rss_kb'] = max_rss // 1024 if sys.platform == 'darwin' else max_rss
+    print(json.dumps(result))
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -1,8 +1,9 @@
 from burler.taps import Tap
 from burler.streams import Stream
 from burler.exceptions import TapNotDefinedException, TapRedefinedException
+from burler.catalog import LazyCatalog, diff_catalogs
+from burler.registry import resolve_tap, installed_taps, ENTRY_POINT_GROUP
 
-import re
 import os
 import sys
 import json
@@ -10,13 +11,10 @@ import click
 import singer
 import singer.utils
 import singer.logger as logging
-from singer.catalog import Catalog
 from singer.utils import load_json
 
 LOGGER = logging.get_logger()
 
-TAP_ROOT = None
-
 def get_tap():
     # Accessing namespaced private member outside of class, must be prefixed with class name
     return Tap._Tap__tap
@@ -30,17 +28,6 @@ def tap(**kwargs):
 
     return get_tap()
 
-def check_for_tap_in_module(module):
-    # Find the tap object definition for this (it should be created since we imported it
-    # TODO: This is very naive, we should scoop down the submodules if possible
-    objects = dir(module)
-
-    for object_name in objects:
-        tap_obj = getattr(module, object_name, None)
-        if type(tap_obj) == Tap:
-            return tap_obj
-    return None
-
 @click.group()
 def cli():
     pass
@@ -53,46 +40,63 @@ def cli():
 @click.option('--discover', '-d', is_flag=True, help='Run discovery mode.')
 @click.option('--state', help='(Optional) State file to inform sync mode.')
 @click.option('--catalog', help='(Optional) Catalog to specify streams and metadata for sync mode.')
-def verify_tap():
-    # TODO: Feature (TEST): `singer test <tap_name> <configs>` Run discovery and sync stuff, validate and look for weird things with the output! To help ensure the best practices are being upheld. Possible scoring of tap's best practices?
-    # This could just check for singer best practices as we have them defined, things like memory consumption, etc.
-    # It should just wrap main with this kind of validation so we can generate a report at the end of it all in the Logging
-    # How does it make sense to call this?
-    #    Like singer run tap-foo --verify-best-practices --discover --config /tmp/discover_config.json, etc?
-    # or Like singer verify tap-foo --discover --config /tmp/tap_config.json, ?
-    LOGGER.info("(NotImplemented) No tests to run yet!")
+@click.option('--report', help='(Optional) File to write the JSON report to. Otherwise, it is logged.')
+@click.option('--baseline', help='(Optional) A previous JSON report. Fails if any stream\'s throughput regressed.')
+@click.option('--max-regression', default=0.1, show_default=True, help='Fraction of records/sec a stream may lose against the baseline.')
+@click.option('--trace-memory', is_flag=True, help='Report the top allocators with tracemalloc (slows the run).')
+def verify_tap(tap_name, config, discover, state, catalog, report, baseline, max_regression, trace_memory):
+    # TODO: Feature (TEST): Validate and look for weird things with the output! To help ensure the best practices are being upheld. Possible scoring of tap's best practices?
+    # Imported here so that `singer run` and entry points don't pay for it at startup
+    from burler.verify import VerifyReport, compare_to_baseline
+    verify_report = VerifyReport(trace_memory=trace_memory)
+    verify_report.start()
+    try:
+        execute_tap(tap_name, config, discover, state, catalog, before_run=verify_report.instrument)
+    finally:
+        verify_report.finish()
+        report_json = verify_report.to_dict()
+        LOGGER.info("Verification summary:\n%s", verify_report.summary())
+        if report is not None:
+            with open(report, 'w') as f:
+                json.dump(report_json, f, indent=2)
+        else:
+            LOGGER.info("Verification report: %s", json.dumps(report_json))
+
+    if baseline is not None:
+        regressions = compare_to_baseline(report_json, load_json(baseline), max_regression)
+        for regression in regressions:
+            LOGGER.critical("Throughput regression - %s", regression)
+        if regressions:
+            sys.exit(1)
 
 @singer.utils.handle_top_exception(LOGGER)
-def execute_tap(tap_name, config, discover, state, catalog):
+def execute_tap(tap_name, config, discover, state, catalog, before_run=None, diff=None):
     try:
-        module_name = re.sub('-', '_', tap_name)
-        module = __import__(module_name)
+        current_tap = resolve_tap(tap_name)
     except ImportError as ex:
-        if module_name in ex.msg:
+        module_name = tap_name.partition(':')[0].replace('-', '_')
+        if ex.name == module_name:
             # Log and exit instead of raise since this is the result of an Exception
-            LOGGER.critical("Could not import tap module '%s', please ensure that:\n- The root tap module follows underscore naming conventions\n- The tap is installed in this environment.\n\nExample (tap-foo):\n\t/\n\t/tap_foo/__init__.py\n\t/setup.py", module_name)
+            LOGGER.critical("Could not import tap module '%s', please ensure that:\n- The tap is registered in the '%s' entry point group, or\n- The root tap module follows underscore naming conventions\n- The tap is installed in this environment.\n\nExample (tap-foo):\n\t/\n\t/tap_foo/__init__.py\n\t/setup.py", module_name, ENTRY_POINT_GROUP)
             sys.exit(1)
         else:
             raise
 
-    tap_def = check_for_tap_in_module(module)
-    if tap_def is None:
-        raise TapNotDefinedException("Could not find an instance of Tap in module '{}'. Please ensure that it is defined at the top level module of the tap. (__init__.py or {}.py)".format(module_name, module_name))
-
-    current_tap = get_tap()
-    if tap_def is not current_tap:
-        raise TapRedefinedException("Found tap definition for module {}, but it is out of sync with Burler's tap object. Please ensure that it is not being redefined.".format(module_name))
-
-    TAP_ROOT = str.join(os.sep, module.__file__.split(os.sep)[:-1])
-    #os.chdir(TAP_ROOT)
-
     config_json = None
     if config is not None:
         config_json = load_json(config)
 
+    if before_run is not None:
+        before_run(current_tap)
+
     # Otherwise... lets get started!
     if discover:
-        current_tap.do_discover(config_json)
+        # With a catalog, discovery is incremental (see Tap.do_discover)
+        previous_catalog = load_json(catalog) if catalog is not None else None
+        discovered = current_tap.do_discover(config_json, previous_catalog)
+        if previous_catalog is not None and diff is not None:
+            with open(diff, 'w') as f:
+                json.dump(diff_catalogs(previous_catalog, discovered), f)
     else:
         if state is not None:
             state = load_json(state)
@@ -100,7 +104,8 @@ def execute_tap(tap_name, config, discover, state, catalog):
             state = {}
 
         if catalog is not None:
-            catalog = Catalog.load(catalog)
+            # Only the selected streams are parsed, with their schemas' references resolved
+            catalog = LazyCatalog.load(catalog)
 
         current_tap.do_sync(config_json, catalog, state)
 
@@ -108,17 +113,26 @@ def execute_tap(tap_name, config, discover, state, catalog):
 @click.option('--config', help='The config file for the tap.')
 @click.option('--discover', '-d', is_flag=True, help='Run discovery mode.')
 @click.option('--state', help='(Optional) State file to inform sync mode.')
-@click.option('--catalog', help='(Optional) Catalog to specify streams and metadata for sync mode.')
-def entry_point(config, discover, state, catalog):
-    execute_tap(sys.argv[0].split(os.sep)[-1], config, discover, state, catalog)
+@click.option('--catalog', help='(Optional) Catalog to specify streams and metadata for sync mode, or the previous catalog for discovery mode.')
+@click.option('--diff', help='(Optional) With --discover and --catalog, file to write the changes from the previous catalog to.')
+def entry_point(config, discover, state, catalog, diff):
+    execute_tap(sys.argv[0].split(os.sep)[-1], config, discover, state, catalog, diff=diff)
+
+@cli.command(name='list',
+             help="Lists the taps registered in the '{}' entry point group, without importing them.".format(ENTRY_POINT_GROUP),
+             short_help="Lists installed taps")
+def list_taps():
+    for name, entry_point in sorted(installed_taps().items()):
+        click.echo("{}\t{}".format(name, entry_point.value))
 
 @cli.command(name='run',
-             help="Runs the specified singer tap with provided options, state, catalog, and configuration.",
+             help="Runs the specified singer tap (an installed tap's name, or a module:attribute spec) with provided options, state, catalog, and configuration.",
              short_help="Runs the tap with the provided CLI options")
 @click.argument('tap_name')
 @click.option('--config', help='The config file for the tap.')
 @click.option('--discover', '-d', is_flag=True, help='Run discovery mode.')
 @click.option('--state', help='(Optional) State file to inform sync mode.')
-@click.option('--catalog', help='(Optional) Catalog to specify streams and metadata for sync mode.')
-def tap_main(tap_name, config, discover, state, catalog):
-    execute_tap(tap_name, config, discover, state, catalog)
+@click.option('--catalog', help='(Optional) Catalog to specify streams and metadata for sync mode, or the previous catalog for discovery mode.')
+@click.option('--diff', help='(Optional) With --discover and --catalog, file to write the changes from the previous catalog to.')
+def tap_main(tap_name, config, discover, state, catalog, diff):
+    execute_tap(tap_name, config, discover, state, catalog, diff=diff)
@@ -0,0 +1,74 @@
+"""
+Support for streams whose `sync` is an async generator:
+
+    class Tickets(Stream):
+        max_in_flight = 8
+
+        async def sync(self, state):
+            async for page in self.pipeline(self.client.get_page, range(1, 100)):
+                for record in page:
+                    yield record
+
+Each async stream is run on its own event loop, which lets a stream keep
+several requests in flight while still emitting records in order.
+"""
+import asyncio
+import inspect
+from collections import deque
+
+DEFAULT_MAX_IN_FLIGHT = 4
+
+def is_async_stream(instance):
+    return inspect.isasyncgenfunction(getattr(instance, 'sync', None))
+
+async def pipeline(func, items, limit=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Calls the coroutine function `func` on each of `items`, keeping at most
+    `limit` calls in flight, and yields the results in the order of `items`.
+    """
+    pending = deque()
+    items = iter(items)
+    try:
+        for item in items:
+            pending.append(asyncio.ensure_future(func(item)))
+            if len(pending) >= limit:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # The consumer stopped early (or failed), don't leave requests running
+        for task in pending:
+            task.cancel()
+
+async def _close_client(client):
+    close = getattr(client, 'aclose', None) or getattr(client, 'close', None)
+    if callable(close):
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+
+def run_stream(instance, state, handle_record, client_constructor=None):
+    """
+    Runs an async stream's `sync(state)` to completion on a new event loop,
+    passing each record to `handle_record`.
+
+    If an async client is configured, one is created on this loop for the
+    stream (async clients are generally bound to the loop they're created on),
+    and closed when the stream finishes.
+    """
+    async def consume():
+        instance.in_flight = asyncio.Semaphore(getattr(instance, 'max_in_flight', DEFAULT_MAX_IN_FLIGHT))
+        client = None
+        if client_constructor is not None:
+            client = client_constructor()
+            if inspect.isawaitable(client):
+                client = await client
+            instance.client = client
+        try:
+            async for record in instance.sync(state):
+                handle_record(record)
+        finally:
+            if client is not None:
+                await _close_client(client)
+
+    asyncio.run(consume())
@@ -1,9 +1,69 @@
 ## Bookmark strategies - its own module
-# TODO: Not sure the best way to implement these, they should probably configure into the do_sync method, wherever that lives...
+# A stream declares one with `bookmark_strategy = every_n(1000)` (defaults to end_of_sync).
+#
+# With end_of_sync, the state is written once when an INCREMENTAL stream completes, and the
+# bookmark is whatever the stream wrote into the state. Any other strategy is a function that
+# is given the stream's `Progress` after each record, and returns True when it's time to write
+# a checkpoint. Burler then sets the bookmark to the greatest replication key value emitted so
+# far, and writes the state. This also happens when the stream completes.
+import time
+
+import singer.utils
+
 end_of_sync = "END_OF_SYNC"
 
+class Progress():
+    """ What a stream has emitted since its last checkpoint. """
+    __slots__ = ('records', 'bytes', 'last_checkpoint', 'state_bytes')
+
+    def __init__(self):
+        self.state_bytes = 0
+        self.reset()
+
+    def reset(self):
+        self.records = 0
+        self.bytes = 0
+        self.last_checkpoint = time.monotonic()
+
 def every_n(record_count):
-    def emit_bookmark():
-        # check count of records emitted, if time to emit, write a bookmark with state
-        pass
+    """ Checkpoints after every `record_count` records. """
+    def emit_bookmark(progress):
+        return progress.records >= record_count
     return emit_bookmark
+
+def every_seconds(seconds):
+    """ Checkpoints on the first record emitted at least `seconds` after the last checkpoint. """
+    def emit_bookmark(progress):
+        return time.monotonic() - progress.last_checkpoint >= seconds
+    return emit_bookmark
+
+def adaptive(state_ratio=0.01, max_seconds=None):
+    """
+    Checkpoints based on bytes emitted, so that STATE messages are at most
+    `state_ratio` of the bytes written for the stream. Small state and wide
+    records checkpoint often, large state and narrow records less so.
+    Optionally, also checkpoints at least every `max_seconds`.
+    """
+    def emit_bookmark(progress):
+        if progress.bytes * state_ratio >= progress.state_bytes:
+            return True
+        return max_seconds is not None and time.monotonic() - progress.last_checkpoint >= max_seconds
+    return emit_bookmark
+
+def bookmark_is_after(value, current):
+    """
+    Whether `value` would advance the bookmark `current`. Date-time strings
+    are compared as datetimes, since they may not share a format (e.g., a
+    start_date vs. a transformed record value).
+    """
+    if current is None:
+        return True
+    if isinstance(value, str) and isinstance(current, str):
+        try:
+            return singer.utils.strptime_to_utc(value) > singer.utils.strptime_to_utc(current)
+        except (ValueError, OverflowError):
+            pass
+    try:
+        return value > current
+    except TypeError:
+        return True
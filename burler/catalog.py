@@ -0,0 +1,300 @@
+"""
+A catalog that reads a catalog file's streams as they're needed, for taps
+with thousands of streams (e.g., a table per stream in a data warehouse).
+
+    catalog = LazyCatalog.load('catalog.json')
+    for catalog_entry in catalog.selected_streams():
+        ...
+
+Loading the file memory-maps it and indexes its streams by tap_stream_id,
+keeping each stream's schema and metadata as their positions in the file. Of
+the metadata, only the root breadcrumb's is decoded, to find whether the stream
+is selected. A stream's schema and metadata are parsed (and its references
+resolved) when the stream is asked for, so streams that aren't selected never
+become singer Schema objects, and the file's contents are never held in memory
+as a whole.
+
+LazyCatalog is a singer Catalog, so `streams`, `get_stream` and `to_dict`
+work as usual, though `streams` parses every stream.
+"""
+import re
+import json
+import mmap
+
+from singer.catalog import Catalog
+
+from burler.schema_refs import resolve_refs
+
+_STRING_PATTERN = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+
+def _content_pattern(depth):
+    """ Matches a character or string, or an object or array with up to `depth` levels of nesting. """
+    pattern = rb'[^"\[\]{}]|' + _STRING_PATTERN
+    for _ in range(depth):
+        pattern = rb'[^"\[\]{}]|' + _STRING_PATTERN + rb'|\{(?:' + pattern + rb')*\}|\[(?:' + pattern + rb')*\]'
+    return pattern
+
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_STRING = re.compile(_STRING_PATTERN, re.DOTALL)
+_SCALAR = re.compile(rb'-?[0-9][0-9.eE+-]*|true|false|null')
+# An object or array that isn't too deeply nested, e.g., most of a schema or metadata, is matched
+# whole. Otherwise, the brackets outside of strings are counted to find its end, taking the
+# shallower objects and arrays within it whole.
+_CONTAINER = re.compile(_content_pattern(4), re.DOTALL)
+_TO_BRACKET = re.compile(rb'(?:' + _content_pattern(3) + rb')*([\[\]{}])', re.DOTALL)
+# Singer writes each metadata entry's breadcrumb first, so the root's can be found without walking the list
+_ROOT_METADATA = re.compile(rb'\{\s*"breadcrumb"\s*:\s*\[\s*\]\s*,\s*"metadata"\s*:\s*')
+
+def _error(message, buffer, idx):
+    return json.JSONDecodeError(message, bytes(buffer[max(idx - 20, 0):idx + 20]).decode('utf-8', 'replace'), idx)
+
+def _skip_whitespace(buffer, idx):
+    return _WHITESPACE.match(buffer, idx).end()
+
+def _expect(buffer, idx, char):
+    idx = _skip_whitespace(buffer, idx)
+    if buffer[idx:idx + 1] != char:
+        raise _error("Expecting '{}'".format(char.decode()), buffer, idx)
+    return _skip_whitespace(buffer, idx + 1)
+
+def _skip_value(buffer, idx):
+    """ The end of the JSON value starting at `idx`, found without decoding it. """
+    char = buffer[idx:idx + 1]
+    if char == b'"':
+        match = _STRING.match(buffer, idx)
+    elif char in (b'{', b'['):
+        match = _CONTAINER.match(buffer, idx)
+        if match is not None:
+            return match.end()
+        depth = 0
+        while True:
+            match = _TO_BRACKET.match(buffer, idx)
+            if match is None:
+                break
+            idx = match.end()
+            if match.group(1) in (b'{', b'['):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return idx
+    else:
+        match = _SCALAR.match(buffer, idx)
+    if match is None:
+        raise _error("Expecting value", buffer, idx)
+    return match.end()
+
+class _Reader():
+    """
+    Walks the members of a JSON object (or the items of an array) at `idx` in
+    a bytes-like buffer, leaving each value for the caller to decode, skip, or
+    walk into.
+    """
+    def __init__(self, buffer, idx, is_object=True):
+        self.buffer = buffer
+        self.close = b'}' if is_object else b']'
+        self.is_object = is_object
+        self.idx = _expect(buffer, idx, b'{' if is_object else b'[')
+        self.first = True
+
+    def next(self):
+        """
+        Moves to the next value, returning its key (or True, in an array), or
+        None after the last one.
+        """
+        buffer = self.buffer
+        idx = _skip_whitespace(buffer, self.idx)
+        if buffer[idx:idx + 1] == self.close:
+            self.idx = idx + 1
+            return None
+        if not self.first:
+            idx = _expect(buffer, idx, b',')
+        self.first = False
+        if not self.is_object:
+            self.idx = idx
+            return True
+        match = _STRING.match(buffer, idx)
+        if match is None:
+            raise _error("Expecting property name enclosed in double quotes", buffer, idx)
+        key = json.loads(match.group())
+        self.idx = _expect(buffer, match.end(), b':')
+        return key
+
+    def skip_value(self):
+        """ Returns the (start, end) of the value in the buffer, to be decoded later. """
+        start = self.idx
+        self.idx = _skip_value(self.buffer, start)
+        return start, self.idx
+
+    def read_value(self):
+        start, end = self.skip_value()
+        return json.loads(self.buffer[start:end])
+
+def _read_is_selected(reader):
+    """ Skips a metadata list, decoding only the root breadcrumb's metadata to find `selected`. """
+    buffer, start = reader.buffer, reader.idx
+    end = reader.idx = _skip_value(buffer, start)
+    match = _ROOT_METADATA.search(buffer, start, end)
+    if match is not None:
+        root = json.loads(buffer[match.end():_skip_value(buffer, match.end())])
+        return bool((root or {}).get('selected'))
+
+    # Otherwise, each entry's keys are walked until the root's is found
+    items = _Reader(buffer, start, is_object=False)
+    while items.next():
+        item = _Reader(buffer, items.idx)
+        breadcrumb, metadata_span = None, None
+        while True:
+            key = item.next()
+            if key is None:
+                break
+            if key == 'breadcrumb':
+                breadcrumb = item.read_value()
+            elif key == 'metadata':
+                metadata_span = item.skip_value()
+            else:
+                item.skip_value()
+        items.idx = item.idx
+        if not breadcrumb and metadata_span is not None:
+            return bool((json.loads(buffer[metadata_span[0]:metadata_span[1]]) or {}).get('selected'))
+    return False
+
+class LazyCatalog(Catalog):
+    def __init__(self, buffer, base_uri=None): # pylint: disable=super-init-not-called
+        """ `buffer` is the catalog's JSON, as text, bytes, or a memory map (see `load`). """
+        self._buffer = buffer.encode('utf-8') if isinstance(buffer, str) else buffer
+        self._base_uri = base_uri
+        # tap_stream_id -> (stream fields other than schema and metadata, schema span, metadata span, selected)
+        self._index = {}
+        self._entries = {}
+        self._index_streams()
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as f:
+            # The map stays open after the file is closed, and pages are read as they're needed
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), base_uri=filename)
+
+    def _index_streams(self):
+        catalog = _Reader(self._buffer, _skip_whitespace(self._buffer, 0))
+        while True:
+            key = catalog.next()
+            if key is None:
+                break
+            if key != 'streams':
+                catalog.skip_value()
+                continue
+            streams = _Reader(self._buffer, catalog.idx, is_object=False)
+            while streams.next():
+                stream = _Reader(self._buffer, streams.idx)
+                fields, schema_span, metadata_span, selected = {}, None, None, False
+                while True:
+                    key = stream.next()
+                    if key is None:
+                        break
+                    if key == 'schema':
+                        schema_span = stream.skip_value()
+                    elif key == 'metadata':
+                        start = stream.idx
+                        selected = _read_is_selected(stream)
+                        metadata_span = (start, stream.idx)
+                    else:
+                        fields[key] = stream.read_value()
+                streams.idx = stream.idx
+                self._index[fields.get('tap_stream_id')] = (fields, schema_span, metadata_span, selected)
+            catalog.idx = streams.idx
+
+    def _decode(self, span):
+        return json.loads(self._buffer[span[0]:span[1]]) if span else None
+
+    def _entry(self, tap_stream_id):
+        entry = self._entries.get(tap_stream_id)
+        if entry is None:
+            fields, schema_span, metadata_span, _ = self._index[tap_stream_id]
+            stream = dict(fields,
+                          schema=resolve_refs(self._decode(schema_span) or {}, base_uri=self._base_uri),
+                          metadata=self._decode(metadata_span))
+            entry = self._entries[tap_stream_id] = Catalog.from_dict({'streams': [stream]}).streams[0]
+        return entry
+
+    @property
+    def tap_stream_ids(self):
+        return list(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def streams(self):
+        return [self._entry(tap_stream_id) for tap_stream_id in self._index]
+
+    def get_stream(self, tap_stream_id):
+        if tap_stream_id not in self._index:
+            return None
+        return self._entry(tap_stream_id)
+
+    def is_selected(self, tap_stream_id):
+        """ Whether the stream's metadata marks it selected, without parsing its schema. """
+        return self._index[tap_stream_id][3]
+
+    def selected_streams(self):
+        """ Yields the CatalogEntry of each selected stream, in catalog order. """
+        for tap_stream_id in self._index:
+            if self.is_selected(tap_stream_id):
+                yield self._entry(tap_stream_id)
+
+## Incremental discovery
+# Streams can provide a `fingerprint()` of their source object (e.g., a version or etag). It's
+# stored in the stream's root metadata, and when discovery is given the previous catalog, a stream
+# whose fingerprint hasn't changed keeps its previous catalog entry instead of loading its schema.
+FINGERPRINT_KEY = 'burler.fingerprint'
+
+def _root_metadata(catalog_entry):
+    for mdata in catalog_entry.get('metadata') or []:
+        if not mdata.get('breadcrumb'):
+            return mdata.get('metadata', {})
+    return {}
+
+def get_fingerprint(catalog_entry):
+    return _root_metadata(catalog_entry).get(FINGERPRINT_KEY)
+
+def carry_over_selections(previous_entry, catalog_entry):
+    """ Keeps the `selected` values of the previous entry's breadcrumbs that still exist. """
+    selections = {tuple(mdata['breadcrumb']): mdata['metadata']['selected']
+                  for mdata in previous_entry.get('metadata') or []
+                  if 'selected' in mdata.get('metadata', {})}
+    for mdata in catalog_entry.get('metadata') or []:
+        breadcrumb = tuple(mdata['breadcrumb'])
+        if breadcrumb in selections:
+            mdata['metadata']['selected'] = selections[breadcrumb]
+    return catalog_entry
+
+def diff_catalogs(previous, catalog):
+    """
+    A compact description of how `catalog` differs from `previous`, by
+    tap_stream_id and top-level property:
+
+        {'added': ['invoices'], 'removed': [], 'unchanged': 41,
+         'changed': {'contacts': {'added': ['email'], 'removed': [], 'changed': ['phone']}}}
+    """
+    previous_streams = {entry['tap_stream_id']: entry for entry in previous.get('streams', [])}
+    streams = {entry['tap_stream_id']: entry for entry in catalog.get('streams', [])}
+    diff = {'added': [tap_stream_id for tap_stream_id in streams if tap_stream_id not in previous_streams],
+            'removed': [tap_stream_id for tap_stream_id in previous_streams if tap_stream_id not in streams],
+            'changed': {},
+            'unchanged': 0}
+    for tap_stream_id, entry in streams.items():
+        previous_entry = previous_streams.get(tap_stream_id)
+        if previous_entry is None:
+            continue
+        if previous_entry.get('schema') == entry.get('schema'):
+            diff['unchanged'] += 1
+            continue
+        previous_properties = previous_entry.get('schema', {}).get('properties', {})
+        properties = entry.get('schema', {}).get('properties', {})
+        diff['changed'][tap_stream_id] = {
+            'added': [name for name in properties if name not in previous_properties],
+            'removed': [name for name in previous_properties if name not in properties],
+            'changed': [name for name in properties
+                        if name in previous_properties and properties[name] != previous_properties[name]]}
+    return diff
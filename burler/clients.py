@@ -0,0 +1,162 @@
+"""
+A pool of API clients, for taps that sync streams, windows or sub-streams
+concurrently and whose client can't be shared between threads (or would be a
+bottleneck if it were):
+
+    @tap.create_client(pool_size=8, close=lambda client: client.session.close())
+    def create_client(config):
+        return FooClient(config['api_key'])
+
+Clients are created as needed, up to `pool_size`, and reused, so their
+keep-alive connections are too. Each stream, window and sub-stream sync checks
+out a client for its duration (see `ClientPool.lease`), and `tap.client`
+returns the client leased to the current thread. Outside of a lease, a thread
+is given a client of its own, which its next lease adopts and checks back in.
+
+A task waits for a client when they're all checked out, so the pool should be
+at least the number of tasks that run at once, e.g., `max_concurrent_streams`
+times one more than `max_concurrent_children`. A stream keeps its client while
+its windows and sub-streams check out theirs, so a smaller pool can leave every
+task waiting on another's client. Rather than hang, a checkout gives up with
+ClientPoolTimeout after `checkout_timeout` seconds (DEFAULT_CHECKOUT_TIMEOUT).
+The time spent waiting is reported as a metric when the pool is closed.
+"""
+import time
+import threading
+import contextlib
+from collections import deque
+
+import singer.logger as logging
+from singer import metrics
+
+from burler.exceptions import ClientPoolTimeout
+
+LOGGER = logging.get_logger()
+
+DEFAULT_CHECKOUT_TIMEOUT = 60.0 # seconds
+
+def close_client(client):
+    """ The default cleanup, which closes clients that have a `close` method. """
+    close = getattr(client, 'close', None)
+    if callable(close):
+        close()
+
+class ClientPool():
+    def __init__(self, factory, size, close=close_client, checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT):
+        if size < 1:
+            raise ValueError("Client pool size must be at least 1, got {}".format(size))
+        self.factory = factory
+        self.size = size
+        self.close_client = close or close_client
+        self.checkout_timeout = checkout_timeout
+        self._condition = threading.Condition()
+        self._local = threading.local()
+        self._reset()
+
+    def _reset(self):
+        self._idle = deque()
+        self._clients = []
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def checkout(self):
+        """ Takes an idle client, creates one if there's room, or waits for one to be checked in. """
+        started = time.monotonic()
+        with self._condition:
+            while not self._idle and len(self._clients) >= self.size:
+                remaining = None
+                if self.checkout_timeout is not None:
+                    remaining = self.checkout_timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise ClientPoolTimeout(
+                            "Waited {}s for one of {} clients, which are all checked out. The pool "
+                            "may be exhausted: a stream keeps its client while its windows and "
+                            "sub-streams check out theirs. Increase the pool size with "
+                            "@tap.create_client(pool_size=...) to at least the number of "
+                            "concurrent streams, windows and sub-streams.".format(
+                                self.checkout_timeout, self.size))
+                self._condition.wait(remaining)
+            if self._idle:
+                # The most recently used client, whose connections are likeliest to be alive
+                client = self._idle.pop()
+            else:
+                client = None
+                self._clients.append(client) # Reserves the slot while the client is created
+            waited = time.monotonic() - started
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        if client is None:
+            try:
+                client = self.factory()
+            except BaseException:
+                with self._condition:
+                    self._clients.remove(None)
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._clients[self._clients.index(None)] = client
+        return client
+
+    def checkin(self, client):
+        with self._condition:
+            self._idle.append(client)
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def lease(self):
+        """
+        Checks out a client for the current thread, which `current` returns
+        until the outermost lease exits and it's checked back in. A client the
+        thread was given by `current` beforehand is leased instead.
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0 and getattr(self._local, 'client', None) is None:
+            self._local.client = self.checkout()
+        self._local.depth = depth + 1
+        try:
+            yield self._local.client
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                client, self._local.client = self._local.client, None
+                self.checkin(client)
+
+    def current(self):
+        """ The client leased to the current thread, or one kept for it until its next lease exits. """
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.checkout()
+        return client
+
+    def stats(self):
+        with self._condition:
+            return {'size': self.size,
+                    'created': len(self._clients),
+                    'checkouts': self.checkouts,
+                    'wait_seconds': round(self.wait_seconds, 3),
+                    'max_wait_seconds': round(self.max_wait_seconds, 3)}
+
+    def close(self):
+        """
+        Closes every client the pool created and reports the time spent
+        waiting for them. Clients are created anew if it's used again.
+        """
+        stats = self.stats()
+        with self._condition:
+            clients = [client for client in self._clients if client is not None]
+            self._reset()
+        self._local = threading.local()
+
+        if stats['checkouts']:
+            metrics.log(LOGGER, metrics.Point('timer', 'client_checkout_wait', stats['wait_seconds'],
+                                              {'checkouts': stats['checkouts'],
+                                               'max_wait_seconds': stats['max_wait_seconds'],
+                                               'pool_size': stats['size']}))
+        for client in clients:
+            try:
+                self.close_client(client)
+            except Exception as ex: # pylint: disable=broad-except
+                LOGGER.warning("Error closing client: %s", ex)
@@ -0,0 +1,55 @@
+"""
+An on-disk cache of discovered catalogs, for taps whose discovery is slow
+(e.g., describing hundreds of objects through a source's API).
+
+Catalogs are keyed on a hash of the config, the tap's version, and the
+registered stream names, so changing any of them misses the cache. Entries
+older than the TTL are ignored.
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+import singer.logger as logging
+
+LOGGER = logging.get_logger()
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'burler-discovery')
+
+def cache_key(config, version, stream_names):
+    key = json.dumps({'config': config,
+                      'version': version,
+                      'streams': sorted(stream_names)}, sort_keys=True, default=str)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+class DiscoveryCache():
+    def __init__(self, ttl, directory=None):
+        self.ttl = ttl
+        self.directory = directory or DEFAULT_CACHE_DIR
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{}.json'.format(key))
+
+    def get(self, key):
+        """ Returns the cached catalog for `key`, or None if missing or expired. """
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, catalog):
+        # Written to a temp file and moved into place, so readers never see a partial catalog
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(catalog, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError as ex:
+            LOGGER.warning("Could not write discovery cache: %s", ex)
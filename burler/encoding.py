@@ -0,0 +1,83 @@
+"""
+Coerces records into JSON-native Python objects using a tap's `json_encoder`.
+
+This produces the same result as `json.loads(json.dumps(record, cls=encoder))`,
+but walks the record once without building a string. JSON-native values are
+passed through as-is, and the encoder's `default()` is only called for values
+that aren't. How to handle each type is worked out once and memoized.
+"""
+import json
+
+_SCALARS = frozenset([str, int, float, bool, type(None)])
+
+def _key_to_str(key):
+    # Matches how json.dumps converts the dict keys it allows
+    if isinstance(key, str):
+        return str(key)
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, int):
+        return int.__repr__(key)
+    if isinstance(key, float):
+        return float.__repr__(key)
+    raise TypeError("keys must be str, int, float, bool or None, not {}".format(type(key).__name__))
+
+class RecordCoercer():
+    """
+    Converts a record to JSON-native types, given a `json.JSONEncoder` subclass:
+
+        coerce = RecordCoercer(DecimalEncoder)
+        coerce({'amount': Decimal('1.5')}) # -> {'amount': '1.5'}
+    """
+    def __init__(self, encoder_cls=json.JSONEncoder):
+        self.encoder = encoder_cls()
+        self._handlers = {dict: self._coerce_dict,
+                          list: self._coerce_list,
+                          tuple: self._coerce_list}
+
+    def __call__(self, value):
+        return self.coerce(value)
+
+    def coerce(self, value):
+        value_type = type(value)
+        if value_type in _SCALARS:
+            return value
+        handler = self._handlers.get(value_type)
+        if handler is None:
+            handler = self._handlers[value_type] = self._find_handler(value_type)
+        return handler(value)
+
+    def _find_handler(self, value_type):
+        """ Subclasses of JSON-native types are encoded as their base type, anything else goes to default(). """
+        if issubclass(value_type, str):
+            return str
+        if issubclass(value_type, int):
+            return int
+        if issubclass(value_type, float):
+            return float
+        if issubclass(value_type, dict):
+            return self._coerce_dict
+        if issubclass(value_type, (list, tuple)):
+            return self._coerce_list
+        return self._coerce_default
+
+    def _coerce_default(self, value):
+        return self.coerce(self.encoder.default(value))
+
+    def _coerce_dict(self, value):
+        coerce = self.coerce
+        result = {}
+        for key, item in value.items():
+            if type(key) is not str:
+                key = _key_to_str(key)
+            item_type = type(item)
+            result[key] = item if item_type in _SCALARS else coerce(item)
+        return result
+
+    def _coerce_list(self, value):
+        coerce = self.coerce
+        return [item if type(item) in _SCALARS else coerce(item) for item in value]
@@ -24,6 +24,13 @@ class NoClientConfigured(BurlerException):
 class StreamsNotFound(BurlerException):
     pass
 
+class StreamSyncFailures(BurlerException):
+    """ Raised at the end of a sync in which streams failed, with each one's exception in `errors`. """
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("{} stream(s) failed to sync:\n{}".format(
+            len(errors), "\n".join("- {}: {!r}".format(name, ex) for name, ex in errors.items())))
+
 # schema_types.py
 class NoWSDLLocationSpecified(BurlerException):
     pass
@@ -31,3 +38,19 @@ class NoWSDLLocationSpecified(BurlerException):
 # streams.py
 class DuplicateStream(BurlerException):
     pass
+
+# schema_refs.py
+class SchemaReferenceError(BurlerException):
+    pass
+
+# xsd.py
+class XSDTranslationError(BurlerException):
+    pass
+
+# clients.py
+class ClientPoolTimeout(BurlerException):
+    pass
+
+# validation.py
+class OrderingViolation(BurlerException):
+    pass
@@ -0,0 +1,182 @@
+"""
+Infers a JSON Schema from sample records, for sources that can't describe
+their own schema (see `schema_types.generated`).
+
+    builder = SchemaBuilder()
+    for record in records:
+        builder.observe(record)
+    schema = builder.to_schema()
+
+A builder keeps the types seen at each path rather than the values, so its
+memory is bounded by the shape of the records, not how many were sampled.
+Builders can be merged, so records can be sampled in parallel and the partial
+results combined with `merge`.
+
+Types are widened as records are merged:
+
+- `integer` and `number` -> `number`
+- `string` and any of `boolean`, `integer` or `number` -> `string`
+- A path that was ever None is nullable (`["null", ...]`)
+- Strings are `"format": "date-time"` only if every one seen was a date-time
+- A path with only None values seen gets an empty schema, which accepts anything
+"""
+import re
+import copy
+import datetime
+import itertools
+from decimal import Decimal
+
+from burler import aio
+
+_DATE_TIME = re.compile(r'^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?$')
+
+_TYPE_ORDER = ('null', 'boolean', 'integer', 'number', 'string', 'object', 'array')
+
+def _is_date_time(value):
+    if not _DATE_TIME.match(value):
+        return False
+    try:
+        datetime.datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    except ValueError:
+        return False
+    return True
+
+class SchemaBuilder():
+    """ Accumulates the types seen at one path of the sampled records. """
+    __slots__ = ('types', 'date_time', 'properties', 'items', 'max_properties')
+
+    def __init__(self, max_properties=None):
+        self.types = set()
+        self.date_time = None # Unknown until a string is seen
+        self.properties = None
+        self.items = None
+        # Objects with unbounded keys (e.g., keyed by ID) would otherwise grow without limit
+        self.max_properties = max_properties
+
+    def observe(self, value):
+        if value is None:
+            self.types.add('null')
+        elif isinstance(value, bool):
+            self.types.add('boolean')
+        elif isinstance(value, int):
+            self.types.add('integer')
+        elif isinstance(value, (float, Decimal)):
+            self.types.add('number')
+        elif isinstance(value, str):
+            self.types.add('string')
+            if self.date_time is not False:
+                self.date_time = _is_date_time(value)
+        elif isinstance(value, dict):
+            self.types.add('object')
+            if self.properties is None:
+                self.properties = {}
+            properties = self.properties
+            for key, item in value.items():
+                builder = properties.get(key)
+                if builder is None:
+                    if self.max_properties is not None and len(properties) >= self.max_properties:
+                        continue
+                    builder = properties[key] = SchemaBuilder(self.max_properties)
+                builder.observe(item)
+        elif isinstance(value, (list, tuple)):
+            self.types.add('array')
+            if self.items is None:
+                self.items = SchemaBuilder(self.max_properties)
+            for item in value:
+                self.items.observe(item)
+        elif isinstance(value, (datetime.datetime, datetime.date)):
+            self.types.add('string')
+            if self.date_time is not False:
+                self.date_time = True
+        else:
+            self.types.add('string') # Anything else is written as a string by the json_encoder
+            self.date_time = False
+        return self
+
+    def merge(self, other):
+        """ Adds what `other` has seen to this builder, returning it. """
+        self.types |= other.types
+        if other.date_time is not None:
+            self.date_time = other.date_time if self.date_time is None else (self.date_time and other.date_time)
+        if other.properties is not None:
+            if self.properties is None:
+                self.properties = {}
+            for key, builder in other.properties.items():
+                if key in self.properties:
+                    self.properties[key].merge(builder)
+                elif self.max_properties is None or len(self.properties) < self.max_properties:
+                    self.properties[key] = copy.deepcopy(builder)
+        if other.items is not None:
+            if self.items is None:
+                self.items = SchemaBuilder(self.max_properties)
+            self.items.merge(other.items)
+        return self
+
+    def to_schema(self):
+        types = set(self.types)
+        if 'number' in types:
+            types.discard('integer')
+        if 'string' in types:
+            types -= {'boolean', 'integer', 'number'}
+        if not types - {'null'}:
+            return {}
+
+        schema = {'type': [t for t in _TYPE_ORDER if t in types]}
+        if len(schema['type']) == 1:
+            schema['type'] = schema['type'][0]
+        if 'string' in types and self.date_time:
+            schema['format'] = 'date-time'
+        if 'object' in types:
+            schema['properties'] = {key: builder.to_schema() for key, builder in (self.properties or {}).items()}
+        if 'array' in types:
+            schema['items'] = self.items.to_schema() if self.items is not None else {}
+        return schema
+
+def merge(builders):
+    """ Combines builders that sampled different records (e.g., in parallel) into one. """
+    result = SchemaBuilder()
+    for builder in builders:
+        if result.max_properties is None:
+            result.max_properties = builder.max_properties
+        result.merge(builder)
+    return result
+
+def infer_schema(records, sample_size=None, max_properties=None):
+    """ Infers the schema of an object from up to `sample_size` of `records`. """
+    builder = SchemaBuilder(max_properties)
+    for record in itertools.islice(records, sample_size):
+        builder.observe(record)
+    schema = builder.to_schema()
+    # Records are always objects, even if none were sampled
+    schema['type'] = 'object'
+    schema.setdefault('properties', {})
+    return schema
+
+class _SampleComplete(Exception):
+    pass
+
+def sample_records(instance, sample_size, state=None):
+    """ Runs a stream's `sync` until `sample_size` records have been emitted, returning them. """
+    state = copy.deepcopy(state) if state else {}
+    if not aio.is_async_stream(instance):
+        records = instance.sync(state)
+        try:
+            return list(itertools.islice(records, sample_size))
+        finally:
+            close = getattr(records, 'close', None)
+            if callable(close):
+                close()
+
+    from burler.taps import Tap
+    current_tap = Tap._Tap__tap # pylint: disable=protected-access
+    sampled = []
+    def handle_record(record):
+        sampled.append(record)
+        if len(sampled) >= sample_size:
+            raise _SampleComplete()
+    try:
+        aio.run_stream(instance, state, handle_record,
+                       client_constructor=getattr(current_tap, '_Tap__configured_async_client_constructor', None))
+    except _SampleComplete:
+        pass
+    return sampled
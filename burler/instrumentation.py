@@ -0,0 +1,229 @@
+"""
+Timers for the stages of a sync, to find where a stream's time goes:
+
+- `fetch`: Waiting on the stream for its next record (the source)
+- `transform`: Applying the schema and metadata to the record
+- `write`: Handing the record to the writer, of which `serialize` is the JSON encoding
+- `output`: Writing a batch of messages to stdout (not per-stream)
+
+    tap = burler.tap(instrumentation=Instrumentation(
+        sample_every=100,
+        sinks=[SingerMetricsSink(), PrometheusFileSink('/var/lib/node_exporter/tap_foo.prom')]))
+
+Every `sample_every`th record is timed (and the wait for the one after it),
+so the overhead on the rest is a counter. Timings are aggregated into
+histograms with power-of-two buckets, from a microsecond, and when the sync
+finishes the report is given to each sink: Singer METRIC log lines, a JSON
+file, or a Prometheus text file (e.g., for node_exporter's textfile collector).
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+
+import singer.logger as logging
+from singer import metrics
+
+LOGGER = logging.get_logger()
+
+BUCKET_COUNT = 32 # The last bucket is for anything over ~36 minutes
+
+class Histogram():
+    """ Durations, in buckets whose upper bounds double from 1 microsecond. """
+    __slots__ = ('buckets', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def upper_bound(index):
+        return (1 << index) / 1e6
+
+    def observe(self, seconds):
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        self.sum += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """ The upper bound of the bucket containing the `fraction` percentile. """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count,
+                'sum': self.sum,
+                'min': self.min,
+                'max': self.max,
+                'p50': self.percentile(0.5),
+                'p90': self.percentile(0.9),
+                'p99': self.percentile(0.99),
+                'buckets': {str(self.upper_bound(i)): c for i, c in enumerate(self.buckets) if c}}
+
+class StreamTimer():
+    """
+    Times a sample of one stream's records through the stages. Used from the
+    stream's thread only, except `observe`.
+    """
+    __slots__ = ('instrumentation', 'stream', 'every', 'records', '_last')
+
+    def __init__(self, instrumentation, stream):
+        self.instrumentation = instrumentation
+        self.stream = stream
+        self.every = instrumentation.sample_every
+        self.records = 0
+        self._last = None
+
+    def start_record(self):
+        """ Called as each record comes in, returns whether it's timed. """
+        records = self.records
+        self.records = records + 1
+        if self._last is not None:
+            # The previous record was timed, so this is how long the stream took to yield the next
+            self.instrumentation.observe(self.stream, 'fetch', time.perf_counter() - self._last)
+            self._last = None
+        if records % self.every:
+            return False
+        self.instrumentation.local.sampling = True
+        self._last = time.perf_counter()
+        return True
+
+    def lap(self, stage):
+        """ Records the time since the record came in, or the previous lap. """
+        now = time.perf_counter()
+        self.instrumentation.observe(self.stream, stage, now - self._last)
+        self._last = now
+
+    def end_record(self):
+        """ Called once a timed record is done, so the wait for the next one can be timed. """
+        self.instrumentation.local.sampling = False
+        self._last = time.perf_counter()
+
+class Instrumentation():
+    def __init__(self, sample_every=100, sinks=None):
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1, got {}".format(sample_every))
+        self.sample_every = sample_every
+        self.sinks = sinks if sinks is not None else [SingerMetricsSink()]
+        self.local = threading.local()
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def stream_timer(self, stream):
+        return StreamTimer(self, stream)
+
+    def sampling(self):
+        """ Whether the record being handled on this thread is being timed (e.g., for the writer). """
+        return getattr(self.local, 'sampling', False)
+
+    def observe(self, stream, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get((stream, stage))
+            if histogram is None:
+                histogram = self._histograms[(stream, stage)] = Histogram()
+            histogram.observe(seconds)
+
+    def report(self):
+        """
+        The histograms of each stream's stages. Only sampled records are timed,
+        so `estimated_seconds` scales their total by `sample_every` (`output`
+        is timed for every write).
+        """
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: (item[0][0] or '', item[0][1]))
+            stages = []
+            for (stream, stage), histogram in histograms:
+                entry = dict(histogram.to_dict(), stream=stream, stage=stage)
+                scale = 1 if stage == 'output' else self.sample_every
+                entry['estimated_seconds'] = histogram.sum * scale
+                stages.append(entry)
+        return {'sample_every': self.sample_every, 'stages': stages}
+
+    def emit(self):
+        """ Gives the report to each sink, then starts over. """
+        report = self.report()
+        if not report['stages']:
+            return
+        for sink in self.sinks:
+            try:
+                sink.emit(report)
+            except Exception as ex: # pylint: disable=broad-except
+                LOGGER.warning("Could not emit instrumentation to %s: %s", type(sink).__name__, ex)
+        with self._lock:
+            self._histograms = {}
+
+## Sinks - anything with an `emit(report)` method
+class SingerMetricsSink():
+    """ Logs a Singer `timer` METRIC line per stream and stage, with the histogram's summary as tags. """
+    def emit(self, report):
+        for entry in report['stages']:
+            tags = {'stage': entry['stage'],
+                    'count': entry['count'],
+                    'sample_every': report['sample_every'],
+                    'estimated_seconds': round(entry['estimated_seconds'], 6),
+                    'p50': entry['p50'],
+                    'p90': entry['p90'],
+                    'p99': entry['p99'],
+                    'max': entry['max']}
+            if entry['stream'] is not None:
+                tags['endpoint'] = entry['stream']
+            metrics.log(LOGGER, metrics.Point('timer', 'sync_stage', round(entry['sum'], 6), tags))
+
+def _write_atomically(path, text):
+    # Written to a temp file and moved into place, so readers never see a partial report
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+class JSONFileSink():
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, report):
+        _write_atomically(self.path, json.dumps(report, indent=2))
+
+class PrometheusFileSink():
+    """ Writes the histograms in Prometheus' text format, as `<prefix>_seconds{stream, stage}`. """
+    def __init__(self, path, prefix='burler_sync_stage'):
+        self.path = path
+        self.prefix = prefix
+
+    @staticmethod
+    def _labels(entry, **extra):
+        labels = {'stage': entry['stage']}
+        if entry['stream'] is not None:
+            labels['stream'] = entry['stream']
+        labels.update(extra)
+        return ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                        for k, v in sorted(labels.items()))
+
+    def emit(self, report):
+        name = self.prefix + '_seconds'
+        lines = ['# HELP {} Time spent in each stage of a sync, for a sample of records.'.format(name),
+                 '# TYPE {} histogram'.format(name)]
+        for entry in report['stages']:
+            cumulative = 0
+            for bound, count in sorted(entry['buckets'].items(), key=lambda item: float(item[0])):
+                cumulative += count
+                lines.append('{}_bucket{{{}}} {}'.format(name, self._labels(entry, le=bound), cumulative))
+            lines.append('{}_bucket{{{}}} {}'.format(name, self._labels(entry, le='+Inf'), entry['count']))
+            lines.append('{}_sum{{{}}} {}'.format(name, self._labels(entry), entry['sum']))
+            lines.append('{}_count{{{}}} {}'.format(name, self._labels(entry), entry['count']))
+        _write_atomically(self.path, '\n'.join(lines) + '\n')
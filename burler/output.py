@@ -0,0 +1,195 @@
+"""
+Buffered writer for the Singer messages a tap emits on stdout.
+
+`singer.write_record` serializes, writes and flushes stdout once per message,
+which costs a syscall per record. `MessageWriter` serializes each message as it
+comes in, but only writes to stdout once the buffer fills up or the flush
+interval has passed. STATE messages always flush, so state is never ahead of
+the records it covers.
+
+If `orjson` is installed it is used to serialize messages, falling back to
+simplejson (what singer uses) for anything orjson can't handle, like Decimals.
+Either way, NaN and infinite floats are written as null, as orjson does, since
+JSON has no representation for them.
+
+With a `spill_memory_limit`, flushed output is handed to a thread that writes
+it to stdout, spilling to disk beyond that many bytes (see burler.spill), so
+that a slow target doesn't hold up extraction.
+"""
+import sys
+import json
+import time
+import threading
+
+import pytz
+import simplejson
+import singer.utils as u
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_BUFFER_SIZE = 64 * 1024 # bytes
+DEFAULT_FLUSH_INTERVAL = 1.0 # seconds
+
+def _simplejson_dumps(obj, default=None):
+    return simplejson.dumps(obj, use_decimal=True, ignore_nan=True, default=default).encode('utf-8')
+
+def _orjson_dumps(obj, default=None):
+    try:
+        return orjson.dumps(obj, default=default)
+    except TypeError:
+        # orjson.JSONEncodeError is a TypeError: Decimal, non-str keys, big ints, etc.
+        return _simplejson_dumps(obj, default=default)
+
+class MessageWriter():
+    """
+    Writes Singer messages to `output` (sys.stdout by default), batching the
+    writes according to `buffer_size` (bytes) and `flush_interval` (seconds).
+
+    A `buffer_size` of 0 flushes every message, matching `singer.write_message`.
+    The flush interval is only checked when a message is written.
+
+    Writes are thread-safe, and a message is always written whole.
+
+    With a `spill_memory_limit` (bytes), the output is written by a thread,
+    and `close` (or exiting the context) waits for it to finish.
+    """
+    # A burler.instrumentation.Instrumentation timing serialization and output, if given
+    instrumentation = None
+
+    def __init__(self, output=None, buffer_size=DEFAULT_BUFFER_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, use_orjson=True, default=None,
+                 spill_memory_limit=None, spill_dir=None):
+        self.output = output
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.default = default
+        self.dumps = _orjson_dumps if (use_orjson and orjson is not None) else _simplejson_dumps
+
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()
+
+        self._spill = None
+        if spill_memory_limit is not None:
+            from burler.spill import SpillQueue # Only needed when spilling
+            self._spill = SpillQueue(self._write_to_output, spill_memory_limit, spill_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        try:
+            self.flush()
+        finally:
+            self.close()
+
+    def close(self):
+        """ Waits for the output thread, if there is one, to write everything flushed. """
+        if self._spill is not None:
+            self._spill.close()
+
+    def _write_bytes(self, data):
+        with self._lock:
+            self._buffer.append(data)
+            self._buffered_bytes += len(data)
+            if (self._buffered_bytes >= self.buffer_size or
+                    time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+
+    def flush(self):
+        """ Writes everything buffered so far to the output. """
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer:
+                return
+            data = b''.join(self._buffer)
+            self._buffer = []
+            self._buffered_bytes = 0
+            self._write_output(data)
+
+    def _write_output(self, data):
+        if self._spill is not None:
+            self._spill.put(data)
+        else:
+            self._write_to_output(data)
+
+    def _write_to_output(self, data):
+        if self.instrumentation is not None:
+            started = time.perf_counter()
+            self._write_to_stdout(data)
+            self.instrumentation.observe(None, 'output', time.perf_counter() - started)
+        else:
+            self._write_to_stdout(data)
+
+    def _write_to_stdout(self, data):
+        # Resolve stdout late, so redirection (e.g., in tests) is respected
+        output = self.output or sys.stdout
+        binary_output = getattr(output, 'buffer', None)
+        if binary_output is not None:
+            # Anything written to the text layer directly must go out first
+            output.flush()
+            binary_output.write(data)
+            binary_output.flush()
+        else:
+            output.write(data.decode('utf-8'))
+            output.flush()
+
+    def write_message(self, message):
+        """ Writes a `singer.Message` object. """
+        message = message.asdict()
+        self._write_bytes(self.dumps(message, self.default) + b'\n')
+        if message['type'] == 'STATE':
+            self.flush()
+
+    def write_record(self, stream_name, record, stream_alias=None, time_extracted=None):
+        """ Writes a RECORD message, returning its size in bytes. """
+        message = {'type': 'RECORD',
+                   'stream': stream_alias or stream_name,
+                   'record': record}
+        if time_extracted:
+            message['time_extracted'] = u.strftime(time_extracted.astimezone(pytz.utc))
+        if self.instrumentation is not None and self.instrumentation.sampling():
+            started = time.perf_counter()
+            data = self.dumps(message, self.default) + b'\n'
+            self.instrumentation.observe(stream_name, 'serialize', time.perf_counter() - started)
+        else:
+            data = self.dumps(message, self.default) + b'\n'
+        self._write_bytes(data)
+        return len(data)
+
+    def write_schema(self, stream_name, schema, key_properties, bookmark_properties=None, stream_alias=None):
+        if isinstance(key_properties, (str, bytes)):
+            key_properties = [key_properties]
+        if not isinstance(key_properties, list):
+            raise Exception("key_properties must be a string or list of strings")
+
+        message = {'type': 'SCHEMA',
+                   'stream': stream_alias or stream_name,
+                   'schema': schema,
+                   'key_properties': key_properties}
+        if isinstance(bookmark_properties, (str, bytes)):
+            bookmark_properties = [bookmark_properties]
+        if bookmark_properties:
+            message['bookmark_properties'] = bookmark_properties
+        self._write_bytes(self.dumps(message, self.default) + b'\n')
+
+    def write_state(self, value):
+        """ Writes a STATE message, flushing it along with every record before it. Returns its size in bytes. """
+        data = self.dumps({'type': 'STATE', 'value': value}, self.default) + b'\n'
+        with self._lock:
+            self._write_bytes(data)
+            self.flush()
+        return len(data)
+
+    def write_catalog(self, catalog):
+        """ Writes the discovered catalog, as `json.dump(catalog, sys.stdout, indent=2)` would. """
+        self.flush()
+        if self.dumps is _orjson_dumps:
+            self._write_bytes(orjson.dumps(catalog, option=orjson.OPT_INDENT_2))
+        else:
+            self._write_bytes(json.dumps(catalog, indent=2).encode('utf-8'))
+        self.flush()
@@ -0,0 +1,86 @@
+"""
+Finds the Tap to run for a `singer run <tap>` or a tap's own console script.
+
+A tap can be named in three ways, checked in this order:
+
+1. An explicit `module:attribute` spec, e.g., `tap_foo:tap` or `tap_foo.app:tap`
+2. An entry point in the `burler.taps` group, which installed taps declare in setup.py:
+
+       entry_points={'burler.taps': ['tap-foo = tap_foo:tap']}
+
+3. The name of its module, with dashes as underscores (e.g., `tap-foo` -> `tap_foo`),
+   which is expected to create the tap with `burler.tap()` when imported
+
+Entry points are read from package metadata without importing any tap, and
+resolved taps are cached for the life of the process.
+"""
+import sys
+import importlib
+
+from burler.taps import Tap
+from burler.exceptions import TapNotDefinedException, TapRedefinedException
+
+ENTRY_POINT_GROUP = 'burler.taps'
+
+_installed_taps = None
+_resolved_taps = {}
+
+def installed_taps():
+    """ Maps the name of each tap registered in the `burler.taps` entry point group to its EntryPoint. """
+    global _installed_taps # pylint: disable=global-statement
+    if _installed_taps is None:
+        from importlib import metadata
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            group = entry_points.select(group=ENTRY_POINT_GROUP)
+        else: # Python < 3.10
+            group = entry_points.get(ENTRY_POINT_GROUP, [])
+        _installed_taps = {entry_point.name: entry_point for entry_point in group}
+    return _installed_taps
+
+def clear_cache():
+    global _installed_taps # pylint: disable=global-statement
+    _installed_taps = None
+    _resolved_taps.clear()
+
+def _load_attribute(spec):
+    module_name, _, attribute = spec.partition(':')
+    obj = importlib.import_module(module_name)
+    for name in attribute.split('.'):
+        obj = getattr(obj, name, None)
+        if obj is None:
+            raise TapNotDefinedException("Could not find '{}' in module '{}'.".format(attribute, module_name))
+    return obj
+
+def _check_tap(tap_obj, spec):
+    if not isinstance(tap_obj, Tap):
+        raise TapNotDefinedException("'{}' is a {}, not a Tap.".format(spec, type(tap_obj).__name__))
+    if tap_obj is not Tap._Tap__tap: # pylint: disable=protected-access
+        raise TapRedefinedException("Found tap definition for {}, but it is out of sync with Burler's tap object. Please ensure that it is not being redefined.".format(spec))
+    return tap_obj
+
+def _resolve(name):
+    if ':' in name:
+        return _check_tap(_load_attribute(name), name)
+
+    entry_point = installed_taps().get(name)
+    if entry_point is not None:
+        return _check_tap(entry_point.load(), name)
+
+    module_name = name.replace('-', '_')
+    if module_name not in sys.modules:
+        importlib.import_module(module_name)
+    tap_obj = Tap._Tap__tap # pylint: disable=protected-access
+    if tap_obj is None:
+        raise TapNotDefinedException("Could not find an instance of Tap in module '{}'. Please ensure that it is created with burler.tap() when the module is imported. (__init__.py or {}.py)".format(module_name, module_name))
+    return tap_obj
+
+def resolve_tap(name):
+    """
+    Returns the Tap for `name`, a `module:attribute` spec, a registered
+    entry point name, or a module name (see above).
+    """
+    tap_obj = _resolved_taps.get(name)
+    if tap_obj is None:
+        tap_obj = _resolved_taps[name] = _resolve(name)
+    return tap_obj
@@ -0,0 +1,189 @@
+"""
+Resolves `$ref`s in JSON Schemas, so that the catalog, the SCHEMA messages and
+the sync transform all see schemas with every reference inlined.
+
+    resolve_refs({'$ref': 'shared.json#/definitions/address'}, base_uri='schemas/contacts.json')
+
+Local (`#/definitions/address`), file-relative (`shared.json#/...`) and
+absolute (`file:` or `http(s):`) references are supported. Documents and
+resolved sub-schemas are cached by URI, so a definition shared by many streams
+is loaded and resolved once per process.
+
+A recursive definition (e.g., a category with child categories) can't be
+inlined forever. Where a reference points back to a definition that is still
+being resolved, it's replaced with an empty schema, which accepts any value.
+"""
+import os
+import json
+import pickle
+import threading
+from urllib.parse import urljoin, urldefrag, urlparse, unquote
+from urllib.request import urlopen, pathname2url, url2pathname
+
+import singer.logger as logging
+
+from burler.exceptions import SchemaReferenceError
+
+LOGGER = logging.get_logger()
+
+# Keywords whose value is a schema, a list of schemas, or a map of names to schemas.
+# Anything else (enum, default, examples, ...) is data and is copied as-is.
+_SCHEMA_KEYWORDS = frozenset(['items', 'additionalItems', 'additionalProperties', 'not',
+                              'contains', 'propertyNames', 'if', 'then', 'else'])
+_SCHEMA_LIST_KEYWORDS = frozenset(['allOf', 'anyOf', 'oneOf'])
+_SCHEMA_MAP_KEYWORDS = frozenset(['properties', 'patternProperties', 'dependencies'])
+# Only there to be referenced, so they're dropped once the references are inlined
+_DEFINITION_KEYWORDS = frozenset(['definitions', '$defs'])
+
+def path_to_uri(path):
+    """ A `file:` URI for `path`, which relative references will be resolved against. """
+    path = os.path.abspath(path)
+    uri = 'file://' + pathname2url(path)
+    return uri + '/' if os.path.isdir(path) else uri
+
+def _base_uri(base_uri):
+    if base_uri is None:
+        return path_to_uri(os.getcwd())
+    if urlparse(base_uri).scheme in ('file', 'http', 'https'):
+        return base_uri
+    return path_to_uri(base_uri)
+
+def has_refs(node):
+    if isinstance(node, dict):
+        return '$ref' in node or any(has_refs(value) for value in node.values())
+    if isinstance(node, list):
+        return any(has_refs(value) for value in node)
+    return False
+
+def _follow_pointer(document, fragment, uri):
+    """ Finds the sub-schema addressed by a JSON Pointer fragment (e.g., `/definitions/address`). """
+    if not fragment:
+        return document
+    if not fragment.startswith('/'):
+        raise SchemaReferenceError("Could not resolve '{}', only JSON Pointer fragments are supported.".format(uri))
+    node = document
+    for part in unquote(fragment)[1:].split('/'):
+        part = part.replace('~1', '/').replace('~0', '~')
+        try:
+            node = node[int(part)] if isinstance(node, list) else node[part]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise SchemaReferenceError("Could not resolve '{}', '{}' was not found.".format(uri, part)) from None
+    return node
+
+class SchemaResolver():
+    def __init__(self):
+        self._documents = {}
+        self._resolved = {} # Pickled, so each use gets its own copy
+        self._lock = threading.Lock()
+
+    def resolve(self, schema, base_uri=None):
+        """
+        Returns `schema` with its references inlined. Relative references are
+        resolved against `base_uri`, a path or URI (defaults to the working
+        directory). Schemas without references are returned unchanged.
+        """
+        if not has_refs(schema):
+            return schema
+        resolved, _ = self._resolve_schema(schema, _base_uri(base_uri), None, schema, ())
+        return resolved
+
+    def _load_document(self, uri):
+        document = self._documents.get(uri)
+        if document is None:
+            try:
+                if urlparse(uri).scheme == 'file':
+                    with open(url2pathname(urlparse(uri).path), 'r') as f:
+                        document = json.load(f)
+                else:
+                    with urlopen(uri) as response:
+                        document = json.loads(response.read().decode('utf-8'))
+            except (OSError, ValueError) as ex:
+                raise SchemaReferenceError("Could not load schema '{}': {}".format(uri, ex)) from ex
+            with self._lock:
+                self._documents[uri] = document
+        return document
+
+    def _resolve_schema(self, node, base, document_uri, document, stack):
+        """
+        Returns the resolved copy of the schema `node` from `document`, and
+        whether it's complete (i.e., no recursive reference was cut off, which
+        would make it depend on where resolution started).
+        """
+        if not isinstance(node, dict):
+            return node, True
+
+        complete = True
+        if isinstance(node.get('$ref'), str):
+            resolved, complete = self._resolve_ref(node['$ref'], base, document_uri, document, stack)
+            siblings = {key: value for key, value in node.items()
+                        if key != '$ref' and key not in _DEFINITION_KEYWORDS}
+            if not siblings:
+                return resolved, complete
+            # Annotations next to a $ref (e.g., a description) are kept
+            node = dict(resolved, **siblings)
+
+        result = {}
+        for key, value in node.items():
+            if key in _DEFINITION_KEYWORDS:
+                continue
+            if key in _SCHEMA_KEYWORDS or (key in _SCHEMA_LIST_KEYWORDS and isinstance(value, list)):
+                if isinstance(value, list):
+                    value, value_complete = self._resolve_list(value, base, document_uri, document, stack)
+                else:
+                    value, value_complete = self._resolve_schema(value, base, document_uri, document, stack)
+                complete = complete and value_complete
+            elif key in _SCHEMA_MAP_KEYWORDS and isinstance(value, dict):
+                resolved_map = {}
+                for name, sub_schema in value.items():
+                    resolved_map[name], value_complete = self._resolve_schema(sub_schema, base, document_uri,
+                                                                              document, stack)
+                    complete = complete and value_complete
+                value = resolved_map
+            result[key] = value
+        return result, complete
+
+    def _resolve_list(self, schemas, base, document_uri, document, stack):
+        complete = True
+        resolved = []
+        for schema in schemas:
+            schema, schema_complete = self._resolve_schema(schema, base, document_uri, document, stack)
+            resolved.append(schema)
+            complete = complete and schema_complete
+        return resolved, complete
+
+    def _resolve_ref(self, ref, base, document_uri, document, stack):
+        if ref.startswith('#'):
+            # Local to the current document, which is only cacheable if it came from a URI
+            target_uri = document_uri + ref if document_uri else None
+            target_base, target_document_uri, target_document = base, document_uri, document
+            fragment = ref[1:]
+            key = target_uri or (id(document), ref)
+        else:
+            target_uri = urljoin(base, ref)
+            target_document_uri, fragment = urldefrag(target_uri)
+            target_base = target_document_uri
+            target_document = self._load_document(target_document_uri)
+            key = target_uri
+
+        if key in stack:
+            LOGGER.debug("Schema reference '%s' is recursive, using an empty schema.", ref)
+            return {}, False
+
+        if target_uri is not None:
+            cached = self._resolved.get(target_uri)
+            if cached is not None:
+                return pickle.loads(cached), True
+
+        target = _follow_pointer(target_document, fragment, target_uri or ref)
+        resolved, complete = self._resolve_schema(target, target_base, target_document_uri,
+                                                  target_document, stack + (key,))
+        if complete and target_uri is not None:
+            with self._lock:
+                self._resolved[target_uri] = pickle.dumps(resolved, protocol=pickle.HIGHEST_PROTOCOL)
+        return resolved, complete
+
+_default_resolver = SchemaResolver()
+
+def resolve_refs(schema, base_uri=None):
+    """ Resolves `schema`'s references with the process-wide resolver, see SchemaResolver.resolve. """
+    return _default_resolver.resolve(schema, base_uri)
@@ -1,29 +1,70 @@
 import os
+import json
+import pickle
+import threading
 
-from burler.exceptions import NoWSDLLocationSpecified
+from burler.exceptions import NoWSDLLocationSpecified, XSDTranslationError
+from burler.schema_refs import resolve_refs
+
+# Parsed schema files, keyed on path and modification time. They're stored
+# pickled so each caller gets its own copy (unpickling is faster than parsing).
+_schema_cache = {}
+_schema_cache_lock = threading.Lock()
+
+def load_json_schema(filepath):
+    """ Loads a JSON Schema file, parsing it only once per process (unless it changes). """
+    stat = os.stat(filepath)
+    key = (filepath, stat.st_mtime_ns, stat.st_size)
+    pickled = _schema_cache.get(key)
+    if pickled is None:
+        with open(filepath, "r") as f:
+            pickled = pickle.dumps(json.load(f), protocol=pickle.HIGHEST_PROTOCOL)
+        with _schema_cache_lock:
+            _schema_cache[key] = pickled
+    return pickle.loads(pickled)
 
 ## Schema Types
 ## These functions will be called and return a function to get the schema for a specific stream
 def json_file(filepath):
-    """ Loads a JSON Schema from a filepath. """
+    """ Loads a JSON Schema from a filepath, resolving its references relative to the file. """
     def get_schema():
-        if not os.path.isabs(filepath):
-            filepath = os.path.join(os.getcwd(), path)
-        with open(filepath, "r") as f:
-            return json.load(f)
+        path = filepath
+        if not os.path.isabs(path):
+            path = os.path.join(os.getcwd(), path)
+        return resolve_refs(load_json_schema(path), base_uri=path)
     return get_schema
 
-def wsdl(url=None, filepath=None):
-    """ Loads a WSDL file and converts it to JSON schema as best it can. """
+def wsdl(url=None, filepath=None, type_name=None, cache_dir=None):
+    """
+    Loads the JSON Schema of an element or type (`type_name`) from a WSDL or
+    XSD file, along with the XSD files it includes or imports. See burler.xsd.
+    """
     def get_schema():
-        # SOAP magic to get a schema from a WSDL
         if url is None and filepath is None:
             raise NoWSDLLocationSpecified("In order to specify a wsdl schema location, you must provide either a url or a filepath to locate the XSD file.")
+        if filepath is None:
+            raise XSDTranslationError("Only local WSDL files are supported. Download '{}' and specify its filepath instead.".format(url))
+        if type_name is None:
+            raise XSDTranslationError("Specify the type_name of the element or type in '{}' that describes the stream's records.".format(filepath))
+
+        from burler.xsd import load_schema # Only needed by taps using it
+        path = filepath
+        if not os.path.isabs(path):
+            path = os.path.join(os.getcwd(), path)
+        return load_schema(path, type_name, cache_dir=cache_dir)
+    return get_schema
 
-        # TODO: Seems like there are no great python solutions to this on pypi, write our own?
-        raise NotImplemented("WSDL schema definition is not currently supported. Need an XSD -> JSON Schema translator.")
+def generated(sample_size=1000, state=None, max_properties=None):
+    """
+    Infers the schema from the first `sample_size` records the stream's `sync`
+    emits (with `state`, if given), for sources that can't describe their data:
 
-        return {}
+        class Events(Stream):
+            load_schema = generated(sample_size=500)
+    """
+    def get_schema(instance):
+        from burler.inference import infer_schema, sample_records
+        return infer_schema(sample_records(instance, sample_size, state), max_properties=max_properties)
     return get_schema
 
 def discovered(discovery_func):
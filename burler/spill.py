@@ -0,0 +1,118 @@
+"""
+An output stage that decouples a tap from the target reading its stdout.
+
+When the target is slow, writing to the pipe blocks, and with it extraction,
+until the source's connection or cursor times out. With a `SpillQueue`
+between them, the tap's writes are queued and a thread writes them to the
+output in order. Up to `memory_limit` bytes are queued in memory, and anything
+beyond that is appended to a temporary file, which is read back (with mmap)
+once the target catches up. The file is emptied whenever the queue is.
+"""
+import mmap
+import tempfile
+import threading
+from collections import deque
+
+import singer.logger as logging
+
+LOGGER = logging.get_logger()
+
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024 # bytes
+
+class SpillQueue():
+    def __init__(self, write, memory_limit=DEFAULT_MEMORY_LIMIT, directory=None):
+        self.write = write
+        self.memory_limit = memory_limit
+        self.directory = directory
+        self.spilled_bytes = 0
+
+        # In order, either the bytes to write, or the (offset, length) of bytes in the spill file
+        self._entries = deque()
+        self._memory_bytes = 0
+        self._file = None
+        self._file_size = 0
+        self._map = None
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._drain, name='burler-output', daemon=True)
+        self._thread.start()
+
+    def put(self, data):
+        """ Queues `data` to be written, raising the output's error if writing has failed. """
+        with self._condition:
+            self._raise_error()
+            if self._memory_bytes + len(data) <= self.memory_limit:
+                self._entries.append(data)
+                self._memory_bytes += len(data)
+            else:
+                self._entries.append(self._spill(data))
+            self._condition.notify()
+
+    def _spill(self, data):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='burler-output-', dir=self.directory)
+        self._file.write(data)
+        offset = self._file_size
+        self._file_size += len(data)
+        self.spilled_bytes += len(data)
+        return offset, len(data)
+
+    def _read(self, offset, length):
+        if self._map is None or offset + length > len(self._map):
+            self._file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def _reset_file(self):
+        """ Empties the spill file, once everything in it has been written. """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.seek(0)
+        self._file.truncate()
+        self._file_size = 0
+
+    def _drain(self):
+        while True:
+            with self._condition:
+                while not self._entries and not self._closed:
+                    self._condition.wait()
+                if not self._entries:
+                    return
+                entry = self._entries.popleft()
+                if isinstance(entry, bytes):
+                    self._memory_bytes -= len(entry)
+                    data = entry
+                else:
+                    data = self._read(*entry)
+                    if not self._entries:
+                        self._reset_file()
+            try:
+                self.write(data)
+            except BaseException as ex: # pylint: disable=broad-except
+                with self._condition:
+                    self._error = ex
+                    self._entries.clear()
+                    self._memory_bytes = 0
+                return
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """ Waits for everything queued to be written, then removes the spill file. """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        if self.spilled_bytes:
+            LOGGER.info("Spilled %s bytes of output to disk while waiting on the target", self.spilled_bytes)
+        self._raise_error()
@@ -3,8 +3,15 @@ Contains functions and classes for streamlining the registration and execution o
 streams by hooking them up to the global `tap` object.
 """
 import re
+import inspect
+import singer
+from singer import metadata
 from burler.taps import Tap
 from burler.exceptions import DuplicateStream
+from burler.aio import is_async_stream, pipeline, DEFAULT_MAX_IN_FLIGHT
+from burler.bookmark_strategies import end_of_sync
+from burler.substreams import DEFAULT_MAX_CONCURRENT_CHILDREN
+from burler.throttling import ThrottledClient, ThrottleStats, RetryPolicy
 
 def _raise_duplicate_stream(name):
     raise DuplicateStream(("Attempted to register duplicate stream ({}) using Stream "
@@ -19,8 +26,29 @@ _pascal_case_converter = re.compile(r'(.)([A-Z][a-z]+?)')
 def _class_name_to_underscore(name):
     return _pascal_case_converter.sub(r'\1_\2', name).lower()
 
-def stream(name=None, tap_stream_id=None, stream_alias=None): # pylint: disable=unused-argument
-    """ A class decorator that registers a Stream class with the tap. """
+def _selected_fields(schema, mdata):
+    """
+    The top-level properties that the transform will keep, i.e., those that are
+    automatic, or not deselected or unsupported.
+    """
+    fields = set()
+    for field_name in schema.get('properties', {}):
+        field_mdata = mdata.get(('properties', field_name), {})
+        inclusion = field_mdata.get('inclusion')
+        if inclusion == 'automatic' or (field_mdata.get('selected') is not False and
+                                        inclusion != 'unsupported'):
+            fields.add(field_name)
+    return frozenset(fields)
+
+def stream(name=None, tap_stream_id=None, stream_alias=None, # pylint: disable=unused-argument
+           retry_sync_on=None, setup_retry=None, max_sync_retries=None,
+           rate_limiter=None, retry_policy=None):
+    """
+    A class decorator that registers a Stream class with the tap.
+
+    `retry_sync_on`, `setup_retry`, `max_sync_retries`, `rate_limiter` and
+    `retry_policy` override the class's attributes of the same names (see Stream).
+    """
 
     def wrapped_stream(cls):
         nonlocal name
@@ -38,14 +66,59 @@ def stream(name=None, tap_stream_id=None, stream_alias=None): # pylint: disable=
                 self.unique_name = lambda: tap_stream_id or name
                 self.display_name = lambda: name
                 self.emitted_name = lambda: stream_alias or tap_stream_id
-
-            def set_context(self, instance): # pylint: disable=no-self-use
+                self.throttle_stats = ThrottleStats()
+                # Looked up statically, so that functions declared on the class aren't bound as methods
+                self.retry_sync_on = retry_sync_on or inspect.getattr_static(cls, 'retry_sync_on', None)
+                self.setup_retry = setup_retry or inspect.getattr_static(cls, 'setup_retry', None)
+                if isinstance(self.setup_retry, staticmethod):
+                    self.setup_retry = self.setup_retry.__func__
+                self.max_sync_retries = (max_sync_retries if max_sync_retries is not None
+                                         else getattr(cls, 'max_sync_retries', 0))
+                self.rate_limiter = rate_limiter
+                self.retry_policy = retry_policy
+
+            def sync_retry_policy(self):
+                """ When the stream's sync is restarted from its last checkpoint, if ever. """
+                if not self.retry_sync_on or not self.max_sync_retries:
+                    return None
+                return RetryPolicy(retry_on=self.retry_sync_on, max_tries=self.max_sync_retries + 1,
+                                   base_delay=getattr(self.cls, 'sync_retry_delay', 1.0))
+
+            def set_context(self, instance, schema=None, mdata=None, state=None):
                 """
                 Sets the context to be used when calling the sync methods. This gives
                 it bookmarks, catalog, etc.
+
+                When syncing, the instance is also given:
+                - `selected_fields`: The top-level properties that will be emitted,
+                  so that only those need to be requested from the source
+                - `replication_key`: From the catalog's metadata, if the class doesn't declare one
+                - `bookmark`: The replication key's bookmark, or the start_date without one
                 """
                 current_tap = Tap._Tap__tap # pylint: disable=protected-access
-                instance.client = current_tap.client
+                if mdata is not None:
+                    instance.selected_fields = _selected_fields(schema or {}, mdata)
+                    if getattr(instance, 'replication_key', None) is None:
+                        instance.replication_key = metadata.get(mdata, (), 'replication-key')
+                if state is not None:
+                    replication_key = getattr(instance, 'replication_key', None)
+                    bookmark = (singer.get_bookmark(state, self.unique_name(), replication_key)
+                                if isinstance(replication_key, str) else None)
+                    if bookmark is None and current_tap.config:
+                        bookmark = current_tap.config.get('start_date')
+                    instance.bookmark = bookmark
+
+                if is_async_stream(instance) and current_tap.has_async_client():
+                    return # The async client is created on the stream's event loop
+                instance.client = self.bind_client(instance, current_tap.client)
+
+            def bind_client(self, instance, client):
+                """ Throttles the client with the stream's own `rate_limiter` and `retry_policy`, if it has them. """
+                rate_limiter = self.rate_limiter or getattr(instance, 'rate_limiter', None)
+                retry_policy = self.retry_policy or getattr(instance, 'retry_policy', None)
+                if rate_limiter is None and retry_policy is None:
+                    return client
+                return ThrottledClient(client, rate_limiter, retry_policy, self.throttle_stats)
 
         smd = StreamMetadata(cls, name, tap_stream_id, stream_alias)
         if smd.unique_name() in Tap.streams:
@@ -66,7 +139,7 @@ class StreamMeta(type):
     global `tap` when the `Stream` class is subclassed (at load time).
     """
     def __init__(cls, name, bases, clsdict):
-        super().__init__(cls, name, bases, clsdict)
+        super().__init__(name, bases, clsdict)
         # More Info:
         # https://stackoverflow.com/questions/18126552/how-to-run-code-when-a-class-is-subclassed
         if len(bases) > 0: # We only want to register classes that are sub-sub classed from this
@@ -86,14 +159,61 @@ class Stream(metaclass=StreamMeta):
         # If this is a metaclass, it should register itself with the tap
         pass
 
+    # When to write the bookmark, see burler.bookmark_strategies
+    bookmark_strategy = end_of_sync
+
+    # Set from the catalog and state before `sync` is called (see StreamMetadata.set_context)
+    selected_fields = None
+    bookmark = None
+
+    # Number of concurrent requests for async streams using `pipeline` or `in_flight`
+    max_in_flight = DEFAULT_MAX_IN_FLIGHT
+
+    # For a windowed stream, defining `sync_window(self, state, start, end)` instead of `sync`,
+    # the timedelta to split the sync from the bookmark into, and the number to fetch at once
+    window_size = None
+    max_concurrent_windows = 1
+
+    # A burler.throttling.RateLimiter and RetryPolicy for this stream's client calls, in addition
+    # to any given to @tap.create_client. The limiter is shared by the class's instances.
+    rate_limiter = None
+    retry_policy = None
+
+    # Restarts the stream from its last checkpoint when its sync raises one of these exceptions
+    # (a class, tuple, or predicate), up to `max_sync_retries` times, with jittered exponential
+    # backoff from `sync_retry_delay` seconds. Before each restart, `setup_retry(state, exception)`
+    # may adjust the tap's state, e.g., to reset a bookmark. Other streams sync in the meantime.
+    retry_sync_on = None
+    max_sync_retries = 3
+    sync_retry_delay = 1.0
+    setup_retry = None
+
+    # For a sub-stream, the Stream class whose records it's synced for, with `sync(self, state, parent)`
+    parent = None
+
+    # For a parent stream, the number of sub-stream syncs that run at once, and the number of parent
+    # records that may wait on theirs before the parent is paused (twice the former by default)
+    max_concurrent_children = DEFAULT_MAX_CONCURRENT_CHILDREN
+    max_pending_parents = None
+
+    def fingerprint(self):
+        """
+        A version or etag of the source object, which changes when its schema may
+        have. Discovery skips `load_schema` when it matches the previous catalog's.
+        """
+        return None
+
+    def pipeline(self, func, items):
+        """
+        For async streams, calls the coroutine function `func` on each item with
+        up to `max_in_flight` calls running, yielding results in order.
+        """
+        return pipeline(func, items, limit=self.max_in_flight)
+
     def sync(self, func, bookmark_strategy=None):
         self.__sync = func
         return func
 
-    def bookmark(self, func):
-        # Decorator to define bookmark accessor for stream's strategy
-        pass
-
     def schema(self, method=None):
         # Non-decorator to declare source and method
         pass
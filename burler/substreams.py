@@ -0,0 +1,86 @@
+"""
+Sub-streams, whose records are fetched for each record of a parent stream
+(e.g., the audits of each ticket):
+
+    class Tickets(Stream):
+        max_concurrent_children = 8
+
+        def sync(self, state):
+            yield from self.client.get_tickets(since=self.bookmark)
+
+    class TicketAudits(Stream):
+        parent = Tickets
+
+        def sync(self, state, parent):
+            yield from self.client.get_audits(parent['id'])
+
+A sub-stream is synced along with its parent, and only if its parent is
+selected. Its SCHEMA message is written after its parent's. As the parent
+emits records, each one is handed to its selected sub-streams, which run on a
+pool of the parent's `max_concurrent_children` threads. At most
+`max_pending_parents` parent records wait on their sub-streams before the
+parent is paused, which bounds memory.
+
+Each level keeps its own bookmark. A parent's bookmark only advances past a
+record once the sub-streams for it, and for every record before it, have
+finished. A checkpoint then never skips a parent whose children weren't
+synced. A sub-stream's bookmark is the greatest replication key value it has
+emitted, or whatever it writes into the state it's given, which is its own
+copy for each parent record and is merged into the tap's state afterwards.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_CONCURRENT_CHILDREN = 4
+
+def parent_tap_stream_id(cls, streams):
+    """ The tap_stream_id of a Stream class's parent, if it's a sub-stream. """
+    parent = getattr(cls, 'parent', None)
+    if parent is None:
+        return None
+    for tap_stream_id, smd in streams.items():
+        if smd.cls is parent:
+            return tap_stream_id
+    return None
+
+class ChildFanout():
+    """
+    Runs each of `children` (callables taking a parent record) for every record
+    submitted by the parent, calling `on_complete(token, results)` on the
+    parent's thread as each parent record's children finish, in the order the
+    parent records were submitted.
+    """
+    def __init__(self, children, on_complete, max_workers=DEFAULT_MAX_CONCURRENT_CHILDREN, max_pending=None):
+        self.children = children
+        self.on_complete = on_complete
+        self.max_pending = max_pending or 2 * max_workers
+        self.pending = deque()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='burler-substream')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            for _, futures in self.pending:
+                for future in futures:
+                    future.cancel()
+        self.executor.shutdown(wait=True)
+
+    def submit(self, parent_record, token=None):
+        self.pending.append((token, [self.executor.submit(child, parent_record) for child in self.children]))
+        self._complete(wait=False)
+
+    def finish(self):
+        """ Waits for the children of every parent record submitted so far. """
+        self._complete(wait=True)
+
+    def _complete(self, wait):
+        while self.pending:
+            token, futures = self.pending[0]
+            # Wait for the oldest parent record when everything's been waited on, or too many are pending
+            if not (wait or len(self.pending) > self.max_pending or all(f.done() for f in futures)):
+                return
+            results = [future.result() for future in futures] # A child's error is raised to the parent
+            self.pending.popleft()
+            self.on_complete(token, results)
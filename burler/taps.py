@@ -1,16 +1,29 @@
-import json
 import sys
-
-from burler.exceptions import ConfigValidationException, SyncModeNotDefined, MissingCatalog, NoClientConfigured, StreamsNotFound
+import copy
+import time
+import inspect
+import functools
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from burler.exceptions import ConfigValidationException, SyncModeNotDefined, MissingCatalog, NoClientConfigured, StreamsNotFound, StreamSyncFailures
+from burler.transform import CompiledTransform
+from burler.encoding import RecordCoercer
+from burler.schema_refs import resolve_refs
+from burler.catalog import FINGERPRINT_KEY, get_fingerprint, carry_over_selections
+from burler.output import MessageWriter, DEFAULT_BUFFER_SIZE, DEFAULT_FLUSH_INTERVAL
+from burler import aio
+from burler.bookmark_strategies import end_of_sync, Progress, bookmark_is_after
+from burler.windows import is_windowed_stream, sync_windows
+from burler.substreams import ChildFanout, parent_tap_stream_id, DEFAULT_MAX_CONCURRENT_CHILDREN
 
 import singer
+import singer.utils
 import singer.logger as logging
 from singer import metrics
 from singer import metadata
-from singer import Transformer
 
-from schema import Schema as SSchema, SchemaError
-from voluptuous import Schema as VSchema, Invalid
 
 LOGGER = logging.get_logger()
 
@@ -23,6 +36,9 @@ class Tap:
     config = None
     requires_config = True
     json_encoder = None
+    writer = None
+    writer_class = MessageWriter
+    _coerce_record = None
 
     _discovery_override = False
     _sync_override = False
@@ -49,9 +65,26 @@ class Tap:
         _validate_basic_conf_practices(conf)
         return _validate(conf)
 
-    def __init__(self, config_spec=None, requires_catalog=True, debug=False, json_encoder=None):
+    def __init__(self, config_spec=None, requires_catalog=True, debug=False, json_encoder=None,
+                 output_buffer_size=DEFAULT_BUFFER_SIZE, output_flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_concurrent_streams=1, max_discovery_workers=1,
+                 version=None, discovery_cache_ttl=None, discovery_cache_dir=None,
+                 sync_retry_budget=None, output_spill_limit=None, output_spill_dir=None,
+                 instrumentation=None, bookmark_monitor_sample=None):
         self.requires_catalog = requires_catalog
+        self.max_concurrent_streams = max_concurrent_streams
+        self.sync_retry_budget = sync_retry_budget
+        self.max_discovery_workers = max_discovery_workers
+        self.version = version
+        self.discovery_cache_ttl = discovery_cache_ttl
+        self.discovery_cache_dir = discovery_cache_dir
         self.json_encoder = json_encoder
+        self.output_buffer_size = output_buffer_size
+        self.output_flush_interval = output_flush_interval
+        self.output_spill_limit = output_spill_limit
+        self.output_spill_dir = output_spill_dir
+        self.instrumentation = instrumentation
+        self.bookmark_monitor_sample = bookmark_monitor_sample
 
         if config_spec is None:
             self.requires_config = False
@@ -84,19 +117,26 @@ class Tap:
                 return conf
             self.validate_config = validate
 
-        if isinstance(config_spec, VSchema):
+        # A schema or voluptuous spec means the tap already imported that library, so
+        # they're looked up rather than imported, keeping them off the startup path. An
+        # unrelated module may have the same name, so their Schema classes aren't assumed.
+        voluptuous = sys.modules.get('voluptuous')
+        voluptuous_schema = getattr(voluptuous, 'Schema', None)
+        if isinstance(voluptuous_schema, type) and isinstance(config_spec, voluptuous_schema):
             def validate(conf):
                 try:
                     return config_spec(conf)
-                except Invalid as ex:
+                except voluptuous.Invalid as ex:
                     raise ConfigValidationException("Error validating config: {}".format(ex)) from ex
             self.validate_config = validate
 
-        if isinstance(config_spec, SSchema):
+        schema = sys.modules.get('schema')
+        schema_schema = getattr(schema, 'Schema', None)
+        if isinstance(schema_schema, type) and isinstance(config_spec, schema_schema):
             def validate(conf):
                 try:
                     return config_spec.validate(conf)
-                except SchemaError as ex:
+                except schema.SchemaError as ex:
                     raise ConfigValidationException("Error validating config: {}".format(ex)) from ex
             self.validate_config = validate
 
@@ -138,33 +178,67 @@ class Tap:
                 mdata = safe_write_md(mdata, ('properties', field_name), 'inclusion', 'available')
         mdata = safe_write_md(mdata, (), 'inclusion', 'available')
 
+        # Sub-streams are only synced along with their parent
+        parent_id = parent_tap_stream_id(type(instance), self.streams)
+        if parent_id is not None:
+            mdata = safe_write_md(mdata, (), 'parent-tap-stream-id', parent_id)
+
         return metadata.to_list(mdata)
 
-    def __discover_using_registered_streams(self, config):
-        streams = []
-        for smd in self.streams.values(): # smd is StreamMetadata
-            instance = smd.cls()
-            smd.set_context(instance)
-
-            if not callable(getattr(instance, 'load_schema', None)):
-                instance.load_schema = lambda: {}
-            if not callable(getattr(instance, 'load_metadata', None)):
-                instance.load_metadata = lambda _0, _1: metadata.new()
-            schema = instance.load_schema()
-            streams.append({'stream': smd.display_name(),
-                            'tap_stream_id': smd.unique_name(),
-                            'schema': schema,
-                            'metadata': self._write_default_metadata(schema,
-                                                                     instance.load_metadata(schema),
-                                                                     instance = instance)})
+    def __discover_stream(self, smd, previous_entry=None):
+        instance = smd.cls()
+        smd.set_context(instance)
+
+        fingerprint = instance.fingerprint() if callable(getattr(instance, 'fingerprint', None)) else None
+        if (previous_entry is not None and fingerprint is not None and
+                get_fingerprint(previous_entry) == fingerprint):
+            return previous_entry
+
+        if not callable(getattr(instance, 'load_schema', None)):
+            instance.load_schema = lambda: {}
+        if not callable(getattr(instance, 'load_metadata', None)):
+            instance.load_metadata = lambda _: metadata.new()
+        schema = resolve_refs(instance.load_schema())
+        mdata = instance.load_metadata(schema)
+        if fingerprint is not None:
+            mdata = metadata.write(mdata, (), FINGERPRINT_KEY, fingerprint)
+        catalog_entry = {'stream': smd.display_name(),
+                         'tap_stream_id': smd.unique_name(),
+                         'schema': schema,
+                         'metadata': self._write_default_metadata(schema, mdata, instance = instance)}
+        if previous_entry is not None:
+            carry_over_selections(previous_entry, catalog_entry)
+        return catalog_entry
+
+    def __discover_using_registered_streams(self, config, previous_catalog=None):
+        smds = list(self.streams.values()) # smd is StreamMetadata
+        previous_entries = {entry['tap_stream_id']: entry
+                            for entry in (previous_catalog or {}).get('streams', [])}
+        previous = [previous_entries.get(smd.unique_name()) for smd in smds]
+        if self.max_discovery_workers > 1 and len(smds) > 1:
+            # Results are in registration order, regardless of which finishes first
+            with ThreadPoolExecutor(max_workers=self.max_discovery_workers,
+                                    thread_name_prefix='burler-discover') as executor:
+                streams = list(executor.map(functools.partial(self.__with_client, self.__discover_stream),
+                                            smds, previous))
+        else:
+            streams = [self.__with_client(self.__discover_stream, smd, entry) for smd, entry in zip(smds, previous)]
+
+        reused = sum(1 for stream, entry in zip(streams, previous) if entry is not None and stream is entry)
+        if reused:
+            LOGGER.info("Reused %s of %s streams whose fingerprint was unchanged", reused, len(streams))
 
         catalog = {"streams": streams}
         return catalog
 
-    def do_discover(self, config):
+    def do_discover(self, config, previous_catalog=None):
         """
         Main entrypoint for discovery mode.
 
+        Given the `previous_catalog` (a dict), registered streams whose `fingerprint()` is unchanged
+        keep their previous entry rather than loading their schema, and the `selected` metadata of
+        the others is carried over. Returns the catalog that was written.
+
         If @tap.discovery_mode is defined, it will be run first and its streams will be merged into the final catalog.
         If Stream classes have been registered, their collective catalog will be merged into the final catalog.
         All catalogs will have their metadata populated either by the registered methods, or with default values to support field selection (if possible).
@@ -174,87 +248,443 @@ class Tap:
 
         LOGGER.info("Starting discover")
 
-        catalog = {'streams':[]}
-        if self._discovery_override:
-            LOGGER.info("Found decorated discovery method, running discovery mode...")
-            decorator_catalog = self._discover(config)
-            # Validate metadata, write "available" and "automatic" metadata if not provided, etc
-            for stream in decorator_catalog.get('streams', []):
-                stream['metadata'] = self._write_default_metadata(stream['schema'], stream['metadata'])
-            catalog['streams'].extend(decorator_catalog.get('streams', []))
+        # A previous catalog's fingerprints and selections aren't part of the cache key, so
+        # incremental discovery doesn't use the cache (see burler.discovery_cache)
+        discovery_cache = None
+        if self.discovery_cache_ttl and previous_catalog is None:
+            from burler.discovery_cache import DiscoveryCache, cache_key # Only needed when caching
+            discovery_cache = DiscoveryCache(self.discovery_cache_ttl, self.discovery_cache_dir)
+            key = cache_key(config, self.version, self.streams.keys())
+            catalog = discovery_cache.get(key)
+            if catalog is not None:
+                LOGGER.info("Finished discover (from cache)")
+                with self._create_writer() as writer:
+                    writer.write_catalog(catalog)
+                return catalog
 
-        registered_catalog = self.__discover_using_registered_streams(config)
-        catalog['streams'].extend(registered_catalog.get('streams', []))
+        catalog = {'streams':[]}
+        try:
+            if self._discovery_override:
+                LOGGER.info("Found decorated discovery method, running discovery mode...")
+                decorator_catalog = self.__with_client(self._discover, config)
+                # Validate metadata, write "available" and "automatic" metadata if not provided, etc
+                for stream in decorator_catalog.get('streams', []):
+                    stream['schema'] = resolve_refs(stream['schema'])
+                    stream['metadata'] = self._write_default_metadata(stream['schema'], stream['metadata'])
+                catalog['streams'].extend(decorator_catalog.get('streams', []))
+
+            registered_catalog = self.__discover_using_registered_streams(config, previous_catalog)
+            catalog['streams'].extend(registered_catalog.get('streams', []))
+        finally:
+            self.close_clients()
 
         if not catalog['streams']:
             self.log_if_debug(LOGGER.warn, "No streams found for discovery mode. Either override discovery behavior with the decorator @tap.discovery_mode and ensure it's returning a proper catalog, or by registering Stream classes.")
 
         LOGGER.info("Finished discover")
 
-        json.dump(catalog, sys.stdout, indent=2)
-
-    def __sync_using_registered_streams(self, config, catalog, state):
-        def process_record(record):
-            """ Serializes data into Python objects via custom encoder. """
-            if self.json_encoder:
-                rec_str = json.dumps(record, cls=self.json_encoder)
-                rec_dict = json.loads(rec_str)
-                return rec_dict
-            return record
+        if discovery_cache is not None:
+            discovery_cache.put(key, catalog)
 
-        def stream_is_selected(mdata):
-            return mdata.get((), {}).get('selected', False)
-
-        for stream in catalog.streams:
-            stream_name = stream.tap_stream_id
-            mdata = metadata.to_map(stream.metadata)
-            if not stream_is_selected(mdata):
-                LOGGER.info("%s: Skipping - not selected", stream_name)
-                continue
-
-            singer.write_state(state)
-            key_properties = metadata.get(mdata, (), 'table-key-properties')
-            singer.write_schema(stream_name, stream.schema.to_dict(), key_properties)
+        with self._create_writer() as writer:
+            writer.write_catalog(catalog)
+        return catalog
 
-            LOGGER.info("%s: Starting sync", stream_name)
-            # Refactor Note: Start of stream sync
-            smd = self.streams.get(stream.tap_stream_id)
-            if smd is None:
-                continue # We want to allow both a sync decorator and registered streams
+    def _create_writer(self):
+        kwargs = {}
+        if self.output_spill_limit is not None:
+            # Output is written by a thread, spilling to disk past this many bytes (see burler.spill)
+            kwargs = {'spill_memory_limit': self.output_spill_limit, 'spill_dir': self.output_spill_dir}
+        writer = self.writer_class(buffer_size=self.output_buffer_size,
+                                   flush_interval=self.output_flush_interval, **kwargs)
+        writer.instrumentation = self.instrumentation
+        return writer
+
+    def _process_record(self, record):
+        """ Serializes data into Python objects via custom encoder. """
+        if self.json_encoder:
+            if self._coerce_record is None:
+                self._coerce_record = RecordCoercer(self.json_encoder)
+            return self._coerce_record(record)
+        return record
+
+    def __write_stream_state(self, state, stream_state, *tap_stream_ids):
+        """
+        Merges a stream's bookmarks (its own and its sub-streams') into the
+        tap's state and writes it. When streams run concurrently, each one
+        syncs against its own copy of the state, and only its own bookmarks are
+        merged back.
+        """
+        with self._state_lock:
+            for tap_stream_id in tap_stream_ids:
+                bookmark = stream_state.get('bookmarks', {}).get(tap_stream_id)
+                # What a retry restarts the stream from
+                self._checkpoints[tap_stream_id] = copy.deepcopy(bookmark)
+                if stream_state is not state and bookmark is not None:
+                    state.setdefault('bookmarks', {})[tap_stream_id] = copy.deepcopy(bookmark)
+            return self.writer.write_state(state)
+
+    def __restore_checkpoint(self, state, *tap_stream_ids):
+        """ Resets streams' bookmarks to those in the last STATE message written. """
+        with self._state_lock:
+            bookmarks = state.setdefault('bookmarks', {})
+            for tap_stream_id in tap_stream_ids:
+                if tap_stream_id not in self._checkpoints:
+                    continue
+                bookmark = self._checkpoints[tap_stream_id]
+                if bookmark is None:
+                    bookmarks.pop(tap_stream_id, None)
+                else:
+                    bookmarks[tap_stream_id] = copy.deepcopy(bookmark)
+
+    def __take_sync_retry(self):
+        with self._state_lock:
+            if self._retries_left is None:
+                return True
+            if self._retries_left <= 0:
+                return False
+            self._retries_left -= 1
+            return True
+
+    def __sync_stream_with_retries(self, config, stream, mdata, state, concurrent=False, children=()):
+        """
+        Syncs a stream, restarting it from its last checkpoint when it raises an
+        exception that it retries (see StreamMetadata.sync_retry_policy), for as
+        long as it and the tap's `sync_retry_budget` have retries left.
+        """
+        stream_name = stream.tap_stream_id
+        smd = self.streams.get(stream_name)
+        retry_policy = smd.sync_retry_policy() if smd is not None else None
+        tries = 0
+        while True:
+            tries += 1
+            try:
+                return self.__with_client(self.__sync_stream, config, stream, mdata, state,
+                                          concurrent=concurrent, children=children)
+            except Exception as ex: # pylint: disable=broad-except
+                if (retry_policy is None or not retry_policy.should_retry(ex, tries) or
+                        not self.__take_sync_retry()):
+                    raise
+                delay = retry_policy.backoff(tries)
+                LOGGER.warning("%s: Sync failed (try %s of %s), restarting from the last checkpoint in %.1fs: %r",
+                               stream_name, tries, retry_policy.max_tries, delay, ex)
+                self.__restore_checkpoint(state, stream_name, *[child.tap_stream_id for child, _ in children])
+                if smd.setup_retry is not None:
+                    with self._state_lock:
+                        smd.setup_retry(state, ex)
+                time.sleep(delay)
+
+    def __prepare_child(self, stream, mdata, stream_state):
+        """
+        Writes a sub-stream's schema and returns a function that syncs its
+        records for one parent record, on one of the parent's child threads.
+        The function returns the number of records, and the replication key
+        and its greatest value among them.
+        """
+        stream_name = stream.tap_stream_id
+        key_properties = metadata.get(mdata, (), 'table-key-properties')
+        schema = stream.schema.to_dict()
+        self.writer.write_schema(stream_name, schema, key_properties)
+
+        smd = self.streams[stream_name]
+        # Children read their bookmark from a snapshot, only the parent's thread updates the state
+        child_state = copy.deepcopy(stream_state)
+        snapshot = child_state.get('bookmarks', {}).get(stream_name, {})
+        transformer = CompiledTransform(schema, mdata)
+
+        def sync_children(parent_record):
+            with self.__client_lease():
+                return sync_for_parent(parent_record)
+
+        def sync_for_parent(parent_record):
+            # Each call writes to its own copy of the sub-stream's bookmarks, which the parent merges
+            bookmarks = dict(child_state.get('bookmarks', {}))
+            bookmarks[stream_name] = copy.deepcopy(snapshot)
+            call_state = dict(child_state, bookmarks=bookmarks)
             instance = smd.cls()
-            smd.set_context(instance)
-
-            # If we have a bookmark, use it; otherwise use start_date
-            ## META: Write stream into state object's bookmarks map
-            if (instance.replication_method == 'INCREMENTAL' and
-                    not state.get('bookmarks', {}).get(stream.tap_stream_id)):
-                singer.write_bookmark(state,
-                                      stream.tap_stream_id,
-                                      instance.replication_key,
-                                      config.get('start_date'))
-
-            ## META: Check if "sync" is defined
-            with metrics.record_counter(stream.tap_stream_id) as counter:
-                # TODO: This will need to unwrap (StreamClass, record) for sub-streams
-                for record in instance.sync(state):
-                    counter.increment()
-
-                    rec = process_record(record)
-                    with Transformer() as transformer:
-                        rec = transformer.transform(rec, stream.schema.to_dict(), metadata.to_map(stream.metadata))
+            smd.set_context(instance, schema=schema, mdata=mdata, state=call_state)
+            replication_key = getattr(instance, 'replication_key', None)
+            track_bookmark = (getattr(instance, 'replication_method', None) == 'INCREMENTAL' and
+                              isinstance(replication_key, str))
+            count = 0
+            max_bookmark = None
+
+            def write_record(record):
+                nonlocal count, max_bookmark
+                rec = transformer.transform(self._process_record(record))
+                self.writer.write_record(stream_name, rec)
+                count += 1
+                if track_bookmark:
+                    value = rec.get(replication_key)
+                    if value is not None and (max_bookmark is None or value > max_bookmark):
+                        max_bookmark = value
+
+            if aio.is_async_stream(instance):
+                instance.sync = functools.partial(instance.sync, parent=parent_record)
+                aio.run_stream(instance, call_state, write_record,
+                               client_constructor=self.__configured_async_client_constructor)
+            else:
+                for record in instance.sync(call_state, parent_record):
+                    write_record(record)
+
+            written = {key: value for key, value in call_state.get('bookmarks', {}).get(stream_name, {}).items()
+                       if value != snapshot.get(key)}
+            if max_bookmark is not None and bookmark_is_after(max_bookmark, written.get(replication_key)):
+                written[replication_key] = max_bookmark
+            return count, written
+
+        return sync_children, transformer
+
+    def __sync_stream(self, config, stream, mdata, state, concurrent=False, children=()):
+        stream_name = stream.tap_stream_id
+        child_names = [child.tap_stream_id for child, _ in children]
+        with self._state_lock:
+            stream_state = copy.deepcopy(state) if concurrent else state
+
+        state_bytes = self.__write_stream_state(state, stream_state, stream_name, *child_names)
+        key_properties = metadata.get(mdata, (), 'table-key-properties')
+        schema = stream.schema.to_dict()
+        self.writer.write_schema(stream_name, schema, key_properties)
+
+        LOGGER.info("%s: Starting sync", stream_name)
+        smd = self.streams.get(stream.tap_stream_id)
+        if smd is None:
+            return # We want to allow both a sync decorator and registered streams
+        instance = smd.cls()
+        smd.set_context(instance, schema=schema, mdata=mdata, state=stream_state)
 
-                    singer.write_record(stream.tap_stream_id, rec)
+        replication_method = getattr(instance, 'replication_method', None)
 
-                ## META: Bookmark stratey comes in here
-                if instance.replication_method == "INCREMENTAL":
-                    singer.write_state(state)
+        # If we have a bookmark, use it; otherwise use start_date
+        ## META: Write stream into state object's bookmarks map
+        if (replication_method == 'INCREMENTAL' and
+                not stream_state.get('bookmarks', {}).get(stream.tap_stream_id)):
+            singer.write_bookmark(stream_state,
+                                  stream.tap_stream_id,
+                                  instance.replication_key,
+                                  config.get('start_date'))
+
+        # Any strategy other than end_of_sync has Burler track the replication key and own the bookmark
+        # (Looked up statically, so a strategy declared on the class isn't bound as a method)
+        bookmark_strategy = inspect.getattr_static(instance, 'bookmark_strategy', end_of_sync)
+        replication_key = getattr(instance, 'replication_key', None)
+        track_bookmark = (replication_method == 'INCREMENTAL' and
+                          isinstance(replication_key, str) and
+                          callable(bookmark_strategy))
+        progress = Progress()
+        progress.state_bytes = state_bytes
+        max_bookmark = None
+        child_bookmarks = {}
+
+        def advance_bookmark(value):
+            nonlocal max_bookmark
+            if value is not None and (max_bookmark is None or value > max_bookmark):
+                max_bookmark = value
+
+        def checkpoint():
+            bookmarks = stream_state.get('bookmarks', {})
+            current = bookmarks.get(stream_name, {}).get(replication_key)
+            if max_bookmark is not None and bookmark_is_after(max_bookmark, current):
+                singer.write_bookmark(stream_state, stream_name, replication_key, max_bookmark)
+            for child_name, child_values in child_bookmarks.items():
+                for child_key, child_bookmark in child_values.items():
+                    if bookmark_is_after(child_bookmark, bookmarks.get(child_name, {}).get(child_key)):
+                        singer.write_bookmark(stream_state, child_name, child_key, child_bookmark)
+            progress.state_bytes = self.__write_stream_state(state, stream_state, stream_name, *child_names)
+            progress.reset()
+
+        ## META: Check if "sync" is defined
+        # Compile the schema and metadata once, rather than once per record
+        with contextlib.ExitStack() as stack:
+            counter = stack.enter_context(metrics.record_counter(stream.tap_stream_id))
+            transformer = stack.enter_context(CompiledTransform(schema, mdata))
+
+            fanout = None
+            child_counters = []
+            if children:
+                # Each sub-stream's schema follows its parent's, before any of their records
+                child_syncs = []
+                for child, child_mdata in children:
+                    sync_children, child_transformer = self.__prepare_child(child, child_mdata, stream_state)
+                    stack.enter_context(child_transformer)
+                    child_syncs.append(sync_children)
+                    child_counters.append(stack.enter_context(metrics.record_counter(child.tap_stream_id)))
+
+                def on_complete(value, results):
+                    # The parent's bookmark only passes records whose children have all been synced
+                    advance_bookmark(value)
+                    for name, child_counter, (count, written) in zip(child_names, child_counters, results):
+                        child_counter.increment(count)
+                        for key, child_bookmark in written.items():
+                            if bookmark_is_after(child_bookmark, child_bookmarks.get(name, {}).get(key)):
+                                child_bookmarks.setdefault(name, {})[key] = child_bookmark
+
+                fanout = stack.enter_context(ChildFanout(
+                    child_syncs, on_complete,
+                    max_workers=getattr(instance, 'max_concurrent_children', DEFAULT_MAX_CONCURRENT_CHILDREN),
+                    max_pending=getattr(instance, 'max_pending_parents', None)))
+
+            # See burler.instrumentation, a sample of records is timed through each stage
+            stage_timer = self.instrumentation.stream_timer(stream_name) if self.instrumentation else None
+
+            # See burler.validation, the order of every nth replication key value is followed
+            monitor = None
+            if (self.bookmark_monitor_sample and replication_method == 'INCREMENTAL' and
+                    isinstance(replication_key, str)):
+                from burler.validation import BookmarkMonitor
+                def log_change(old_order, new_order, old_order_length, last_bookmark, bookmark, record):
+                    LOGGER.debug("%s: %s went from %s to %s after %s values (%r -> %r)", stream_name,
+                                 replication_key, old_order, new_order, old_order_length, last_bookmark, bookmark)
+                monitor = BookmarkMonitor(sample_every=self.bookmark_monitor_sample, on_change=log_change)
+
+            def write_record(record):
+                timed = stage_timer is not None and stage_timer.start_record()
+                counter.increment()
+
+                rec = transformer.transform(self._process_record(record))
+                if timed:
+                    stage_timer.lap('transform')
+
+                record_bytes = self.writer.write_record(stream.tap_stream_id, rec)
+                if timed:
+                    stage_timer.lap('write')
+
+                if monitor is not None:
+                    monitor.track(rec.get(replication_key), rec)
+
+                value = rec.get(replication_key) if track_bookmark else None
+                if fanout is not None:
+                    fanout.submit(record, value)
+                else:
+                    advance_bookmark(value)
+
+                if track_bookmark:
+                    progress.records += 1
+                    progress.bytes += record_bytes
+                    if bookmark_strategy(progress):
+                        checkpoint()
+                if timed:
+                    stage_timer.end_record()
+
+            windowed = is_windowed_stream(instance) and isinstance(replication_key, str)
+            if aio.is_async_stream(instance):
+                aio.run_stream(instance, stream_state, write_record,
+                               client_constructor=self.__configured_async_client_constructor)
+            elif windowed:
+                if instance.bookmark is None:
+                    raise ConfigValidationException(
+                        "{}: A windowed stream needs a start, either a '{}' bookmark in the state "
+                        "or a 'start_date' in the config.".format(stream_name, replication_key))
+                # See burler.windows, the bookmark moves to the end of each window once it's emitted
+                for window_end, records in sync_windows(instance, stream_state, instance.bookmark,
+                                                        bind=functools.partial(self.__bind_client, smd)):
+                    for record in records:
+                        write_record(record)
+                    if fanout is not None:
+                        fanout.finish()
+                    window_end = singer.utils.strftime(window_end)
+                    if bookmark_is_after(window_end, max_bookmark):
+                        max_bookmark = window_end
+                    checkpoint()
+            else:
+                for record in instance.sync(stream_state):
+                    write_record(record)
+
+            if fanout is not None:
+                fanout.finish()
+
+            if track_bookmark or windowed or child_bookmarks:
+                checkpoint()
+            elif replication_method == "INCREMENTAL":
+                self.__write_stream_state(state, stream_state, stream_name)
+
+            LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter.value)
+            if monitor is not None:
+                LOGGER.info("%s: %s ordering - %s", stream_name, replication_key, monitor.summary())
+                if monitor.totals.get('DESC'):
+                    LOGGER.warning("%s: Records were not in ascending %s order, bookmarks written during "
+                                   "the sync may skip records if it's interrupted", stream_name, replication_key)
+            smd.throttle_stats.log(stream_name)
+            for child_name, child_counter in zip(child_names, child_counters):
+                LOGGER.info("%s: Completed sync (%s rows)", child_name, child_counter.value)
+                self.streams[child_name].throttle_stats.log(child_name)
 
-                LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter.value)
-            # Refactor Note: End of stream sync
+    def __sync_using_registered_streams(self, config, catalog, state):
+        def stream_is_selected(mdata):
+            return mdata.get((), {}).get('selected', False)
 
-        singer.write_state(state)
+        selected = []
+        if hasattr(catalog, 'selected_streams'):
+            # A LazyCatalog, which only parses the selected streams
+            selected = [(stream, metadata.to_map(stream.metadata)) for stream in catalog.selected_streams()]
+            LOGGER.info("Skipping %s streams - not selected", len(catalog) - len(selected))
+        else:
+            for stream in catalog.streams:
+                mdata = metadata.to_map(stream.metadata)
+                if not stream_is_selected(mdata):
+                    LOGGER.info("%s: Skipping - not selected", stream.tap_stream_id)
+                    continue
+                selected.append((stream, mdata))
+
+        # Sub-streams are synced by their parent's stream, see burler.substreams
+        selected_names = {stream.tap_stream_id for stream, _ in selected}
+        children = {}
+        top_level = []
+        for stream, mdata in selected:
+            smd = self.streams.get(stream.tap_stream_id)
+            parent_name = parent_tap_stream_id(smd.cls, self.streams) if smd is not None else None
+            if parent_name is None:
+                top_level.append((stream, mdata))
+            elif parent_name not in selected_names:
+                LOGGER.warning("%s: Skipping - parent stream %s not selected", stream.tap_stream_id, parent_name)
+            elif parent_tap_stream_id(self.streams[parent_name].cls, self.streams) is not None:
+                LOGGER.warning("%s: Skipping - sub-streams of sub-streams are not supported", stream.tap_stream_id)
+            else:
+                children.setdefault(parent_name, []).append((stream, mdata))
+
+        self._state_lock = threading.RLock()
+        self._checkpoints = {}
+        self._retries_left = self.sync_retry_budget
+        # A stream that fails doesn't stop the others, the failures are raised together at the end
+        errors = {}
+        if self.max_concurrent_streams > 1 and len(top_level) > 1:
+            errors = self.__sync_streams_concurrently(config, top_level, children, state)
+        else:
+            for stream, mdata in top_level:
+                try:
+                    self.__sync_stream_with_retries(config, stream, mdata, state,
+                                                    children=children.get(stream.tap_stream_id, ()))
+                except Exception as ex: # pylint: disable=broad-except
+                    LOGGER.exception("%s: Sync failed", stream.tap_stream_id)
+                    errors[stream.tap_stream_id] = ex
+
+        self.writer.write_state(state)
+        if errors:
+            for stream_name, ex in errors.items():
+                LOGGER.critical("%s: %r", stream_name, ex)
+            raise StreamSyncFailures(errors) from next(iter(errors.values()))
         LOGGER.info("Finished sync")
 
+    def __sync_streams_concurrently(self, config, selected, children, state):
+        """
+        Runs each selected stream on a pool of `max_concurrent_streams` threads.
+        The writer serializes whole messages, so records never interleave.
+        Returns the exceptions of the streams that failed, by tap_stream_id.
+        """
+        LOGGER.info("Syncing %s streams with up to %s at a time", len(selected), self.max_concurrent_streams)
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_streams,
+                                thread_name_prefix='burler-stream') as executor:
+            futures = {executor.submit(self.__sync_stream_with_retries, config, stream, mdata, state, concurrent=True,
+                                       children=children.get(stream.tap_stream_id, ())): stream.tap_stream_id
+                       for stream, mdata in selected}
+            wait(futures)
+        errors = {}
+        for future, stream_name in futures.items():
+            if future.exception() is not None:
+                LOGGER.error("%s: Sync failed", stream_name, exc_info=future.exception())
+                errors[stream_name] = future.exception()
+        return errors
+
     def do_sync(self, config, catalog, state):
         """
         Main entrypoint for sync mode.
@@ -273,9 +703,16 @@ class Tap:
             LOGGER.info("Found decorated sync method, running sync mode...")
             # TODO: Is it confusing to modify the catalog? If a stream class is registered, it should take precedence, I think
             non_registered_catalog = {'streams': [s for s in catalog['streams'] if stream.tap_stream_id in self.streams]}
-            self._sync(config, non_registered_catalog, state)
+            self.__with_client(self._sync, config, non_registered_catalog, state)
 
-        self.__sync_using_registered_streams(config, catalog, state)
+        # Flush whatever is buffered, even if a stream raises
+        try:
+            with self._create_writer() as self.writer:
+                self.__sync_using_registered_streams(config, catalog, state)
+        finally:
+            self.close_clients()
+            if self.instrumentation is not None:
+                self.instrumentation.emit()
 
     def load_streams(self, module_name):
         """
@@ -302,6 +739,8 @@ class Tap:
     #     function that gets assigned at decorator evaluation time (post Tap
     #     object creation.
     __client = None
+    __client_pool = None
+    __throttle_stats = None
     __configured_client_constructor = None
     def __get_client(self):
         if self.__configured_client_constructor:
@@ -309,11 +748,73 @@ class Tap:
         raise NoClientConfigured("No client configured, configure a client object using @tap.create_client")
 
     client = property(__get_client)
-    def create_client(self, func):
-        # Decorator that grabs the client, given a config
+    def create_client(self, func=None, pool_size=None, close=None, checkout_timeout=None,
+                      rate_limiter=None, retry=None):
+        # Decorator that grabs the client, given a config. With a `pool_size`, e.g.,
+        # `@tap.create_client(pool_size=8)`, each concurrent task is given its own
+        # client from a burler.clients.ClientPool. With a `rate_limiter` or `retry`
+        # policy, calls to the client are throttled (see burler.throttling).
+        if func is None:
+            return functools.partial(self.create_client, pool_size=pool_size, close=close,
+                                     checkout_timeout=checkout_timeout,
+                                     rate_limiter=rate_limiter, retry=retry)
+        make_client = lambda: func(self.config)
+        if rate_limiter is not None or retry is not None:
+            from burler.throttling import ThrottledClient, ThrottleStats # Only needed when throttling
+            self.__throttle_stats = ThrottleStats()
+            make_client = lambda: ThrottledClient(func(self.config), rate_limiter, retry, self.__throttle_stats)
+        if pool_size is not None:
+            from burler.clients import ClientPool # Only needed when pooling
+            # Without a checkout_timeout, the pool's default applies
+            timeout = {} if checkout_timeout is None else {'checkout_timeout': checkout_timeout}
+            self.__client_pool = ClientPool(make_client, pool_size, close=close, **timeout)
+            self.__configured_client_constructor = self.__client_pool.current
+            return func
         def get_client():
             if self.__client is None:
-                self.__client = func(self.config)
+                self.__client = make_client()
             return self.__client
         self.__configured_client_constructor = get_client
         return func
+
+    def __client_lease(self):
+        """ Checks out a pooled client for the current thread, for `tap.client` to return. """
+        if self.__client_pool is None:
+            return contextlib.nullcontext()
+        return self.__client_pool.lease()
+
+    def __with_client(self, func, *args, **kwargs):
+        with self.__client_lease():
+            return func(*args, **kwargs)
+
+    @contextlib.contextmanager
+    def __bind_client(self, smd, instance):
+        """ Gives a window running on another thread a copy of the stream with its own client. """
+        with self.__client_lease():
+            if self.__client_pool is None or aio.is_async_stream(instance):
+                yield instance
+            else:
+                window_instance = copy.copy(instance)
+                window_instance.client = smd.bind_client(window_instance, self.client)
+                yield window_instance
+
+    def close_clients(self):
+        """
+        Closes a pool's clients, which are created again if they're needed, and
+        logs the time throttled client calls spent waiting vs. working.
+        """
+        if self.__client_pool is not None:
+            self.__client_pool.close()
+        if self.__throttle_stats is not None:
+            self.__throttle_stats.log('client')
+
+    __configured_async_client_constructor = None
+    def has_async_client(self):
+        return self.__configured_async_client_constructor is not None
+
+    def create_async_client(self, func):
+        # Decorator for a function (or coroutine function) that creates a client
+        # given a config. Unlike @tap.create_client, a client is created for each
+        # async stream, on that stream's event loop, and closed when it finishes.
+        self.__configured_async_client_constructor = lambda: func(self.config)
+        return func
@@ -0,0 +1,331 @@
+"""
+Rate limiting and retries for client calls, so that a tap runs at its
+source's quota rather than sleeping a fixed, conservative delay:
+
+    @tap.create_client(rate_limiter=RateLimiter(100, per=60), retry=RetryPolicy(max_tries=5))
+    def create_client(config):
+        return FooClient(config['api_key'])
+
+The client's public methods are then called through `throttle`. Each call
+takes a token from the `RateLimiter`, which is shared by every stream (and
+every pooled client), and waits when there isn't one. A call that raises a
+transient error is retried with jittered exponential backoff. When the error
+says when to retry (a 429's Retry-After header), the whole limiter is paused
+until then, so other streams don't spend their retries on the same limit.
+
+Streams may declare their own with `rate_limiter` and `retry_policy` class
+attributes (or `@stream` options), for endpoints with quotas of their own.
+
+A client method that's a generator (or async generator), e.g., one that
+paginates, is throttled as it's iterated: a token is taken before each item
+it yields, so it should yield a page per request rather than each record.
+An error raised before the first item is retried by calling it again, but
+one raised after that isn't, since the generator can't be resumed.
+
+Time spent waiting on the limiter or backing off, and time spent in calls,
+are logged as `client_throttled` and `client_working` metrics.
+"""
+import time
+import random
+import inspect
+import asyncio
+import datetime
+import threading
+import functools
+import email.utils
+
+import singer.logger as logging
+from singer import metrics
+
+LOGGER = logging.get_logger()
+
+# Client methods that aren't requests to the source
+UNTHROTTLED = frozenset(['close', 'aclose'])
+
+class RateLimiter():
+    """
+    A token bucket allowing `rate` calls `per` seconds, with bursts of up to
+    `burst` calls (`rate`, by default). Callers that find it empty reserve
+    the next token and wait for it, so they're served in order.
+    """
+    def __init__(self, rate, per=1.0, burst=None):
+        if rate <= 0 or per <= 0:
+            raise ValueError("Rate limit must be positive, got {} per {}s".format(rate, per))
+        self.rate = rate / per # Tokens per second
+        self.capacity = burst if burst is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """ Takes `tokens`, returning how many seconds to wait before using them. """
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            self._tokens -= tokens
+            return max(0.0, self._updated - now) + max(0.0, -self._tokens / self.rate)
+
+    def defer(self, seconds):
+        """ Hands out no tokens for `seconds`, e.g., when the source says to retry after that long. """
+        with self._lock:
+            resume = time.monotonic() + seconds
+            if resume > self._updated:
+                self._updated = resume
+                self._tokens = min(self._tokens, 0)
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+def _status_code(exception):
+    response = getattr(exception, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+    return status or getattr(exception, 'status_code', None) or getattr(exception, 'status', None)
+
+def is_transient(exception):
+    """ Connection errors, timeouts, and HTTP errors with a 429 or 5xx status. """
+    if isinstance(exception, (ConnectionError, TimeoutError)):
+        return True
+    status = _status_code(exception)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+def retry_after(exception):
+    """ The seconds to wait from a Retry-After header (or `retry_after` attribute), if there is one. """
+    value = getattr(exception, 'retry_after', None)
+    if value is None:
+        headers = getattr(getattr(exception, 'response', None), 'headers', None) or {}
+        value = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+class RetryPolicy():
+    """
+    Retries calls that raise an exception matching `retry_on` (an exception
+    class or tuple, or a predicate, `is_transient` by default), up to
+    `max_tries` in total, with full-jitter exponential backoff.
+    """
+    def __init__(self, retry_on=is_transient, max_tries=5, base_delay=1.0, factor=2.0, max_delay=60.0):
+        self.retry_on = retry_on
+        self.max_tries = max_tries
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+
+    def should_retry(self, exception, tries):
+        if tries >= self.max_tries:
+            return False
+        if isinstance(self.retry_on, (type, tuple)):
+            return isinstance(exception, self.retry_on)
+        return bool(self.retry_on(exception))
+
+    def backoff(self, tries):
+        return random.uniform(0, min(self.max_delay, self.base_delay * self.factor ** (tries - 1)))
+
+class ThrottleStats():
+    """ Time spent throttled (waiting on the limiter or backing off) vs. working, across calls. """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+        self.working_seconds = 0.0
+
+    def record(self, throttled, working, retried=False):
+        with self._lock:
+            self.calls += 1
+            self.retries += int(retried)
+            self.throttled_seconds += throttled
+            self.working_seconds += working
+
+    def to_dict(self):
+        with self._lock:
+            return {'calls': self.calls,
+                    'retries': self.retries,
+                    'throttled_seconds': round(self.throttled_seconds, 3),
+                    'working_seconds': round(self.working_seconds, 3)}
+
+    def log(self, endpoint):
+        """ Logs the totals as metrics and starts counting again. """
+        stats = self.to_dict()
+        if not stats['calls']:
+            return
+        tags = {'endpoint': endpoint, 'calls': stats['calls'], 'retries': stats['retries']}
+        metrics.log(LOGGER, metrics.Point('timer', 'client_throttled', stats['throttled_seconds'], tags))
+        metrics.log(LOGGER, metrics.Point('timer', 'client_working', stats['working_seconds'], tags))
+        with self._lock:
+            self.reset()
+
+def _on_error(exception, tries, func, limiter, retry, stats, throttled, started):
+    """ Records a failed call and returns how long to back off, or None to raise. """
+    will_retry = retry is not None and retry.should_retry(exception, tries)
+    stats.record(throttled, time.monotonic() - started, retried=will_retry)
+    if not will_retry:
+        return None
+    wait = retry_after(exception)
+    if wait is not None and limiter is not None:
+        limiter.defer(wait) # Everyone waits, the wait is taken when the limiter is next acquired
+        wait = 0.0
+    elif wait is None:
+        wait = retry.backoff(tries)
+    LOGGER.warning("%s failed (try %s of %s), retrying in %.1fs: %s",
+                   getattr(func, '__qualname__', func), tries, retry.max_tries, wait, exception)
+    return wait
+
+def throttle(func, limiter=None, retry=None, stats=None):
+    """
+    Wraps a function (or coroutine function, generator or async generator
+    function) with a rate limiter and retry policy.
+    """
+    stats = stats or ThrottleStats()
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def throttled_async_generator(*args, **kwargs):
+            tries = 0
+            backoff = 0.0
+            iterator = None
+            yielded = False
+            while True:
+                if backoff:
+                    await asyncio.sleep(backoff)
+                throttled = backoff + (await limiter.acquire_async() if limiter is not None else 0.0)
+                started = time.monotonic()
+                try:
+                    if iterator is None:
+                        iterator = func(*args, **kwargs)
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    stats.record(throttled, time.monotonic() - started)
+                    return
+                except Exception as ex: # pylint: disable=broad-except
+                    tries += 1
+                    # Only called again if it hasn't yielded, since it can't be resumed
+                    backoff = _on_error(ex, tries, func, limiter, None if yielded else retry,
+                                        stats, throttled, started)
+                    if backoff is None:
+                        raise
+                    iterator = None
+                    continue
+                stats.record(throttled, time.monotonic() - started)
+                yielded, backoff = True, 0.0
+                yield item
+        return throttled_async_generator
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def throttled_generator(*args, **kwargs):
+            tries = 0
+            backoff = 0.0
+            iterator = None
+            yielded = False
+            while True:
+                if backoff:
+                    time.sleep(backoff)
+                throttled = backoff + (limiter.acquire() if limiter is not None else 0.0)
+                started = time.monotonic()
+                try:
+                    if iterator is None:
+                        iterator = func(*args, **kwargs)
+                    item = next(iterator)
+                except StopIteration:
+                    stats.record(throttled, time.monotonic() - started)
+                    return
+                except Exception as ex: # pylint: disable=broad-except
+                    tries += 1
+                    # Only called again if it hasn't yielded, since it can't be resumed
+                    backoff = _on_error(ex, tries, func, limiter, None if yielded else retry,
+                                        stats, throttled, started)
+                    if backoff is None:
+                        raise
+                    iterator = None
+                    continue
+                stats.record(throttled, time.monotonic() - started)
+                yielded, backoff = True, 0.0
+                yield item
+        return throttled_generator
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def throttled_async(*args, **kwargs):
+            tries = 0
+            backoff = 0.0
+            while True:
+                tries += 1
+                if backoff:
+                    await asyncio.sleep(backoff)
+                throttled = backoff + (await limiter.acquire_async() if limiter is not None else 0.0)
+                started = time.monotonic()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as ex: # pylint: disable=broad-except
+                    backoff = _on_error(ex, tries, func, limiter, retry, stats, throttled, started)
+                    if backoff is None:
+                        raise
+                    continue
+                stats.record(throttled, time.monotonic() - started)
+                return result
+        return throttled_async
+
+    @functools.wraps(func)
+    def throttled_call(*args, **kwargs):
+        tries = 0
+        backoff = 0.0
+        while True:
+            tries += 1
+            if backoff:
+                time.sleep(backoff)
+            throttled = backoff + (limiter.acquire() if limiter is not None else 0.0)
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as ex: # pylint: disable=broad-except
+                backoff = _on_error(ex, tries, func, limiter, retry, stats, throttled, started)
+                if backoff is None:
+                    raise
+                continue
+            stats.record(throttled, time.monotonic() - started)
+            return result
+    return throttled_call
+
+class ThrottledClient():
+    """
+    Wraps a client so that calling its public methods is throttled. Other
+    attributes, and `close`, pass through.
+    """
+    def __init__(self, client, limiter=None, retry=None, stats=None):
+        self._client = client
+        self._limiter = limiter
+        self._retry = retry
+        self._stats = stats or ThrottleStats()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if (name.startswith('_') or name in UNTHROTTLED or
+                not callable(attr) or inspect.isclass(attr)):
+            return attr
+        return throttle(attr, self._limiter, self._retry, self._stats)
+
+    def __repr__(self):
+        return "ThrottledClient({!r})".format(self._client)
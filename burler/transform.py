@@ -0,0 +1,348 @@
+"""
+Compiles a stream's schema and metadata into a reusable record transform.
+
+`singer.Transformer` walks the schema dict and looks up metadata for every
+field of every record. Since the schema and metadata of a stream don't change
+during a sync, we can do that walk once, when the stream starts, and build a
+tree of closures that only has to look at the data.
+
+The output matches `Transformer.transform`. When a record does not match the
+schema, it is handed to a fresh `Transformer` so that the `SchemaMismatch`
+raised is exactly the one singer would have raised.
+"""
+import re
+import decimal
+import datetime
+
+import singer.logger as logging
+from singer.utils import strftime
+from singer.transform import (Transformer,
+                              breadcrumb_path,
+                              string_to_datetime,
+                              unix_seconds_to_datetime,
+                              unix_milliseconds_to_datetime,
+                              NO_INTEGER_DATETIME_PARSING,
+                              UNIX_SECONDS_INTEGER_DATETIME_PARSING,
+                              VALID_DATETIME_FORMATS)
+
+LOGGER = logging.get_logger()
+
+_FAILED = (False, None)
+_PATTERN_CACHE_SIZE = 1024
+
+## Type converters
+## Each takes a value and returns (success, transformed_value), like Transformer._transform
+def _transform_null(data):
+    if data is None or data == "":
+        return True, None
+    return _FAILED
+
+def _transform_string(data):
+    if data is not None:
+        try:
+            return True, str(data)
+        except:
+            return _FAILED
+    return _FAILED
+
+def _transform_integer(data):
+    if isinstance(data, str):
+        data = data.replace(",", "")
+    try:
+        return True, int(data)
+    except:
+        return _FAILED
+
+def _transform_number(data):
+    if isinstance(data, str):
+        data = data.replace(",", "")
+    try:
+        return True, float(data)
+    except:
+        return _FAILED
+
+def _transform_boolean(data):
+    if isinstance(data, str) and data.lower() == "false":
+        return True, False
+    try:
+        return True, bool(data)
+    except:
+        return _FAILED
+
+def _transform_decimal(data):
+    if data is None:
+        return _FAILED
+    if isinstance(data, (str, float, int)):
+        try:
+            return True, str(decimal.Decimal(str(data)))
+        except:
+            return _FAILED
+    elif isinstance(data, decimal.Decimal):
+        try:
+            if data.is_snan():
+                return True, 'NaN'
+            return True, str(data)
+        except:
+            return _FAILED
+    return _FAILED
+
+# Strict RFC 3339 timestamps, which the standard library can parse much faster than dateutil
+_RFC3339 = re.compile(r'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d{1,6})?(Z|[+-]\d\d:\d\d)?$')
+
+def _string_to_datetime(value):
+    """ Equivalent to singer's string_to_datetime, with a fast path for RFC 3339 strings. """
+    if isinstance(value, str) and _RFC3339.match(value):
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return string_to_datetime(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        else:
+            parsed = parsed.astimezone(datetime.timezone.utc)
+        return strftime(parsed)
+    return string_to_datetime(value)
+
+def _datetime_converter(integer_datetime_fmt):
+    if integer_datetime_fmt not in VALID_DATETIME_FORMATS:
+        raise Exception("Invalid integer datetime parsing option")
+
+    if integer_datetime_fmt == NO_INTEGER_DATETIME_PARSING:
+        parse = _string_to_datetime
+    else:
+        from_int = (unix_seconds_to_datetime
+                    if integer_datetime_fmt == UNIX_SECONDS_INTEGER_DATETIME_PARSING
+                    else unix_milliseconds_to_datetime)
+        def parse(value):
+            try:
+                return from_int(value)
+            except:
+                return _string_to_datetime(value)
+
+    def transform_datetime(data):
+        if data is None or data == "":
+            return _FAILED
+        data = parse(data)
+        if data is None:
+            return _FAILED
+        return True, data
+    return transform_datetime
+
+_SIMPLE_TYPES = {'null': _transform_null,
+                 'string': _transform_string,
+                 'integer': _transform_integer,
+                 'number': _transform_number,
+                 'boolean': _transform_boolean}
+
+class CompiledTransform():
+    """
+    A record transform specialized to a single schema and metadata map.
+
+    Usage mirrors `singer.Transformer`, except the schema and metadata are
+    provided once up front:
+
+        with CompiledTransform(schema, mdata) as transformer:
+            for record in records:
+                write(transformer.transform(record))
+    """
+    def __init__(self, schema, metadata=None, integer_datetime_fmt=NO_INTEGER_DATETIME_PARSING):
+        self.schema = schema
+        self.metadata = metadata
+        self.integer_datetime_fmt = integer_datetime_fmt
+        self.removed = set()
+        self.filtered = set()
+
+        self._transform_datetime = _datetime_converter(integer_datetime_fmt)
+        self._filter = self._compile_filter(metadata, ()) if metadata else None
+        self._transform = self._compile(schema, ())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.log_warning()
+
+    def log_warning(self):
+        if self.filtered:
+            LOGGER.debug("Filtered %s paths during transforms "
+                         "as they were unsupported or not selected:\n\t%s",
+                         len(self.filtered),
+                         "\n\t".join(sorted(self.filtered)))
+        if self.removed:
+            LOGGER.debug("Removed %s paths during transforms:\n\t%s",
+                         len(self.removed),
+                         "\n\t".join(sorted(self.removed)))
+
+    def transform(self, data):
+        if self._filter is not None:
+            data = self._filter(data)
+
+        success, transformed_data = self._transform(data)
+        if not success:
+            # Let singer build (and raise) the SchemaMismatch with its error paths
+            with Transformer(self.integer_datetime_fmt) as transformer:
+                return transformer.transform(data, self.schema, self.metadata)
+        return transformed_data
+
+    __call__ = transform
+
+    ## Metadata filtering
+    def _compile_filter(self, mdata, parent):
+        """
+        Builds the equivalent of `Transformer.filter_data_by_metadata` for the
+        breadcrumb `parent`. Returns None if nothing at or below `parent` can
+        be filtered, so the caller can skip the subtree entirely.
+        """
+        depth = len(parent)
+        descendants = [b for b in mdata if len(b) > depth and b[:depth] == parent]
+        if not descendants:
+            return None
+
+        dropped = {}
+        children = {}
+        seen = set()
+        for breadcrumb in descendants:
+            if breadcrumb[depth] != 'properties' or len(breadcrumb) < depth + 2:
+                continue
+            field_name = breadcrumb[depth + 1]
+            if field_name in seen:
+                continue
+            seen.add(field_name)
+            field_breadcrumb = parent + ('properties', field_name)
+            field_mdata = mdata.get(field_breadcrumb, {})
+            inclusion = field_mdata.get('inclusion')
+            if inclusion == 'automatic':
+                continue
+            if field_mdata.get('selected') is False or inclusion == 'unsupported':
+                dropped[field_name] = breadcrumb_path(field_breadcrumb)
+            else:
+                child = self._compile_filter(mdata, field_breadcrumb)
+                if child is not None:
+                    children[field_name] = child
+        items = self._compile_filter(mdata, parent + ('items',))
+
+        if not dropped and not children and items is None:
+            return None
+
+        dropped = list(dropped.items())
+        children = list(children.items())
+        filtered = self.filtered
+        def filter_data(data):
+            if isinstance(data, dict):
+                for field_name, path in dropped:
+                    if field_name in data:
+                        del data[field_name]
+                        filtered.add(path)
+                for field_name, child in children:
+                    if field_name in data:
+                        data[field_name] = child(data[field_name])
+            elif isinstance(data, list) and items is not None:
+                data = [items(d) for d in data]
+            return data
+        return filter_data
+
+    ## Schema transformation
+    def _compile(self, schema, path):
+        """
+        Builds the equivalent of `Transformer.transform_recur` for `schema`.
+        The returned function takes the data and returns (success, value).
+        """
+        if "anyOf" in schema:
+            return self._compile_anyof(schema["anyOf"], path)
+
+        if "type" not in schema:
+            return lambda data: (True, data)
+
+        types = schema["type"]
+        if not isinstance(types, list):
+            types = [types]
+        if "null" in types:
+            types = [t for t in types if t != "null"] + ["null"]
+
+        converters = [self._compile_type(typ, schema, path) for typ in types]
+        if len(converters) == 1:
+            return converters[0]
+
+        def transform_types(data):
+            for converter in converters:
+                result = converter(data)
+                if result[0]:
+                    return result
+            return _FAILED
+        return transform_types
+
+    def _compile_anyof(self, subschemas, path):
+        compiled = [self._compile(s, path) for s in subschemas]
+        def transform_anyof(data):
+            for converter in compiled:
+                result = converter(data)
+                if result[0]:
+                    return result
+            return _FAILED
+        return transform_anyof
+
+    def _compile_type(self, typ, schema, path):
+        if typ == "string" and schema.get("format") == "date-time":
+            return self._transform_datetime
+        if typ == "string" and schema.get("format") == "singer.decimal":
+            return _transform_decimal
+        if typ == "object":
+            return self._compile_object(schema.get("properties", {}),
+                                        schema.get("patternProperties"),
+                                        path)
+        if typ == "array":
+            return self._compile_array(schema["items"], path)
+        return _SIMPLE_TYPES.get(typ, lambda data: _FAILED)
+
+    def _compile_object(self, properties, pattern_properties, path):
+        if properties == {} and not pattern_properties:
+            return lambda data: (True, data) if isinstance(data, dict) else (False, data)
+
+        compiled = {key: self._compile(sub_schema, path + (key,))
+                    for key, sub_schema in properties.items()}
+        patterns = [(re.compile(pattern), sub_schema)
+                    for pattern, sub_schema in (pattern_properties or {}).items()]
+        pattern_cache = {}
+        removed = self.removed
+
+        def lookup_pattern(key):
+            # Memoize the matching pattern schemas for each key seen, bounded
+            # so that sources keyed by IDs don't grow the cache forever
+            if key in pattern_cache:
+                return pattern_cache[key]
+            matches = [sub_schema for regex, sub_schema in patterns if regex.match(key)]
+            converter = self._compile_anyof(matches, path + (key,)) if matches else None
+            if len(pattern_cache) < _PATTERN_CACHE_SIZE:
+                pattern_cache[key] = converter
+            return converter
+
+        def transform_object(data):
+            if not isinstance(data, dict):
+                return False, data
+            result = {}
+            success = True
+            for key, value in data.items():
+                converter = compiled.get(key)
+                if converter is None and patterns:
+                    converter = lookup_pattern(key)
+                if converter is None:
+                    removed.add(".".join(map(str, path + (key,))))
+                    continue
+                ok, result[key] = converter(value)
+                success = success and ok
+            return success, result
+        return transform_object
+
+    def _compile_array(self, items_schema, path):
+        converter = self._compile(items_schema, path)
+        def transform_array(data):
+            if not isinstance(data, list):
+                return False, data
+            result = []
+            success = True
+            for row in data:
+                ok, value = converter(row)
+                success = success and ok
+                result.append(value)
+            return success, result
+        return transform_array
@@ -1,72 +1,199 @@
 """
-Set of validation methods to assert some consistencies with Singer-related items.
+Set of validation methods to assert some consistencies with Singer-related items,
+e.g., that a bookmark doesn't ever go backwards.
 
-Furute Work: Figure out how to use this to instrument singer.write_record(), etc.
+`BookmarkMonitor` follows the order of a stream's replication key values,
+keeping the runs of ascending, descending and equal values. It's cheap enough
+to leave on: ISO 8601 strings in the same format as the previous one are
+compared as strings (which orders them the same as their datetimes), only
+parsing when the format changes, and it can look at a sample of the records.
 
-e.g., that a bookmark doesn't ever go backwards
+`ensure_ordering` asserts the order of the records a function returns:
+
+    class Tickets(Stream):
+        @ensure_ordering('updated_at', 'ASC')
+        def sync(self, state):
+            ...
 """
+import re
+import inspect
+import functools
+from operator import itemgetter
+from collections import deque, Counter
+
+import singer.utils
+import singer.logger as logging
+
+from burler.exceptions import OrderingViolation
+
+LOGGER = logging.get_logger()
+
+ASC = 'ASC'
+DESC = 'DESC'
+EQUAL = 'EQUAL'
+
+DEFAULT_MAX_RUNS = 1000
 
-import singer
+# Only ISO 8601 strings, whose fields go from most to least significant, order as text
+_ISO_8601 = re.compile(r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?(?:Z|[+-]\d{2}:\d{2})?\Z')
+
+def _string_format(value):
+    """
+    The format of a date-time string, as its length and a getter for the
+    characters that must match for two strings to compare as their datetimes
+    do: the separators, and any numeric UTC offset, e.g., '+00:00'. None for
+    strings that aren't ISO 8601, which are always parsed.
+    """
+    if not _ISO_8601.match(value):
+        return None, None
+    positions = [i for i, char in enumerate(value) if not char.isdigit()]
+    if len(value) > 6 and value[-6] in '+-' and value[-3] == ':':
+        positions.extend(range(len(value) - 5, len(value)))
+    if not positions:
+        return len(value), lambda value: None
+    return len(value), itemgetter(*positions)
 
-# Not sure if this is the right pattern, but I wrote thiscode for
-# debugging, and it seems useful to expand on
 class BookmarkMonitor():
-    def __init__(self):
-        self.sorting_map = []
+    """
+    Tracks the order of successive bookmark values as runs of 'ASC', 'DESC' or
+    'EQUAL'. Completed runs are kept in `sorting_map` as [ordering, count]
+    (the most recent `max_runs` of them), and `totals` counts the values in
+    each ordering over the whole stream.
+
+    With `sample_every`, only every nth value is tracked. `on_change` is
+    called when the ordering changes, as
+    `on_change(old_order, new_order, old_order_length, last_bookmark, current_bookmark, record)`.
+    """
+    def __init__(self, sample_every=1, max_runs=DEFAULT_MAX_RUNS, on_change=None):
+        self.sample_every = sample_every
+        self.on_change = on_change
+        self.sorting_map = deque(maxlen=max_runs)
+        self.totals = Counter()
+        self.runs = 0
         self.last_bookmark = None
         self.last_ordering = None
         self.count = 0
+        self.seen = 0
 
-    # TODO: Would be great to have a callback that's called on change in ordering.
-    # Perhaps with a map of data.
-    # - E.g., callback(old_order, new_order, old_order_length, last_bookmark, current_bookmark, record)
-    def track_bookmark_order(self, record, replication_key):
-        """ Apply bookmark order tracking, generate sorting_map of changes in sort order. """
-        parsed_bm = singer.utils.strptime_to_utc(record[replication_key])
-        def switch_event(new_order):
+        self._length, self._separators = None, None
+        self._last_separators = None
+        self._parsed = {} # The last values that had to be parsed
+
+    def _parse(self, value):
+        parsed = self._parsed.get(value)
+        if parsed is None:
+            parsed = singer.utils.strptime_to_utc(value) if isinstance(value, str) else value
+            if len(self._parsed) > 1:
+                self._parsed.clear()
+            self._parsed[value] = parsed
+        return parsed
+
+    def _set_format(self, value):
+        self._length, self._separators = _string_format(value)
+        self._last_separators = self._separators(value) if self._separators is not None else None
+
+    def _order(self, value):
+        """ The ordering of `value` after the last bookmark, or None if it's the first. """
+        last = self.last_bookmark
+        if last is None:
+            return None
+        if isinstance(value, str):
+            if (len(value) == self._length and isinstance(last, str) and
+                    self._separators(value) == self._last_separators and _ISO_8601.match(value)):
+                previous, current = last, value
+            else:
+                previous, current = self._parse(last), self._parse(value)
+                self._set_format(value)
+        else:
+            previous, current = self._parse(last), value
+        if previous < current:
+            return ASC
+        if previous > current:
+            return DESC
+        return EQUAL
+
+    def track(self, value, record=None):
+        """ Tracks the next bookmark value. """
+        self.seen += 1
+        if value is None or (self.sample_every > 1 and self.seen % self.sample_every):
+            return
+        if self.last_bookmark is None and isinstance(value, str):
+            self._set_format(value)
+        ordering = self._order(value)
+        if ordering is not None and ordering != self.last_ordering:
             if self.last_ordering:
                 self.sorting_map.append([self.last_ordering, self.count])
+                self.runs += 1
+            if self.on_change is not None:
+                self.on_change(self.last_ordering, ordering, self.count, self.last_bookmark, value, record)
             self.count = 0
-            self.last_ordering = new_order
-
-        if self.last_bookmark and self.last_bookmark < parsed_bm:
-            if self.last_ordering != 'ASC':
-                switch_event('ASC')
-        elif self.last_bookmark and self.last_bookmark > parsed_bm:
-            if self.last_ordering != 'DESC':
-                switch_event('DESC')
-        elif self.last_bookmark and self.last_bookmark == parsed_bm:
-            if self.last_ordering != 'EQUAL':
-                switch_event('EQUAL')
+            self.last_ordering = ordering
+        if ordering is not None:
+            self.totals[ordering] += 1
         self.count += 1
-        self.last_bookmark = parsed_bm
-
-# Original Code:
-                # parsed_bm = singer.utils.strptime_to_utc(record['ActivityDate'])
-                # global last_sorting_map
-                # global last_bookmark
-                # global last_ordering
-                # global count
-                # if last_bookmark and last_bookmark < parsed_bm:
-                #     if last_ordering != 'ASC':
-                #         sorting_map.append([last_ordering, count])
-                #         count = 1
-                #         last_ordering = 'ASC'
-                #     else:
-                #         count += 1
-                # elif last_bookmark and last_bookmark > parsed_bm:
-                #     if last_ordering != 'DESC':
-                #         sorting_map.append([last_ordering, count])
-                #         count = 1
-                #         last_ordering = 'DESC'
-                #     else:
-                #         count += 1
-                # elif last_bookmark and last_bookmark == parsed_bm:
-                #     if last_ordering != 'EQUAL':
-                #         sorting_map.append([last_ordering, count])
-                #         count = 1
-                #         last_ordering = 'EQUAL'
-                #     else:
-                #         count += 1
-
-                # last_bookmark = parsed_bm
+        self.last_bookmark = value
+
+    def track_bookmark_order(self, record, replication_key):
+        """ Apply bookmark order tracking, generate sorting_map of changes in sort order. """
+        self.track(record[replication_key], record)
+
+    def summary(self):
+        """ e.g., 'ASC: 1200, EQUAL: 3 (4 changes in ordering)' """
+        counts = ", ".join("{}: {}".format(ordering, count) for ordering, count in sorted(self.totals.items()))
+        return "{} ({} changes in ordering)".format(counts or "no values", self.runs)
+
+def ensure_ordering(replication_key, ordering=ASC, strict=False, sample_every=1, on_violation=None):
+    """
+    Decorates a function (or generator, or async generator function) returning
+    records, raising OrderingViolation when a record's `replication_key` is out
+    of `ordering` ('ASC' or 'DESC'). Equal values are allowed, unless `strict`.
+    With `on_violation`, it's called with the OrderingViolation instead.
+    """
+    if ordering not in (ASC, DESC):
+        raise ValueError("ordering must be 'ASC' or 'DESC', got {!r}".format(ordering))
+    allowed = {ordering} if strict else {ordering, EQUAL}
+
+    def make_monitor(func):
+        def check(old_order, new_order, old_order_length, last_bookmark, current_bookmark, record):
+            if new_order in allowed:
+                return
+            violation = OrderingViolation(
+                "{}: {} went from {!r} to {!r}, expected {}{} order".format(
+                    getattr(func, '__qualname__', func), replication_key, last_bookmark, current_bookmark,
+                    'strictly ' if strict else '', 'ascending' if ordering == ASC else 'descending'))
+            if on_violation is None:
+                raise violation
+            on_violation(violation)
+        return BookmarkMonitor(sample_every=sample_every, max_runs=1, on_change=check)
+
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def checked_async_generator(*args, **kwargs):
+                monitor = make_monitor(func)
+                async for record in func(*args, **kwargs):
+                    monitor.track(record.get(replication_key), record)
+                    yield record
+            return checked_async_generator
+
+        def checked(records, monitor):
+            for record in records:
+                monitor.track(record.get(replication_key), record)
+                yield record
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def checked_generator(*args, **kwargs):
+                yield from checked(func(*args, **kwargs), make_monitor(func))
+            return checked_generator
+
+        @functools.wraps(func)
+        def checked_call(*args, **kwargs):
+            records = func(*args, **kwargs)
+            if isinstance(records, (list, tuple)):
+                for _ in checked(records, make_monitor(func)):
+                    pass
+                return records
+            return checked(records, make_monitor(func))
+        return checked_call
+    return decorator
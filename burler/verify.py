@@ -0,0 +1,217 @@
+"""
+Instrumentation for `singer verify`, which runs a tap as `singer run` would and
+reports on what it wrote:
+
+- Per-stream records/sec and bytes/sec, and time to first record
+- Peak RSS, and optionally the top allocators from tracemalloc
+- Size and frequency of STATE messages
+- How each stream's bookmark advanced, using validation.BookmarkMonitor
+
+The report is a JSON document, so releases can be gated on throughput
+regressions against a previous report with `compare_to_baseline`.
+"""
+import sys
+import time
+import tracemalloc
+
+from burler.output import MessageWriter
+from burler.validation import BookmarkMonitor
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+class StreamStats():
+    def __init__(self, started):
+        self.started = started
+        self.first_record = None
+        self.last_record = None
+        self.records = 0
+        self.bytes = 0
+
+    def to_dict(self, run_started):
+        elapsed = (self.last_record - self.started) if self.last_record else 0
+        return {'records': self.records,
+                'bytes': self.bytes,
+                'seconds': round(elapsed, 3),
+                'records_per_second': round(self.records / elapsed, 1) if elapsed else None,
+                'bytes_per_second': round(self.bytes / elapsed, 1) if elapsed else None,
+                'seconds_to_first_record': (round(self.first_record - run_started, 3)
+                                            if self.first_record else None)}
+
+class BookmarkStats():
+    """ Follows one bookmark key of a stream through the STATE messages. """
+    def __init__(self, key):
+        self.key = key
+        self.monitor = BookmarkMonitor()
+        self.history = []
+
+    def track(self, elapsed, value):
+        if self.history and self.history[-1][1] == value:
+            return
+        self.history.append((round(elapsed, 3), value))
+        try:
+            self.monitor.track_bookmark_order({self.key: value}, self.key)
+        except (ValueError, TypeError, OverflowError):
+            pass # Not a date-time, the history is still reported
+
+    def to_dict(self):
+        orderings = list(self.monitor.sorting_map)
+        if self.monitor.last_ordering:
+            orderings.append([self.monitor.last_ordering, self.monitor.count])
+        return {'key': self.key,
+                'history': self.history,
+                'orderings': orderings,
+                'moved_backwards': any(o == 'DESC' for o, _ in orderings)}
+
+class VerifyReport():
+    def __init__(self, trace_memory=False, top_allocators=10):
+        self.trace_memory = trace_memory
+        self.top_allocators = top_allocators
+        self.started = None
+        self.finished = None
+        self.streams = {}
+        self.bookmarks = {}
+        self.state_count = 0
+        self.state_bytes = 0
+        self.state_max_bytes = 0
+        self.state_times = []
+        self.allocators = []
+        self.traced_peak_bytes = None
+
+    ## Collection
+    def instrument(self, tap):
+        """ Has the tap write its output through this report. """
+        tap.writer_class = self.create_writer
+
+    def create_writer(self, **kwargs):
+        return VerifyingWriter(self, **kwargs)
+
+    def start(self):
+        self.started = time.monotonic()
+        if self.trace_memory:
+            tracemalloc.start()
+
+    def finish(self):
+        self.finished = time.monotonic()
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            self.traced_peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.allocators = [{'location': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+                               for stat in snapshot.statistics('lineno')[:self.top_allocators]]
+
+    def on_schema(self, stream):
+        if stream not in self.streams:
+            self.streams[stream] = StreamStats(time.monotonic())
+
+    def on_record(self, stream, size):
+        now = time.monotonic()
+        stats = self.streams.get(stream)
+        if stats is None:
+            stats = self.streams[stream] = StreamStats(now)
+        if stats.first_record is None:
+            stats.first_record = now
+        stats.last_record = now
+        stats.records += 1
+        stats.bytes += size
+
+    def on_state(self, value, size):
+        now = time.monotonic()
+        self.state_count += 1
+        self.state_bytes += size
+        self.state_max_bytes = max(self.state_max_bytes, size)
+        self.state_times.append(now)
+
+        for stream, bookmark in ((value or {}).get('bookmarks') or {}).items():
+            if not isinstance(bookmark, dict):
+                continue
+            for key, bookmark_value in bookmark.items():
+                stats = self.bookmarks.get((stream, key))
+                if stats is None:
+                    stats = self.bookmarks[(stream, key)] = BookmarkStats(key)
+                stats.track(now - self.started, bookmark_value)
+
+    ## Reporting
+    def to_dict(self):
+        intervals = [b - a for a, b in zip(self.state_times, self.state_times[1:])]
+        bookmarks = {}
+        for (stream, _), stats in self.bookmarks.items():
+            bookmarks.setdefault(stream, []).append(stats.to_dict())
+        return {'seconds': round((self.finished or time.monotonic()) - self.started, 3),
+                'peak_rss_kb': peak_rss_kb(),
+                'traced_peak_bytes': self.traced_peak_bytes,
+                'top_allocators': self.allocators,
+                'streams': {name: stats.to_dict(self.started) for name, stats in self.streams.items()},
+                'state': {'count': self.state_count,
+                          'bytes': self.state_bytes,
+                          'max_bytes': self.state_max_bytes,
+                          'mean_seconds_between': (round(sum(intervals) / len(intervals), 3)
+                                                   if intervals else None)},
+                'bookmarks': bookmarks}
+
+    def summary(self):
+        """ A table of the per-stream numbers, followed by the run totals. """
+        report = self.to_dict()
+        rows = [('stream', 'records', 'records/s', 'bytes/s', 'first record (s)')]
+        for name, stats in sorted(report['streams'].items()):
+            rows.append((name, stats['records'], stats['records_per_second'],
+                         stats['bytes_per_second'], stats['seconds_to_first_record']))
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+        lines = ["  ".join(str(v).ljust(w) for v, w in zip(row, widths)) for row in rows]
+        lines.append("")
+        lines.append("Run time: {}s, peak RSS: {} KB".format(report['seconds'], report['peak_rss_kb']))
+        lines.append("STATE messages: {count} ({bytes} bytes, max {max_bytes}), "
+                     "mean {mean_seconds_between}s apart".format(**report['state']))
+        for stream, stats in sorted(report['bookmarks'].items()):
+            for bookmark in stats:
+                if bookmark['moved_backwards']:
+                    lines.append("WARNING: bookmark {}.{} moved backwards".format(stream, bookmark['key']))
+        return "\n".join(lines)
+
+def compare_to_baseline(report, baseline, max_regression=0.1):
+    """
+    Returns a message for each stream whose records/sec dropped by more than
+    `max_regression` (a fraction) from the baseline report.
+    """
+    regressions = []
+    for name, baseline_stats in baseline.get('streams', {}).items():
+        expected = baseline_stats.get('records_per_second')
+        actual = report['streams'].get(name, {}).get('records_per_second')
+        if not expected or actual is None:
+            continue
+        if actual < expected * (1 - max_regression):
+            regressions.append("{}: {} records/s, down from {} ({:.0%})".format(
+                name, actual, expected, actual / expected - 1))
+    return regressions
+
+class VerifyingWriter(MessageWriter):
+    """ A MessageWriter that tells a VerifyReport about each message it writes. """
+    def __init__(self, report, **kwargs):
+        super().__init__(**kwargs)
+        self.report = report
+
+    def write_record(self, stream_name, record, stream_alias=None, time_extracted=None):
+        size = super().write_record(stream_name, record, stream_alias, time_extracted)
+        with self._lock:
+            self.report.on_record(stream_alias or stream_name, size)
+        return size
+
+    def write_schema(self, stream_name, schema, key_properties, bookmark_properties=None, stream_alias=None):
+        super().write_schema(stream_name, schema, key_properties, bookmark_properties, stream_alias)
+        with self._lock:
+            self.report.on_schema(stream_alias or stream_name)
+
+    def write_state(self, value):
+        size = super().write_state(value)
+        with self._lock:
+            self.report.on_state(value, size)
+        return size
@@ -0,0 +1,78 @@
+"""
+Date-windowed sync for INCREMENTAL streams, where a backfill from the
+bookmark to now can be split into ranges fetched in parallel:
+
+    class Invoices(Stream):
+        replication_method = 'INCREMENTAL'
+        replication_key = 'updated_at'
+        window_size = datetime.timedelta(days=30)
+        max_concurrent_windows = 4
+
+        def sync_window(self, state, start, end):
+            yield from self.client.get_invoices(updated_after=start, updated_before=end)
+
+Instead of `sync`, `sync_window` is called for each window [start, end) from
+the stream's bookmark (or start_date) to the time the sync started, with up
+to `max_concurrent_windows` running at once. Records are emitted in window
+order, and once a window and every window before it are emitted, the bookmark
+is set to its end and the state is written. An interrupted backfill resumes
+from the last complete window.
+
+Each running window's records are held in memory until it's emitted, so the
+window size should keep them to a manageable number.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import singer.utils
+
+def is_windowed_stream(instance):
+    return (getattr(instance, 'window_size', None) is not None and
+            callable(getattr(instance, 'sync_window', None)))
+
+def date_windows(start, end, size):
+    """ Splits [start, end) into consecutive (start, end) windows of `size` (a timedelta). """
+    if size.total_seconds() <= 0:
+        raise ValueError("Window size must be positive, got {}".format(size))
+    while start < end:
+        window_end = min(start + size, end)
+        yield start, window_end
+        start = window_end
+
+def sync_windows(instance, state, start, end=None, bind=None):
+    """
+    Runs the windowed stream `instance` from `start` (a datetime or date-time
+    string) to `end` (now, by default), yielding the end of each window and
+    its records, in window order.
+
+    If given, `bind(instance)` is a context manager that's entered on the
+    window's thread, giving the instance to fetch the window with (e.g., one
+    with its own client).
+    """
+    if isinstance(start, str):
+        start = singer.utils.strptime_to_utc(start)
+    end = end or singer.utils.now()
+    windows = date_windows(start, end, instance.window_size)
+
+    def fetch(window_start, window_end):
+        if bind is None:
+            return list(instance.sync_window(state, window_start, window_end))
+        with bind(instance) as window_instance:
+            return list(window_instance.sync_window(state, window_start, window_end))
+
+    max_workers = max(1, getattr(instance, 'max_concurrent_windows', 1))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='burler-window') as executor:
+        # Only `max_workers` windows are fetched ahead of the one being emitted
+        running = deque()
+        try:
+            for window in windows:
+                running.append((window[1], executor.submit(fetch, *window)))
+                if len(running) >= max_workers:
+                    window_end, future = running.popleft()
+                    yield window_end, future.result()
+            while running:
+                window_end, future = running.popleft()
+                yield window_end, future.result()
+        finally:
+            for _, future in running:
+                future.cancel()
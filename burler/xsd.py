@@ -0,0 +1,396 @@
+"""
+Compiles the types of an XSD (or the schemas in a WSDL's `<types>`) to JSON
+Schema, for `schema_types.wsdl`.
+
+    load_schema('service.wsdl', 'Invoice')
+
+Files are read with `iterparse`, keeping only the schema components (the
+rest of a WSDL is discarded as it's read), and the `xs:include`s and
+`xs:import`s they reference are loaded from disk. Types are translated on
+demand and memoized, and compiled schemas are cached on disk, keyed by the
+hash of the file. A cached schema is reused as long as none of the files it
+was compiled from changed.
+
+Translation is deliberately loose, since it's used to describe records:
+
+- Elements and attributes become properties, and complexContent extensions
+  include their base type's properties
+- Optional (minOccurs="0", in a choice, or nillable) properties are nullable,
+  and repeated ones (maxOccurs > 1) are arrays
+- simpleContent becomes a `value` property alongside the attributes
+- Built-in types map to the nearest JSON type (e.g., xs:long -> integer,
+  xs:dateTime -> string with format date-time), restrictions to their base
+  type, lists to arrays and unions to anyOf
+- A recursive type is inlined until it refers to itself, where an empty schema
+  (accepting any value) is used instead
+"""
+import os
+import copy
+import json
+import hashlib
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+
+import singer.logger as logging
+
+from burler.exceptions import XSDTranslationError
+
+LOGGER = logging.get_logger()
+
+XS = 'http://www.w3.org/2001/XMLSchema'
+SCHEMA_TAG = '{{{}}}schema'.format(XS)
+
+# Bump when translation changes, so cached schemas are compiled again
+COMPILER_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'burler-xsd')
+
+_STRING = {'type': 'string'}
+_INTEGER = {'type': 'integer'}
+_NUMBER = {'type': 'number'}
+_BUILTIN_TYPES = {'boolean': {'type': 'boolean'},
+                  'dateTime': {'type': 'string', 'format': 'date-time'},
+                  'anyType': {},
+                  'anySimpleType': {}}
+for _name in ('decimal', 'float', 'double'):
+    _BUILTIN_TYPES[_name] = _NUMBER
+for _name in ('integer', 'int', 'long', 'short', 'byte', 'nonNegativeInteger', 'positiveInteger',
+              'nonPositiveInteger', 'negativeInteger', 'unsignedLong', 'unsignedInt', 'unsignedShort',
+              'unsignedByte'):
+    _BUILTIN_TYPES[_name] = _INTEGER
+
+_COMPONENT_KINDS = ('element', 'complexType', 'simpleType', 'group', 'attributeGroup', 'attribute')
+
+def _local(tag):
+    return tag.rpartition('}')[2]
+
+def _is_xs(elem, *names):
+    return elem.tag.startswith('{' + XS + '}') and _local(elem.tag) in names
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _nullable(schema):
+    if not schema:
+        return schema
+    if 'anyOf' in schema:
+        return dict(schema, anyOf=[{'type': 'null'}] + [s for s in schema['anyOf'] if s != {'type': 'null'}])
+    types = schema.get('type')
+    if types is None:
+        return schema
+    types = types if isinstance(types, list) else [types]
+    return dict(schema, type=['null'] + [t for t in types if t != 'null'])
+
+def _repeated(elem, repeated=False):
+    max_occurs = elem.get('maxOccurs', '1')
+    return repeated or max_occurs == 'unbounded' or int(max_occurs) > 1
+
+class _Component():
+    """ A top-level schema component, with the namespaces in scope where it was defined. """
+    __slots__ = ('elem', 'namespace', 'nsmap')
+
+    def __init__(self, elem, namespace, nsmap):
+        self.elem = elem
+        self.namespace = namespace
+        self.nsmap = nsmap
+
+class XSDCompiler():
+    def __init__(self):
+        self.files = {} # Path -> hash of each file loaded
+        self._components = {kind: {} for kind in _COMPONENT_KINDS}
+        self._by_local_name = {kind: {} for kind in _COMPONENT_KINDS}
+        self._translated = {}
+        self._in_progress = set()
+        self._lock = threading.RLock()
+
+    ## Loading
+    def load(self, path, namespace=None):
+        """ Loads the schema components of an XSD or WSDL file, and those of the files it includes or imports. """
+        path = os.path.abspath(path)
+        if path in self.files:
+            return
+        if not os.path.exists(path):
+            raise XSDTranslationError("Could not find schema file '{}'.".format(path))
+        self.files[path] = file_hash(path)
+
+        references = []
+        nsmaps = [{}]
+        pending_ns = {}
+        schema_depth = None
+        target_namespace = None
+        for event, item in ET.iterparse(path, events=('start-ns', 'start', 'end')):
+            if event == 'start-ns':
+                pending_ns[item[0]] = item[1]
+            elif event == 'start':
+                nsmaps.append(dict(nsmaps[-1], **pending_ns) if pending_ns else nsmaps[-1])
+                pending_ns = {}
+                if item.tag == SCHEMA_TAG and schema_depth is None:
+                    schema_depth = len(nsmaps)
+                    # An included schema without a targetNamespace takes on the includer's
+                    target_namespace = item.get('targetNamespace', namespace)
+            else:
+                depth = len(nsmaps)
+                if schema_depth is not None and depth == schema_depth + 1:
+                    self._register(item, target_namespace, nsmaps[-1], path, references)
+                elif schema_depth is None or depth == schema_depth:
+                    # Outside of a schema (e.g., WSDL messages and bindings), or the end of one.
+                    # The registered components are kept, everything else can be freed.
+                    if depth == schema_depth:
+                        schema_depth = None
+                    item.clear()
+                nsmaps.pop()
+
+        for location, reference_namespace in references:
+            self.load(location, reference_namespace)
+
+    def _register(self, elem, namespace, nsmap, path, references):
+        kind = _local(elem.tag)
+        if _is_xs(elem, 'include', 'import', 'redefine', 'override'):
+            location = elem.get('schemaLocation')
+            if location:
+                references.append((os.path.join(os.path.dirname(path), location),
+                                   None if kind == 'import' else namespace))
+            return
+        name = elem.get('name')
+        if kind in self._components and name:
+            component = _Component(elem, namespace, nsmap)
+            self._components[kind][(namespace, name)] = component
+            self._by_local_name[kind].setdefault(name, component)
+
+    ## Lookup
+    def _resolve_qname(self, qname, context):
+        """ The namespace and local name of a QName (e.g., `tns:Invoice`) as written in `context`. """
+        prefix, _, name = qname.rpartition(':')
+        namespace = context.nsmap.get(prefix) if prefix else context.nsmap.get('', context.namespace)
+        return namespace, name
+
+    def _lookup(self, kind, qname, context):
+        namespace, name = self._resolve_qname(qname, context)
+        component = self._components[kind].get((namespace, name))
+        if component is None:
+            # Schemas are often loose about qualifying references, so fall back to the local name
+            component = self._by_local_name[kind].get(name)
+        return component
+
+    def _type_schema(self, qname, context):
+        namespace, name = self._resolve_qname(qname, context)
+        if namespace == XS:
+            return _BUILTIN_TYPES.get(name, _STRING) # The remaining built-ins are string types
+        component = self._lookup('complexType', qname, context) or self._lookup('simpleType', qname, context)
+        if component is None:
+            if name in _BUILTIN_TYPES or name in ('string', 'date', 'time', 'anyURI', 'token'):
+                return _BUILTIN_TYPES.get(name, _STRING) # An unqualified built-in
+            raise XSDTranslationError("Could not find type '{}'.".format(qname))
+        return self._translate_named(component)
+
+    def _translate_named(self, component):
+        key = id(component)
+        with self._lock:
+            translated = self._translated.get(key)
+            if translated is not None:
+                return translated
+            if key in self._in_progress:
+                LOGGER.debug("Type '%s' is recursive, using an empty schema.", component.elem.get('name'))
+                return {}
+            self._in_progress.add(key)
+            try:
+                if _local(component.elem.tag) == 'complexType':
+                    translated = self._complex_type(component.elem, component)
+                elif _local(component.elem.tag) == 'simpleType':
+                    translated = self._simple_type(component.elem, component)
+                else:
+                    translated = self._element(component.elem, component)[1]
+            finally:
+                self._in_progress.discard(key)
+            self._translated[key] = translated
+            return translated
+
+    ## Translation
+    def _simple_type(self, elem, context):
+        for child in elem:
+            if _is_xs(child, 'restriction'):
+                if child.get('base'):
+                    return self._type_schema(child.get('base'), context)
+                return self._inline_type(child, context)
+            if _is_xs(child, 'list'):
+                items = (self._type_schema(child.get('itemType'), context) if child.get('itemType')
+                         else self._inline_type(child, context))
+                return {'type': 'array', 'items': items}
+            if _is_xs(child, 'union'):
+                members = [self._type_schema(qname, context) for qname in (child.get('memberTypes') or '').split()]
+                members += [self._simple_type(member, context) for member in child if _is_xs(member, 'simpleType')]
+                return {'anyOf': members} if len(members) > 1 else (members[0] if members else _STRING)
+        return _STRING
+
+    def _inline_type(self, elem, context):
+        for child in elem:
+            if _is_xs(child, 'complexType'):
+                return self._complex_type(child, context)
+            if _is_xs(child, 'simpleType'):
+                return self._simple_type(child, context)
+        return {}
+
+    def _complex_type(self, elem, context):
+        properties = {}
+        self._content(elem, context, properties)
+        return {'type': 'object', 'properties': properties}
+
+    def _content(self, elem, context, properties):
+        """ Adds the properties for the content model and attributes of a complexType (or extension). """
+        for child in elem:
+            if _is_xs(child, 'sequence', 'all', 'choice', 'group'):
+                self._particles(child, context, properties)
+            elif _is_xs(child, 'attribute', 'attributeGroup'):
+                self._attributes(child, context, properties)
+            elif _is_xs(child, 'complexContent'):
+                for derivation in child:
+                    if _is_xs(derivation, 'extension') and derivation.get('base'):
+                        base = self._type_schema(derivation.get('base'), context)
+                        properties.update(base.get('properties', {}))
+                    if _is_xs(derivation, 'extension', 'restriction'):
+                        self._content(derivation, context, properties)
+            elif _is_xs(child, 'simpleContent'):
+                for derivation in child:
+                    if _is_xs(derivation, 'extension', 'restriction'):
+                        base = (self._type_schema(derivation.get('base'), context)
+                                if derivation.get('base') else _STRING)
+                        if 'properties' in base: # Derived from another complexType with simpleContent
+                            properties.update(base['properties'])
+                        else:
+                            properties['value'] = base
+                        self._content(derivation, context, properties)
+
+    def _particles(self, elem, context, properties, optional=False, repeated=False):
+        if _is_xs(elem, 'group') and elem.get('ref'):
+            component = self._lookup('group', elem.get('ref'), context)
+            if component is None:
+                raise XSDTranslationError("Could not find group '{}'.".format(elem.get('ref')))
+            optional = optional or elem.get('minOccurs') == '0'
+            repeated = _repeated(elem, repeated)
+            elem, context = component.elem, component
+
+        optional = optional or _is_xs(elem, 'choice') or elem.get('minOccurs') == '0'
+        repeated = _repeated(elem, repeated)
+        for child in elem:
+            if _is_xs(child, 'element'):
+                name, schema = self._element(child, context)
+                if _repeated(child, repeated):
+                    schema = {'type': 'array', 'items': schema}
+                if optional or child.get('minOccurs') == '0' or child.get('nillable') == 'true':
+                    schema = _nullable(schema)
+                properties[name] = schema
+            elif _is_xs(child, 'sequence', 'all', 'choice', 'group'):
+                self._particles(child, context, properties, optional, repeated)
+
+    def _element(self, elem, context):
+        if elem.get('ref'):
+            component = self._lookup('element', elem.get('ref'), context)
+            if component is None:
+                raise XSDTranslationError("Could not find element '{}'.".format(elem.get('ref')))
+            return component.elem.get('name'), self._translate_named(component)
+        if elem.get('type'):
+            return elem.get('name'), self._type_schema(elem.get('type'), context)
+        return elem.get('name'), self._inline_type(elem, context)
+
+    def _attributes(self, elem, context, properties):
+        if _is_xs(elem, 'attributeGroup'):
+            if elem.get('ref'):
+                component = self._lookup('attributeGroup', elem.get('ref'), context)
+                if component is None:
+                    raise XSDTranslationError("Could not find attributeGroup '{}'.".format(elem.get('ref')))
+                elem, context = component.elem, component
+            for child in elem:
+                if _is_xs(child, 'attribute', 'attributeGroup'):
+                    self._attributes(child, context, properties)
+            return
+
+        if elem.get('ref'):
+            component = self._lookup('attribute', elem.get('ref'), context)
+            name = self._resolve_qname(elem.get('ref'), context)[1]
+            schema = (self._type_schema(component.elem.get('type'), component)
+                      if component is not None and component.elem.get('type') else _STRING)
+        else:
+            name = elem.get('name')
+            schema = (self._type_schema(elem.get('type'), context) if elem.get('type')
+                      else self._inline_type(elem, context) or _STRING)
+        if elem.get('use') != 'required':
+            schema = _nullable(schema)
+        properties[name] = schema
+
+    ## Compiling
+    def compile(self, type_name):
+        """
+        The JSON Schema of a top-level element or type, by name (or `{namespace}name`).
+        Elements are looked up before complexTypes and simpleTypes.
+        """
+        namespace, _, name = type_name[1:].partition('}') if type_name.startswith('{') else (None, None, type_name)
+        for kind in ('element', 'complexType', 'simpleType'):
+            if namespace is not None:
+                component = self._components[kind].get((namespace, name))
+            else:
+                component = self._by_local_name[kind].get(name)
+            if component is not None:
+                try:
+                    return copy.deepcopy(self._translate_named(component))
+                except RecursionError:
+                    raise XSDTranslationError("'{}' is nested too deeply to translate.".format(type_name)) from None
+        raise XSDTranslationError("Could not find an element or type named '{}' in {}.".format(
+            type_name, ', '.join(sorted(self.files))))
+
+## Caching
+_compilers = {}
+_compilers_lock = threading.Lock()
+
+def _unchanged(dependencies):
+    """ Whether none of the files something was compiled from (e.g., an included XSD) changed. """
+    return all(os.path.exists(path) and file_hash(path) == path_hash
+               for path, path_hash in dependencies.items())
+
+def _compiler_for(path):
+    """ One compiler per file per process, so each stream doesn't parse it again. """
+    with _compilers_lock:
+        compiler = _compilers.get(path)
+        if compiler is None or not _unchanged(compiler.files):
+            compiler = _compilers[path] = XSDCompiler()
+            compiler.load(path)
+    return compiler
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached if _unchanged(cached.get('dependencies', {})) else None
+
+def _write_cache(cache_path, cached):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cached, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as ex:
+        LOGGER.warning("Could not write compiled schema cache: %s", ex)
+
+def load_schema(path, type_name, cache_dir=None):
+    """ Compiles the JSON Schema of `type_name` from the XSD or WSDL at `path`, using the disk cache. """
+    path = os.path.abspath(path)
+    key = hashlib.sha256('{}:{}'.format(COMPILER_VERSION, file_hash(path)).encode('utf-8')).hexdigest()
+    cache_path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, '{}.json'.format(key))
+
+    cached = _read_cache(cache_path) or {'types': {}}
+    if type_name in cached['types']:
+        return cached['types'][type_name]
+
+    compiler = _compiler_for(path)
+    schema = compiler.compile(type_name)
+    cached['types'][type_name] = schema
+    cached['dependencies'] = compiler.files
+    _write_cache(cache_path, cached)
+    return copy.deepcopy(schema)
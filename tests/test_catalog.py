@@ -0,0 +1,99 @@
+import os
+import json
+import mmap
+import tempfile
+from unittest import TestCase
+from singer.catalog import Catalog
+from burler.catalog import LazyCatalog, diff_catalogs
+
+def catalog_entry(tap_stream_id, selected):
+    return {'tap_stream_id': tap_stream_id,
+            'stream': tap_stream_id,
+            'key_properties': ['id'],
+            'schema': {'type': 'object', 'properties': {'id': {'$ref': '#/definitions/id'}},
+                       'definitions': {'id': {'type': 'integer'}}},
+            'metadata': [{'breadcrumb': [], 'metadata': {'selected': selected}},
+                         {'breadcrumb': ['properties', 'id'], 'metadata': {'inclusion': 'automatic'}}]}
+
+CATALOG = {'streams': [catalog_entry('apples', False),
+                       catalog_entry('bananas', True),
+                       catalog_entry('cherries', False),
+                       catalog_entry('dates', True)]}
+
+class TestLazyCatalog(TestCase):
+    def setUp(self):
+        self.catalog = LazyCatalog(json.dumps(CATALOG, indent=2))
+
+    def test_streams_are_indexed_in_order(self):
+        self.assertEqual(self.catalog.tap_stream_ids, ['apples', 'bananas', 'cherries', 'dates'])
+        self.assertEqual(len(self.catalog), 4)
+
+    def test_only_selected_streams_are_parsed(self):
+        selected = [entry.tap_stream_id for entry in self.catalog.selected_streams()]
+        self.assertEqual(selected, ['bananas', 'dates'])
+        self.assertEqual(set(self.catalog._entries), {'bananas', 'dates'})
+
+    def test_entries_match_singer_catalog_with_refs_resolved(self):
+        entry = self.catalog.get_stream('apples')
+        self.assertEqual(entry.key_properties, ['id'])
+        self.assertEqual(entry.schema.to_dict(), {'type': 'object', 'properties': {'id': {'type': 'integer'}}})
+        self.assertEqual(entry.metadata, CATALOG['streams'][0]['metadata'])
+        self.assertIsNone(self.catalog.get_stream('elderberries'))
+
+    def test_to_dict_round_trips(self):
+        expected = Catalog.from_dict(json.loads(json.dumps(LazyCatalog(json.dumps(CATALOG)).to_dict())))
+        self.assertEqual(self.catalog.to_dict(), expected.to_dict())
+
+    def test_load_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.json')
+            with open(path, 'w') as f:
+                json.dump(CATALOG, f)
+            self.assertEqual(LazyCatalog.load(path).tap_stream_ids, self.catalog.tap_stream_ids)
+
+    def test_unselected_metadata_is_not_decoded(self):
+        # Only the root breadcrumb's metadata is decoded while indexing, so the rest isn't validated
+        text = json.dumps({'streams': [catalog_entry('apples', False), catalog_entry('bananas', True)]})
+        text = text.replace('"automatic"', 'nonsense', 1)
+        catalog = LazyCatalog(text)
+        self.assertEqual([entry.tap_stream_id for entry in catalog.selected_streams()], ['bananas'])
+        with self.assertRaises(ValueError):
+            catalog.get_stream('apples')
+
+    def test_strings_and_deep_nesting_are_skipped(self):
+        entry = catalog_entry('apples', True)
+        entry['schema']['description'] = 'Brackets ]} and quotes \\" in strings'
+        entry['schema']['properties']['tree'] = {'type': 'object', 'properties': {'a': {'type': 'object', 'properties': {
+            'b': {'type': 'object', 'properties': {'c': {'type': 'array', 'items': {'type': ['null', 'string']}}}}}}}}
+        catalog = LazyCatalog(json.dumps({'streams': [entry, catalog_entry('bananas', True)]}))
+        self.assertEqual(catalog.tap_stream_ids, ['apples', 'bananas'])
+        self.assertEqual(catalog.get_stream('apples').schema.to_dict()['description'], entry['schema']['description'])
+
+    def test_load_maps_the_file(self):
+        catalog = {'streams': [dict(catalog_entry('caf\u00e9', True), stream='\u00e9t\u00e9')]}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(catalog, f, ensure_ascii=False)
+            loaded = LazyCatalog.load(path)
+            self.assertIsInstance(loaded._buffer, mmap.mmap)
+            entry = loaded.get_stream('caf\u00e9')
+        self.assertEqual(entry.stream, '\u00e9t\u00e9')
+        self.assertEqual(entry.metadata, catalog['streams'][0]['metadata'])
+
+    def test_malformed_catalog_raises(self):
+        with self.assertRaises(ValueError):
+            LazyCatalog('{"streams": [{"tap_stream_id": "apples",}]}')
+
+class TestDiffCatalogs(TestCase):
+    def test_compact_diff(self):
+        previous = {'streams': [catalog_entry('apples', True), catalog_entry('bananas', True),
+                                catalog_entry('cherries', True)]}
+        current = {'streams': [catalog_entry('apples', True), catalog_entry('bananas', True),
+                               catalog_entry('dates', True)]}
+        current['streams'][1]['schema']['properties'] = {'id': {'type': 'string'}, 'name': {'type': 'string'}}
+        self.assertEqual(diff_catalogs(previous, current),
+                         {'added': ['dates'],
+                          'removed': ['cherries'],
+                          'changed': {'bananas': {'added': ['name'], 'removed': [], 'changed': ['id']}},
+                          'unchanged': 1})
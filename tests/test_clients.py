@@ -0,0 +1,112 @@
+import time
+import threading
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from burler.clients import ClientPool, DEFAULT_CHECKOUT_TIMEOUT
+from burler.exceptions import ClientPoolTimeout
+
+class FakeClient():
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class TestClientPool(TestCase):
+    def make_pool(self, size, **kwargs):
+        created = []
+        def factory():
+            created.append(FakeClient(len(created)))
+            return created[-1]
+        return ClientPool(factory, size, **kwargs), created
+
+    def test_clients_are_reused(self):
+        pool, created = self.make_pool(2)
+        for _ in range(5):
+            with pool.lease():
+                pass
+        self.assertEqual(len(created), 1)
+        self.assertEqual(pool.stats()['checkouts'], 5)
+
+    def test_concurrent_tasks_get_their_own_clients(self):
+        pool, created = self.make_pool(4)
+        seen = []
+        def task():
+            with pool.lease() as client:
+                self.assertIs(pool.current(), client)
+                time.sleep(0.05)
+                seen.append(client)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for future in [executor.submit(task) for _ in range(4)]:
+                future.result()
+        self.assertEqual(len({id(client) for client in seen}), 4)
+        self.assertEqual(len(created), 4)
+
+    def test_checkout_waits_for_a_client(self):
+        pool, created = self.make_pool(1)
+        def task():
+            with pool.lease():
+                time.sleep(0.05)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            for future in [executor.submit(task) for _ in range(3)]:
+                future.result()
+        self.assertEqual(len(created), 1)
+        self.assertGreater(pool.stats()['max_wait_seconds'], 0.04)
+
+    def test_checkout_timeout(self):
+        pool, _ = self.make_pool(1, checkout_timeout=0.05)
+        client = pool.checkout()
+        thread_errors = []
+        def task():
+            try:
+                pool.checkout()
+            except ClientPoolTimeout as ex:
+                thread_errors.append(ex)
+        thread = threading.Thread(target=task)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(thread_errors), 1)
+        pool.checkin(client)
+
+    def test_checkout_times_out_by_default(self):
+        pool, _ = self.make_pool(1)
+        self.assertEqual(pool.checkout_timeout, DEFAULT_CHECKOUT_TIMEOUT)
+
+    def test_nested_leases_share_a_client(self):
+        pool, created = self.make_pool(1)
+        with pool.lease() as outer:
+            with pool.lease() as inner:
+                self.assertIs(inner, outer)
+        self.assertEqual(len(created), 1)
+
+    def test_lease_adopts_the_threads_client(self):
+        pool, created = self.make_pool(1)
+        client = pool.current()
+        with pool.lease() as leased:
+            self.assertIs(leased, client)
+        # Checked back in, so another thread can have it
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.assertIs(executor.submit(pool.checkout).result(), client)
+        self.assertEqual(len(created), 1)
+
+    def test_close_runs_cleanup_hook(self):
+        closed = []
+        pool = ClientPool(object, 2, close=closed.append)
+        with pool.lease() as client:
+            pass
+        pool.close()
+        self.assertEqual(closed, [client])
+        self.assertEqual(pool.stats()['created'], 0)
+
+    def test_failed_creation_frees_its_slot(self):
+        attempts = []
+        def factory():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ConnectionError("unreachable")
+            return FakeClient(len(attempts))
+        pool = ClientPool(factory, 1, checkout_timeout=0.1)
+        with self.assertRaises(ConnectionError):
+            pool.checkout()
+        self.assertEqual(pool.checkout().number, 2)
@@ -0,0 +1,49 @@
+import json
+import enum
+import decimal
+import datetime
+from collections import OrderedDict
+from unittest import TestCase
+from burler.encoding import RecordCoercer
+
+class CustomEncoder(json.JSONEncoder):
+    def default(self, o): # pylint: disable=method-hidden
+        if isinstance(o, decimal.Decimal):
+            return str(o)
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        if isinstance(o, set):
+            return sorted(o)
+        return super().default(o)
+
+class Color(enum.IntEnum):
+    RED = 1
+
+class TestRecordCoercer(TestCase):
+    record = {'id': 1,
+              'name': 'thing',
+              'active': True,
+              'score': 1.5,
+              'missing': None,
+              'amount': decimal.Decimal('10.01'),
+              'created_at': datetime.datetime(2018, 1, 1, 12, 30),
+              'color': Color.RED,
+              'tags': ('a', 'b'),
+              'groups': {3, 1, 2},
+              'nested': OrderedDict([('when', datetime.datetime(2018, 1, 2)),
+                                     (1, 'int key'),
+                                     (None, 'none key'),
+                                     (True, 'bool key')]),
+              'rows': [{'amount': decimal.Decimal('1')}]}
+
+    def test_matches_json_round_trip(self):
+        expected = json.loads(json.dumps(self.record, cls=CustomEncoder))
+        self.assertEqual(RecordCoercer(CustomEncoder)(self.record), expected)
+
+    def test_native_values_are_not_copied(self):
+        text = 'already native'
+        self.assertIs(RecordCoercer(CustomEncoder)({'a': text})['a'], text)
+
+    def test_unencodable_values_raise(self):
+        with self.assertRaises(TypeError):
+            RecordCoercer(json.JSONEncoder)({'a': object()})
@@ -0,0 +1,57 @@
+import datetime
+from unittest import TestCase
+from burler.inference import SchemaBuilder, infer_schema, merge
+from burler import schema_types
+
+RECORDS = [{'id': 1, 'amount': 5, 'code': 7, 'updated_at': '2018-01-01T00:00:00Z',
+            'notes': None, 'tags': ['a'], 'address': {'zip': 12345}},
+           {'id': 2, 'amount': 5.5, 'code': 'A7', 'updated_at': '2018-01-02T00:00:00.123+00:00',
+            'notes': 'hi', 'tags': [], 'address': {'zip': None, 'street': 'Main'}},
+           {'id': 3, 'amount': None, 'code': 8, 'updated_at': datetime.datetime(2018, 1, 3),
+            'empty': None}]
+
+EXPECTED = {'type': 'object',
+            'properties': {'id': {'type': 'integer'},
+                           'amount': {'type': ['null', 'number']},
+                           'code': {'type': 'string'},
+                           'updated_at': {'type': 'string', 'format': 'date-time'},
+                           'notes': {'type': ['null', 'string']},
+                           'tags': {'type': 'array', 'items': {'type': 'string'}},
+                           'address': {'type': 'object',
+                                       'properties': {'zip': {'type': ['null', 'integer']},
+                                                      'street': {'type': 'string'}}},
+                           'empty': {}}}
+
+class TestInference(TestCase):
+    def test_types_are_widened_and_nullable(self):
+        self.assertEqual(infer_schema(RECORDS), EXPECTED)
+
+    def test_date_time_format_requires_every_string_to_be_a_date_time(self):
+        schema = infer_schema([{'at': '2018-01-01T00:00:00Z'}, {'at': 'yesterday'}])
+        self.assertEqual(schema['properties']['at'], {'type': 'string'})
+
+    def test_partial_builders_merge_to_the_same_schema(self):
+        partials = [SchemaBuilder().observe(record) for record in RECORDS]
+        self.assertEqual(merge(partials).to_schema(), SchemaBuilder().observe(RECORDS).items.to_schema())
+        self.assertEqual(merge(reversed(partials)).to_schema()['properties'], EXPECTED['properties'])
+
+    def test_sample_size_and_max_properties(self):
+        records = ({'id': i, str(i): i} for i in range(100))
+        schema = infer_schema(records, sample_size=10, max_properties=5)
+        self.assertEqual(list(schema['properties']), ['id', '0', '1', '2', '3'])
+
+    def test_empty_sample_is_an_object(self):
+        self.assertEqual(infer_schema([]), {'type': 'object', 'properties': {}})
+
+class TestGeneratedSchema(TestCase):
+    def test_samples_the_stream_sync(self):
+        synced = []
+        class Events():
+            load_schema = schema_types.generated(sample_size=2)
+            def sync(self, state):
+                for record in RECORDS:
+                    synced.append(record)
+                    yield record
+        schema = Events().load_schema()
+        self.assertEqual(len(synced), 2)
+        self.assertEqual(schema, infer_schema(RECORDS[:2]))
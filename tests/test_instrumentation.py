@@ -0,0 +1,58 @@
+import os
+import json
+import tempfile
+from unittest import TestCase, mock
+from burler.instrumentation import (Histogram, Instrumentation, SingerMetricsSink,
+                                    JSONFileSink, PrometheusFileSink)
+
+class TestHistogram(TestCase):
+    def test_summary(self):
+        histogram = Histogram()
+        for seconds in [0.001] * 90 + [0.1] * 10:
+            histogram.observe(seconds)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.sum, 1.09)
+        # Percentiles are bucket upper bounds, within a factor of two
+        self.assertTrue(0.001 <= histogram.percentile(0.5) < 0.002)
+        self.assertEqual(histogram.percentile(0.99), 0.1)
+        self.assertEqual(sum(histogram.to_dict()['buckets'].values()), 100)
+
+    def test_empty(self):
+        self.assertIsNone(Histogram().percentile(0.5))
+
+class TestInstrumentation(TestCase):
+    def test_only_a_sample_of_records_is_timed(self):
+        instrumentation = Instrumentation(sample_every=10, sinks=[])
+        timer = instrumentation.stream_timer('things')
+        for _ in range(100):
+            if timer.start_record():
+                timer.lap('transform')
+                timer.end_record()
+        stages = {entry['stage']: entry for entry in instrumentation.report()['stages']}
+        self.assertEqual(stages['transform']['count'], 10)
+        self.assertEqual(stages['fetch']['count'], 10)
+        self.assertAlmostEqual(stages['transform']['estimated_seconds'], stages['transform']['sum'] * 10)
+
+    def test_sinks(self):
+        instrumentation = Instrumentation(sample_every=1)
+        instrumentation.observe('things', 'transform', 0.002)
+        instrumentation.observe(None, 'output', 0.01)
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, 'report.json')
+            prom_path = os.path.join(directory, 'tap.prom')
+            instrumentation.sinks = [SingerMetricsSink(), JSONFileSink(json_path), PrometheusFileSink(prom_path)]
+            with mock.patch('burler.instrumentation.metrics.log') as log_metric:
+                instrumentation.emit()
+            with open(json_path) as f:
+                report = json.load(f)
+            with open(prom_path) as f:
+                prometheus = f.read()
+
+        points = [call[0][1] for call in log_metric.call_args_list]
+        self.assertEqual([(p.tags.get('endpoint'), p.tags['stage']) for p in points],
+                         [(None, 'output'), ('things', 'transform')])
+        self.assertEqual([entry['stage'] for entry in report['stages']], ['output', 'transform'])
+        self.assertIn('burler_sync_stage_seconds_bucket{le="+Inf",stage="transform",stream="things"} 1', prometheus)
+        self.assertIn('burler_sync_stage_seconds_count{stage="output"} 1', prometheus)
+        # Emitting starts over
+        self.assertEqual(instrumentation.report()['stages'], [])
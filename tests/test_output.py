@@ -0,0 +1,56 @@
+import io
+import json
+import decimal
+from unittest import TestCase
+from burler.output import MessageWriter
+
+class TestMessageWriter(TestCase):
+    def lines(self, output):
+        return [json.loads(l) for l in output.getvalue().splitlines()]
+
+    def test_records_are_buffered_until_buffer_size(self):
+        output = io.StringIO()
+        writer = MessageWriter(output=output, buffer_size=1024, flush_interval=60)
+        writer.write_record('things', {'id': 1})
+        self.assertEqual(output.getvalue(), '')
+        for i in range(100):
+            writer.write_record('things', {'id': i})
+        self.assertGreater(len(self.lines(output)), 0)
+
+    def test_buffer_size_zero_flushes_every_message(self):
+        output = io.StringIO()
+        writer = MessageWriter(output=output, buffer_size=0)
+        writer.write_record('things', {'id': 1})
+        self.assertEqual(self.lines(output), [{'type': 'RECORD', 'stream': 'things', 'record': {'id': 1}}])
+
+    def test_state_flushes_preceding_records(self):
+        output = io.StringIO()
+        writer = MessageWriter(output=output, buffer_size=1024, flush_interval=60)
+        writer.write_schema('things', {'type': 'object'}, 'id')
+        writer.write_record('things', {'id': 1})
+        writer.write_state({'bookmarks': {'things': {'id': 1}}})
+        self.assertEqual([m['type'] for m in self.lines(output)], ['SCHEMA', 'RECORD', 'STATE'])
+
+    def test_exiting_context_flushes(self):
+        output = io.StringIO()
+        with MessageWriter(output=output, flush_interval=60) as writer:
+            writer.write_record('things', {'id': 1})
+        self.assertEqual(len(self.lines(output)), 1)
+
+    def test_decimals_are_written_as_numbers(self):
+        output = io.StringIO()
+        with MessageWriter(output=output) as writer:
+            writer.write_record('things', {'amount': decimal.Decimal('1.10')})
+        message = json.loads(output.getvalue(), parse_float=decimal.Decimal)
+        self.assertEqual(message['record']['amount'], decimal.Decimal('1.10'))
+
+    def test_non_finite_floats_are_null_with_either_serializer(self):
+        for use_orjson in (True, False):
+            output = io.StringIO()
+            with MessageWriter(output=output, use_orjson=use_orjson) as writer:
+                writer.write_record('things', {'a': float('nan'), 'b': float('inf')})
+                # A Decimal sends orjson back to simplejson
+                writer.write_record('things', {'a': float('-inf'), 'amount': decimal.Decimal('1.10')})
+            records = [line['record'] for line in self.lines(output)]
+            self.assertEqual(records[0], {'a': None, 'b': None})
+            self.assertIsNone(records[1]['a'])
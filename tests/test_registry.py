@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+from unittest import TestCase
+from burler import registry
+from burler.taps import Tap
+from burler.exceptions import TapNotDefinedException, TapRedefinedException
+
+TAP_MODULE = """
+import burler
+from burler.taps import Tap
+tap = burler.tap(config_spec=['start_date'])
+other = Tap(config_spec=['start_date'])
+not_a_tap = 42
+"""
+
+class FakeEntryPoint():
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return registry._load_attribute(self.value)
+
+class TestResolveTap(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, 'tap_registry_test.py'), 'w') as f:
+            f.write(TAP_MODULE)
+        sys.path.insert(0, self.directory.name)
+
+    def tearDown(self):
+        sys.path.remove(self.directory.name)
+        sys.modules.pop('tap_registry_test', None)
+        self.directory.cleanup()
+        registry.clear_cache()
+        Tap._Tap__tap = None
+
+    def test_module_attribute_spec(self):
+        tap = registry.resolve_tap('tap_registry_test:tap')
+        self.assertIs(tap, sys.modules['tap_registry_test'].tap)
+
+    def test_module_name_uses_global_tap(self):
+        tap = registry.resolve_tap('tap-registry-test')
+        self.assertIs(tap, sys.modules['tap_registry_test'].tap)
+
+    def test_entry_point_is_loaded_once(self):
+        entry_point = FakeEntryPoint('tap-registered', 'tap_registry_test:tap')
+        registry._installed_taps = {'tap-registered': entry_point}
+        first = registry.resolve_tap('tap-registered')
+        self.assertIs(registry.resolve_tap('tap-registered'), first)
+        self.assertEqual(entry_point.loads, 1)
+
+    def test_spec_must_be_the_global_tap(self):
+        with self.assertRaises(TapRedefinedException):
+            registry.resolve_tap('tap_registry_test:other')
+        with self.assertRaises(TapNotDefinedException):
+            registry.resolve_tap('tap_registry_test:not_a_tap')
+        with self.assertRaises(TapNotDefinedException):
+            registry.resolve_tap('tap_registry_test:missing')
@@ -0,0 +1,58 @@
+import os
+from unittest import TestCase
+from burler.schema_refs import SchemaResolver
+from burler.exceptions import SchemaReferenceError
+from burler.transform import CompiledTransform
+
+SCHEMAS = os.path.join(os.path.dirname(__file__), 'resources', 'schemas')
+ADDRESS = {'type': 'object',
+           'properties': {'street': {'type': ['null', 'string']},
+                          'country': {'type': ['null', 'string']}}}
+
+class TestSchemaResolver(TestCase):
+    def setUp(self):
+        self.resolver = SchemaResolver()
+
+    def resolve_contacts(self):
+        path = os.path.join(SCHEMAS, 'contacts.json')
+        return self.resolver.resolve(self.resolver._load_document('file://' + path), base_uri=path)
+
+    def test_file_relative_and_local_refs_are_inlined(self):
+        schema = self.resolve_contacts()
+        self.assertEqual(schema['properties']['home'], ADDRESS)
+        self.assertEqual(schema['properties']['work'], dict(ADDRESS, description='Where they work'))
+        self.assertNotIn('definitions', schema)
+
+    def test_recursive_ref_is_cut_off_with_empty_schema(self):
+        manager = self.resolve_contacts()['properties']['manager']
+        self.assertEqual(manager['properties']['name'], {'type': ['null', 'string']})
+        self.assertEqual(manager['properties']['manager'], {})
+
+    def test_shared_definitions_are_resolved_once_and_copied(self):
+        schema = self.resolve_contacts()
+        self.assertIn('file://' + os.path.join(SCHEMAS, 'shared.json') + '#/definitions/address',
+                      self.resolver._resolved)
+        schema['properties']['home']['properties']['street'] = {'type': 'integer'}
+        self.assertEqual(self.resolve_contacts()['properties']['home'], ADDRESS)
+
+    def test_in_memory_local_refs(self):
+        schema = {'type': 'object',
+                  'properties': {'tags': {'type': 'array', 'items': {'$ref': '#/$defs/tag'}},
+                                 'default': {'type': 'object', 'default': {'$ref': 'not a reference'}}},
+                  '$defs': {'tag': {'type': 'string'}}}
+        resolved = self.resolver.resolve(schema)
+        self.assertEqual(resolved['properties']['tags']['items'], {'type': 'string'})
+        self.assertEqual(resolved['properties']['default']['default'], {'$ref': 'not a reference'})
+
+    def test_schema_without_refs_is_returned_unchanged(self):
+        schema = {'type': 'object', 'properties': {'id': {'type': 'integer'}}}
+        self.assertIs(self.resolver.resolve(schema), schema)
+
+    def test_missing_definition_raises(self):
+        with self.assertRaises(SchemaReferenceError):
+            self.resolver.resolve({'$ref': '#/definitions/missing'})
+
+    def test_resolved_schema_transforms_without_refs(self):
+        transformer = CompiledTransform(self.resolve_contacts())
+        record = transformer.transform({'id': '1', 'home': {'street': 'Main', 'country': None}})
+        self.assertEqual(record, {'id': 1, 'home': {'street': 'Main', 'country': None}})
@@ -0,0 +1,37 @@
+import os
+import json
+import tempfile
+from unittest import TestCase
+from burler import schema_types
+
+class TestJsonFile(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'type': 'object', 'properties': {'id': {'type': 'integer'}}}, f)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_each_call_gets_its_own_copy(self):
+        get_schema = schema_types.json_file(self.path)
+        first = get_schema()
+        first['properties']['name'] = {'type': 'string'}
+        self.assertEqual(get_schema(), {'type': 'object', 'properties': {'id': {'type': 'integer'}}})
+
+    def test_changed_file_is_reloaded(self):
+        get_schema = schema_types.json_file(self.path)
+        get_schema()
+        with open(self.path, 'w') as f:
+            json.dump({'type': 'object', 'properties': {}, 'additionalProperties': False}, f)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        self.assertEqual(get_schema(), {'type': 'object', 'properties': {}, 'additionalProperties': False})
+
+    def test_relative_path_is_resolved_from_cwd(self):
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(self.path))
+        try:
+            self.assertIn('properties', schema_types.json_file(os.path.basename(self.path))())
+        finally:
+            os.chdir(cwd)
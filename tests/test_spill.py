@@ -0,0 +1,61 @@
+import io
+import json
+import time
+import tempfile
+from unittest import TestCase
+from burler.spill import SpillQueue
+from burler.output import MessageWriter
+
+class SlowOutput(io.StringIO):
+    """ A target that takes `delay` seconds to read each write. """
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, data):
+        time.sleep(self.delay)
+        return super().write(data)
+
+class TestSpillQueue(TestCase):
+    def test_output_is_in_order_across_memory_and_disk(self):
+        written = []
+        def write(data):
+            time.sleep(0.001)
+            written.append(data)
+        queue = SpillQueue(write, memory_limit=100)
+        chunks = [('{:04d}'.format(i) * 10).encode() for i in range(200)]
+        for chunk in chunks:
+            queue.put(chunk)
+        queue.close()
+        self.assertEqual(written, chunks)
+        self.assertGreater(queue.spilled_bytes, 0)
+
+    def test_spill_file_is_in_directory_and_removed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            queue = SpillQueue(lambda data: time.sleep(0.01), memory_limit=0, directory=directory)
+            for _ in range(5):
+                queue.put(b'x' * 10)
+            queue.close()
+            self.assertEqual(queue.spilled_bytes, 50)
+
+    def test_output_errors_are_raised(self):
+        def write(data):
+            raise BrokenPipeError()
+        queue = SpillQueue(write)
+        queue.put(b'x')
+        with self.assertRaises(BrokenPipeError):
+            queue.close()
+
+class TestSpillingWriter(TestCase):
+    def test_slow_target_does_not_block_writes(self):
+        output = SlowOutput(delay=0.02)
+        start = time.monotonic()
+        with MessageWriter(output=output, buffer_size=0, spill_memory_limit=1024) as writer:
+            for i in range(20):
+                writer.write_record('things', {'id': i})
+            writer.write_state({'bookmarks': {'things': {'id': 19}}})
+            # Writing 21 messages to this target takes at least 0.4s
+            self.assertLess(time.monotonic() - start, 0.2)
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([m['record']['id'] for m in messages[:-1]], list(range(20)))
+        self.assertEqual(messages[-1]['type'], 'STATE')
@@ -0,0 +1,20 @@
+import sys
+import subprocess
+from unittest import TestCase
+
+# Only needed by some taps or commands, so they must not be imported just to start a tap
+DEFERRED_MODULES = ['schema', 'voluptuous', 'burler.verify', 'burler.validation',
+                    'burler.discovery_cache', 'burler.clients', 'burler.spill', 'tracemalloc']
+
+def imported_modules(statement):
+    """ The modules imported by `statement` in a fresh interpreter, from `python -X importtime`. """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            stderr=subprocess.PIPE, check=True, universal_newlines=True).stderr
+    return {line.split('|')[-1].strip() for line in output.splitlines() if line.startswith('import time:')}
+
+class TestStartup(TestCase):
+    def test_entry_point_defers_optional_modules(self):
+        modules = imported_modules('from burler import entry_point')
+        self.assertIn('burler.taps', modules)
+        for module in DEFERRED_MODULES:
+            self.assertNotIn(module, modules)
@@ -0,0 +1,683 @@
+import io
+import asyncio
+import json
+import time
+import datetime
+import contextlib
+import tempfile
+from unittest import TestCase, mock
+import singer
+from singer.catalog import Catalog
+from burler.taps import Tap
+from burler.streams import Stream, stream
+from burler.catalog import LazyCatalog
+from burler.bookmark_strategies import every_n, adaptive
+from burler.throttling import RateLimiter, RetryPolicy
+from burler.exceptions import StreamSyncFailures, ClientPoolTimeout, ConfigValidationException
+from burler.instrumentation import Instrumentation
+
+CONFIG = {'start_date': '2018-01-01T00:00:00Z'}
+
+def make_stream_class(name, rows=3, delay=0, **attrs):
+    def load_schema(self):
+        return {'type': 'object',
+                'properties': {'id': {'type': 'integer'},
+                               'updated_at': {'type': 'string', 'format': 'date-time'}}}
+
+    def sync(self, state):
+        for i in range(rows):
+            time.sleep(delay)
+            yield {'id': i, 'updated_at': '2018-01-{:02d}T00:00:00Z'.format(i + 1)}
+
+    return type(name, (Stream,), dict({'replication_method': 'INCREMENTAL',
+                                       'replication_key': 'updated_at',
+                                       'key_properties': ['id'],
+                                       'load_schema': load_schema,
+                                       'sync': sync}, **attrs))
+
+class SyncTestCase(TestCase):
+    """ Runs discovery and sync end to end, capturing the messages written to stdout. """
+    def tearDown(self):
+        Tap.streams = {}
+        Tap._Tap__tap = None
+
+    def make_tap(self, **kwargs):
+        tap = Tap(config_spec=['start_date'], **kwargs)
+        Tap._Tap__tap = tap
+        tap.create_client(lambda config: object())
+        return tap
+
+    def discover(self, tap, select=True):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            tap.do_discover(CONFIG)
+        catalog = json.loads(output.getvalue())
+        for catalog_entry in catalog['streams']:
+            for mdata in catalog_entry['metadata']:
+                if mdata['breadcrumb'] == []:
+                    mdata['metadata']['selected'] = select
+        return catalog
+
+    def sync(self, tap, catalog=None, state=None):
+        catalog = Catalog.from_dict(catalog or self.discover(tap))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            tap.do_sync(CONFIG, catalog, state if state is not None else {})
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+class TestSync(SyncTestCase):
+    def test_sync_writes_schema_records_and_state(self):
+        make_stream_class('Widgets')
+        messages = self.sync(self.make_tap())
+        self.assertEqual([m['type'] for m in messages],
+                         ['STATE', 'SCHEMA', 'RECORD', 'RECORD', 'RECORD', 'STATE', 'STATE'])
+        self.assertEqual(messages[-1]['value'],
+                         {'bookmarks': {'widgets': {'updated_at': CONFIG['start_date']}}})
+
+    def test_output_spilled_to_disk_is_written_in_order(self):
+        make_stream_class('Widgets', rows=28)
+        messages = self.sync(self.make_tap(output_buffer_size=0, output_spill_limit=0))
+        self.assertEqual([m['record']['id'] for m in messages if m['type'] == 'RECORD'], list(range(28)))
+        self.assertEqual(messages[-1]['type'], 'STATE')
+
+    def test_unselected_streams_are_skipped(self):
+        make_stream_class('Widgets')
+        tap = self.make_tap()
+        messages = self.sync(tap, catalog=self.discover(tap, select=False))
+        self.assertEqual([m['type'] for m in messages], ['STATE'])
+
+class TestConcurrentSync(SyncTestCase):
+    stream_names = ['Apples', 'Bananas', 'Cherries', 'Dates']
+
+    def test_concurrent_sync_is_faster_than_serial(self):
+        for name in self.stream_names:
+            make_stream_class(name, rows=4, delay=0.05)
+        start = time.monotonic()
+        self.sync(self.make_tap(max_concurrent_streams=len(self.stream_names)))
+        # Serially this takes at least 4 streams * 4 rows * 0.05s = 0.8s
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_each_schema_precedes_its_records(self):
+        for name in self.stream_names:
+            make_stream_class(name, rows=5, delay=0.001)
+        messages = self.sync(self.make_tap(max_concurrent_streams=4))
+        schemas_seen = set()
+        for message in messages:
+            if message['type'] == 'SCHEMA':
+                schemas_seen.add(message['stream'])
+            elif message['type'] == 'RECORD':
+                self.assertIn(message['stream'], schemas_seen)
+        self.assertEqual(len([m for m in messages if m['type'] == 'RECORD']), 20)
+
+    def test_state_is_merged_across_streams(self):
+        for name in self.stream_names:
+            make_stream_class(name)
+        messages = self.sync(self.make_tap(max_concurrent_streams=4),
+                             state={'bookmarks': {'other': {'id': 1}}})
+        self.assertEqual(set(messages[-1]['value']['bookmarks'].keys()),
+                         {'other', 'apples', 'bananas', 'cherries', 'dates'})
+
+    def test_stream_error_is_raised_after_other_streams_finish(self):
+        make_stream_class('Apples', rows=3, delay=0.01)
+        broken = make_stream_class('Broken')
+        def sync(self, state):
+            raise RuntimeError("source went away")
+            yield # pylint: disable=unreachable
+        broken.sync = sync
+        make_stream_class('Cherries', rows=3, delay=0.01)
+        with self.assertRaises(StreamSyncFailures) as raised:
+            self.sync(self.make_tap(max_concurrent_streams=2))
+        self.assertEqual(list(raised.exception.errors), ['broken'])
+        self.assertIsInstance(raised.exception.errors['broken'], RuntimeError)
+
+class TestAsyncSync(SyncTestCase):
+    def make_async_stream_class(self, name, pages=6, delay=0.05):
+        def load_schema(self):
+            return {'type': 'object', 'properties': {'id': {'type': 'integer'}}}
+
+        async def get_page(self, page):
+            await asyncio.sleep(delay)
+            return [{'id': page}]
+
+        async def sync(self, state):
+            async for page in self.pipeline(self.get_page, range(pages)):
+                for record in page:
+                    yield record
+
+        return type(name, (Stream,), {'key_properties': ['id'],
+                                      'max_in_flight': pages,
+                                      'load_schema': load_schema,
+                                      'get_page': get_page,
+                                      'sync': sync})
+
+    def test_async_stream_pipelines_requests_in_order(self):
+        self.make_async_stream_class('Pages')
+        start = time.monotonic()
+        messages = self.sync(self.make_tap())
+        # Serially this takes at least 6 pages * 0.05s = 0.3s
+        self.assertLess(time.monotonic() - start, 0.25)
+        self.assertEqual([m['record']['id'] for m in messages if m['type'] == 'RECORD'],
+                         list(range(6)))
+
+    def test_async_client_is_created_and_closed_per_stream(self):
+        clients = []
+        class AsyncClient():
+            closed = False
+            async def aclose(self):
+                self.closed = True
+
+        self.make_async_stream_class('Pages', pages=1, delay=0)
+        tap = self.make_tap()
+        @tap.create_async_client
+        async def create_client(config):
+            clients.append(AsyncClient())
+            return clients[-1]
+
+        self.sync(tap)
+        self.assertEqual(len(clients), 1)
+        self.assertTrue(clients[0].closed)
+
+class TestBookmarkStrategies(SyncTestCase):
+    def bookmarks(self, messages):
+        return [m['value']['bookmarks']['widgets']['updated_at'] for m in messages
+                if m['type'] == 'STATE' and 'bookmarks' in m['value']]
+
+    def test_every_n_checkpoints_with_max_replication_key(self):
+        make_stream_class('Widgets', rows=5, bookmark_strategy=every_n(2))
+        messages = self.sync(self.make_tap())
+        self.assertEqual(self.bookmarks(messages),
+                         ['2018-01-02T00:00:00.000000Z',
+                          '2018-01-04T00:00:00.000000Z',
+                          '2018-01-05T00:00:00.000000Z',
+                          '2018-01-05T00:00:00.000000Z'])
+
+    def test_bookmark_does_not_move_backwards(self):
+        make_stream_class('Widgets', rows=2, bookmark_strategy=every_n(1))
+        state = {'bookmarks': {'widgets': {'updated_at': '2019-01-01T00:00:00Z'}}}
+        messages = self.sync(self.make_tap(), state=state)
+        self.assertEqual(set(self.bookmarks(messages)), {'2019-01-01T00:00:00Z'})
+
+    def test_adaptive_bounds_state_output(self):
+        make_stream_class('Widgets', rows=31, bookmark_strategy=adaptive(state_ratio=0.1))
+        messages = self.sync(self.make_tap())
+        states = [m for m in messages if m['type'] == 'STATE']
+        self.assertGreater(len(states), 3)
+        self.assertLess(len(states), 15)
+
+class TestStreamContext(SyncTestCase):
+    def test_stream_sees_selected_fields_and_bookmark(self):
+        seen = {}
+        widgets = make_stream_class('Widgets', rows=1)
+        original_sync = widgets.sync
+        def sync(self, state):
+            seen.update(fields=self.selected_fields, bookmark=self.bookmark)
+            return original_sync(self, state)
+        widgets.sync = sync
+        widgets.load_schema = lambda self: {'type': 'object',
+                                            'properties': {'id': {'type': 'integer'},
+                                                           'updated_at': {'type': 'string'},
+                                                           'name': {'type': 'string'},
+                                                           'notes': {'type': 'string'}}}
+        tap = self.make_tap()
+        catalog = self.discover(tap)
+        for mdata in catalog['streams'][0]['metadata']:
+            if mdata['breadcrumb'] == ['properties', 'notes']:
+                mdata['metadata']['selected'] = False
+
+        state = {'bookmarks': {'widgets': {'updated_at': '2019-01-01T00:00:00Z'}}}
+        self.sync(tap, catalog=catalog, state=state)
+        self.assertEqual(seen['fields'], {'id', 'updated_at', 'name'})
+        self.assertEqual(seen['bookmark'], '2019-01-01T00:00:00Z')
+
+    def test_bookmark_defaults_to_start_date(self):
+        seen = {}
+        widgets = make_stream_class('Widgets', rows=1)
+        def sync(self, state):
+            seen['bookmark'] = self.bookmark
+            return iter([])
+        widgets.sync = sync
+        self.sync(self.make_tap())
+        self.assertEqual(seen['bookmark'], CONFIG['start_date'])
+
+    def test_bookmark_is_none_without_state(self):
+        self.assertIsNone(Stream.bookmark)
+        seen = {}
+        def load_schema(self):
+            seen['bookmark'] = self.bookmark
+            return {'type': 'object', 'properties': {'id': {'type': 'integer'}}}
+        make_stream_class('Widgets', load_schema=load_schema)
+        self.discover(self.make_tap())
+        self.assertIsNone(seen['bookmark'])
+
+class TestDiscovery(SyncTestCase):
+    def test_parallel_discovery_keeps_registration_order(self):
+        names = ['Apples', 'Bananas', 'Cherries', 'Dates']
+        for i, name in enumerate(names):
+            stream = make_stream_class(name)
+            original = stream.load_schema
+            def load_schema(self, original=original, delay=0.05 * (len(names) - i)):
+                time.sleep(delay)
+                return original(self)
+            stream.load_schema = load_schema
+        start = time.monotonic()
+        catalog = self.discover(self.make_tap(max_discovery_workers=4))
+        # Serially this takes at least 0.05 + 0.1 + 0.15 + 0.2 = 0.5s
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual([s['tap_stream_id'] for s in catalog['streams']],
+                         [name.lower() for name in names])
+
+    def test_cached_catalog_is_reused(self):
+        calls = []
+        widgets = make_stream_class('Widgets')
+        original = widgets.load_schema
+        def load_schema(self):
+            calls.append(1)
+            return original(self)
+        widgets.load_schema = load_schema
+        with tempfile.TemporaryDirectory() as cache_dir:
+            tap = self.make_tap(discovery_cache_ttl=60, discovery_cache_dir=cache_dir)
+            first = self.discover(tap)
+            second = self.discover(tap)
+            self.assertEqual(first, second)
+            self.assertEqual(len(calls), 1)
+
+            tap.version = '2.0.0'
+            self.discover(tap)
+            self.assertEqual(len(calls), 2)
+
+    def test_discovered_schemas_have_refs_inlined(self):
+        widgets = make_stream_class('Widgets')
+        widgets.load_schema = lambda self: {'type': 'object',
+                                            'properties': {'id': {'$ref': '#/definitions/id'}},
+                                            'definitions': {'id': {'type': 'integer'}}}
+        catalog = self.discover(self.make_tap())
+        self.assertEqual(catalog['streams'][0]['schema'],
+                         {'type': 'object', 'properties': {'id': {'type': 'integer'}}})
+
+class TestIncrementalDiscovery(SyncTestCase):
+    def make_versioned_stream_class(self, name, versions, loads):
+        stream = make_stream_class(name)
+        original = stream.load_schema
+        def load_schema(self):
+            loads.append(name)
+            schema = original(self)
+            schema['properties']['v{}'.format(versions[name])] = {'type': 'string'}
+            return schema
+        stream.load_schema = load_schema
+        stream.fingerprint = lambda self: versions[name]
+        return stream
+
+    def discover_from(self, tap, previous_catalog):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            tap.do_discover(CONFIG, previous_catalog)
+        return json.loads(output.getvalue())
+
+    def test_only_changed_streams_are_reloaded(self):
+        versions = {'Apples': 1, 'Bananas': 1}
+        loads = []
+        for name in versions:
+            self.make_versioned_stream_class(name, versions, loads)
+        tap = self.make_tap()
+        previous = self.discover(tap)
+        self.assertEqual(loads, ['Apples', 'Bananas'])
+
+        versions['Bananas'] = 2
+        catalog = self.discover_from(tap, previous)
+        self.assertEqual(loads, ['Apples', 'Bananas', 'Bananas'])
+        self.assertEqual(catalog['streams'][0], previous['streams'][0])
+        self.assertIn('v2', catalog['streams'][1]['schema']['properties'])
+
+    def test_selections_are_carried_over(self):
+        versions = {'Apples': 1}
+        self.make_versioned_stream_class('Apples', versions, [])
+        tap = self.make_tap()
+        previous = self.discover(tap, select=True)
+        versions['Apples'] = 2
+        catalog = self.discover_from(tap, previous)
+        root = [m for m in catalog['streams'][0]['metadata'] if m['breadcrumb'] == []][0]
+        self.assertTrue(root['metadata']['selected'])
+        self.assertEqual(root['metadata']['burler.fingerprint'], 2)
+
+    def test_previous_catalog_bypasses_the_discovery_cache(self):
+        versions = {'Apples': 1}
+        loads = []
+        self.make_versioned_stream_class('Apples', versions, loads)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            tap = self.make_tap(discovery_cache_ttl=60, discovery_cache_dir=cache_dir)
+            previous = self.discover(tap, select=True)
+            versions['Apples'] = 2
+            catalog = self.discover_from(tap, previous)
+        self.assertEqual(loads, ['Apples', 'Apples'])
+        root = [m for m in catalog['streams'][0]['metadata'] if m['breadcrumb'] == []][0]
+        self.assertTrue(root['metadata']['selected'])
+        self.assertEqual(root['metadata']['burler.fingerprint'], 2)
+
+class TestLazyCatalogSync(SyncTestCase):
+    def test_sync_with_lazy_catalog(self):
+        make_stream_class('Widgets')
+        make_stream_class('Gadgets')
+        tap = self.make_tap()
+        catalog = self.discover(tap)
+        for mdata in catalog['streams'][1]['metadata']:
+            if mdata['breadcrumb'] == []:
+                mdata['metadata']['selected'] = False
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            tap.do_sync(CONFIG, LazyCatalog(json.dumps(catalog)), {})
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual({m['stream'] for m in messages if m['type'] == 'RECORD'}, {'widgets'})
+
+class TestSubStreams(SyncTestCase):
+    def make_child_class(self, parent, rows=2, delay=0, **attrs):
+        def sync(self, state, parent):
+            for i in range(rows):
+                time.sleep(delay)
+                yield {'id': parent['id'] * 10 + i,
+                       'updated_at': '2018-02-{:02d}T00:00:00Z'.format(parent['id'] + i + 1)}
+        return make_stream_class('Audits', parent=parent, sync=sync, **attrs)
+
+    def test_children_are_synced_concurrently(self):
+        parent = make_stream_class('Tickets', rows=4, max_concurrent_children=4)
+        self.make_child_class(parent, rows=2, delay=0.1)
+        start = time.monotonic()
+        messages = self.sync(self.make_tap())
+        # Serially this takes at least 4 parents * 2 rows * 0.1s = 0.8s
+        self.assertLess(time.monotonic() - start, 0.6)
+        records = [m['record']['id'] for m in messages if m['type'] == 'RECORD' and m['stream'] == 'audits']
+        self.assertEqual(sorted(records), [0, 1, 10, 11, 20, 21, 30, 31])
+
+    def test_child_schema_follows_parent_schema(self):
+        parent = make_stream_class('Tickets')
+        self.make_child_class(parent)
+        tap = self.make_tap()
+        catalog = self.discover(tap)
+        # The child is listed first, but written after its parent
+        catalog['streams'].reverse()
+        messages = self.sync(tap, catalog=catalog)
+        self.assertEqual([m['stream'] for m in messages if m['type'] == 'SCHEMA'], ['tickets', 'audits'])
+        child_mdata = [m for m in catalog['streams'][0]['metadata'] if m['breadcrumb'] == []][0]
+        self.assertEqual(child_mdata['metadata']['parent-tap-stream-id'], 'tickets')
+
+    def test_child_is_skipped_without_its_parent(self):
+        parent = make_stream_class('Tickets')
+        self.make_child_class(parent)
+        tap = self.make_tap()
+        catalog = self.discover(tap)
+        for mdata in catalog['streams'][0]['metadata']:
+            if mdata['breadcrumb'] == []:
+                mdata['metadata']['selected'] = False
+        messages = self.sync(tap, catalog=catalog)
+        self.assertEqual([m for m in messages if m['type'] in ('SCHEMA', 'RECORD')], [])
+
+    def test_bookmarks_are_tracked_per_level(self):
+        parent = make_stream_class('Tickets', rows=3, bookmark_strategy=every_n(1))
+        self.make_child_class(parent)
+        messages = self.sync(self.make_tap())
+        self.assertEqual(messages[-1]['value']['bookmarks'],
+                         {'tickets': {'updated_at': '2018-01-03T00:00:00.000000Z'},
+                          'audits': {'updated_at': '2018-02-04T00:00:00.000000Z'}})
+
+    def test_bookmarks_written_by_children_are_merged(self):
+        parent = make_stream_class('Tickets', rows=4, max_concurrent_children=4)
+        seen = []
+        def sync(self, state, parent):
+            seen.append(singer.get_bookmark(state, 'audits', 'cursor'))
+            time.sleep(0.05 * (4 - parent['id'])) # The last parent's children finish first
+            singer.write_bookmark(state, 'audits', 'cursor', parent['id'])
+            yield {'id': parent['id'], 'updated_at': '2018-02-01T00:00:00Z'}
+        make_stream_class('Audits', parent=parent, sync=sync, replication_key='cursor')
+        messages = self.sync(self.make_tap())
+        # Each call started from the state before the sync, not another call's writes
+        self.assertEqual(seen, [None] * 4)
+        self.assertEqual(messages[-1]['value']['bookmarks']['audits'], {'cursor': 3})
+
+    def test_parent_bookmark_waits_for_its_children(self):
+        parent = make_stream_class('Tickets', rows=3, bookmark_strategy=every_n(1))
+        self.make_child_class(parent, rows=1, delay=0.2)
+        messages = self.sync(self.make_tap())
+        parent_records = 0
+        for message in messages:
+            if message['type'] == 'RECORD' and message['stream'] == 'tickets':
+                parent_records += 1
+            elif message['type'] == 'STATE' and parent_records:
+                # Before the slow children finish, the bookmark stays at the start date
+                bookmark = message['value']['bookmarks']['tickets']['updated_at']
+                self.assertEqual(bookmark, CONFIG['start_date'])
+                break
+
+    def test_child_error_is_raised(self):
+        parent = make_stream_class('Tickets')
+        def sync(self, state, parent):
+            raise RuntimeError("audit not found")
+            yield # pylint: disable=unreachable
+        make_stream_class('Audits', parent=parent, sync=sync)
+        with self.assertRaises(StreamSyncFailures) as raised:
+            self.sync(self.make_tap())
+        self.assertIsInstance(raised.exception.errors['tickets'], RuntimeError)
+
+class TestWindowedSync(SyncTestCase):
+    def make_windowed_class(self, delay=0, **attrs):
+        def sync_window(self, state, start, end):
+            time.sleep(delay)
+            yield {'id': start.year, 'updated_at': start.isoformat()}
+        return make_stream_class('Widgets', window_size=datetime.timedelta(days=366),
+                                 sync_window=sync_window, **attrs)
+
+    def test_bookmark_advances_window_by_window(self):
+        self.make_windowed_class(max_concurrent_windows=4)
+        messages = self.sync(self.make_tap())
+        records = [m['record']['id'] for m in messages if m['type'] == 'RECORD']
+        self.assertEqual(records, sorted(records))
+        self.assertEqual(records[0], 2018)
+        bookmarks = [m['value']['bookmarks']['widgets']['updated_at'] for m in messages
+                     if m['type'] == 'STATE' and 'widgets' in m['value'].get('bookmarks', {})]
+        self.assertEqual(bookmarks[0], '2019-01-02T00:00:00.000000Z')
+        self.assertEqual(bookmarks, sorted(bookmarks))
+        last = datetime.datetime.strptime(bookmarks[-1], '%Y-%m-%dT%H:%M:%S.%fZ')
+        self.assertLess(abs(datetime.datetime.utcnow() - last), datetime.timedelta(minutes=1))
+
+    def test_missing_start_is_a_config_error(self):
+        self.make_windowed_class()
+        tap = Tap(config_spec=[]) # start_date isn't required
+        Tap._Tap__tap = tap
+        tap.create_client(lambda config: object())
+        catalog = Catalog.from_dict(self.discover(tap))
+        with self.assertRaises(StreamSyncFailures) as raised:
+            with contextlib.redirect_stdout(io.StringIO()):
+                tap.do_sync({}, catalog, {})
+        error = raised.exception.errors['widgets']
+        self.assertIsInstance(error, ConfigValidationException)
+        self.assertIn("widgets: A windowed stream needs a start", str(error))
+
+    def test_sync_resumes_from_bookmark(self):
+        self.make_windowed_class()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        state = {'bookmarks': {'widgets': {'updated_at': (now - datetime.timedelta(days=400)).isoformat()}}}
+        messages = self.sync(self.make_tap(), state=state)
+        self.assertEqual(len([m for m in messages if m['type'] == 'RECORD']), 2)
+
+    def test_windows_run_in_parallel(self):
+        self.make_windowed_class(delay=0.1, max_concurrent_windows=10)
+        start = time.monotonic()
+        self.sync(self.make_tap())
+        # Serially this takes at least 8 windows * 0.1s = 0.8s
+        self.assertLess(time.monotonic() - start, 0.5)
+
+class TestPooledClients(SyncTestCase):
+    def test_concurrent_streams_get_their_own_clients(self):
+        seen = {}
+        def sync(self, state):
+            seen[type(self).__name__] = self.client
+            time.sleep(0.05)
+            yield {'id': 1, 'updated_at': '2018-01-02T00:00:00Z'}
+        for name in ['Apples', 'Bananas', 'Cherries']:
+            make_stream_class(name, sync=sync)
+        tap = Tap(config_spec=['start_date'], max_concurrent_streams=3)
+        Tap._Tap__tap = tap
+        clients = []
+        @tap.create_client(pool_size=3, close=lambda client: client.append('closed'))
+        def create_client(config):
+            clients.append([])
+            return clients[-1]
+        self.sync(tap)
+        self.assertEqual(len({id(client) for client in seen.values()}), 3)
+        # Discovery's client and the three streams' are all closed once they finish
+        self.assertTrue(all(client == ['closed'] for client in clients))
+
+    def test_discovery_workers_share_a_smaller_pool(self):
+        def load_schema(self):
+            self.client # Discovery touches the client on each worker
+            time.sleep(0.02)
+            return {'type': 'object', 'properties': {'id': {'type': 'integer'}}}
+        for name in ['Apples', 'Bananas', 'Cherries', 'Dates']:
+            make_stream_class(name, load_schema=load_schema)
+        tap = Tap(config_spec=['start_date'], max_discovery_workers=4)
+        Tap._Tap__tap = tap
+        tap.create_client(pool_size=1, checkout_timeout=5)(lambda config: object())
+        catalog = self.discover(tap)
+        self.assertEqual(len(catalog['streams']), 4)
+
+    def test_exhausted_pool_fails_instead_of_hanging(self):
+        parent = make_stream_class('Tickets', rows=2)
+        def sync(self, state, parent):
+            yield {'id': parent['id'], 'updated_at': '2018-02-01T00:00:00Z'}
+        make_stream_class('Audits', parent=parent, sync=sync)
+        tap = Tap(config_spec=['start_date'])
+        Tap._Tap__tap = tap
+        # The parent keeps the only client while its children wait for one
+        tap.create_client(pool_size=1, checkout_timeout=0.1)(lambda config: object())
+        with self.assertRaises(StreamSyncFailures) as raised:
+            self.sync(tap)
+        self.assertIsInstance(raised.exception.errors['tickets'], ClientPoolTimeout)
+        self.assertIn("pool may be exhausted", str(raised.exception.errors['tickets']))
+
+class TestThrottledClients(SyncTestCase):
+    def test_client_calls_are_retried_and_rate_limited(self):
+        class Source():
+            def __init__(self):
+                self.calls = 0
+
+            def get(self, i):
+                self.calls += 1
+                if self.calls == 1:
+                    raise ConnectionError("reset by peer")
+                return {'id': i, 'updated_at': '2018-01-02T00:00:00Z'}
+
+        def sync(self, state):
+            for i in range(5):
+                yield self.client.get(i)
+        make_stream_class('Widgets', sync=sync, rate_limiter=RateLimiter(20, burst=1))
+        tap = Tap(config_spec=['start_date'])
+        Tap._Tap__tap = tap
+        source = Source()
+        tap.create_client(retry=RetryPolicy(base_delay=0.01))(lambda config: source)
+        start = time.monotonic()
+        with mock.patch('burler.throttling.metrics.log') as log_metric:
+            messages = self.sync(tap)
+        self.assertEqual(len([m for m in messages if m['type'] == 'RECORD']), 5)
+        self.assertEqual(source.calls, 6)
+        # One call a burst, then 5 more at 20/s
+        self.assertGreater(time.monotonic() - start, 0.2)
+        points = [call[0][1] for call in log_metric.call_args_list]
+        throttled = {point.tags['endpoint']: point for point in points if point.metric == 'client_throttled'}
+        self.assertGreater(throttled['widgets'].value, 0.15)
+        self.assertEqual(throttled['client'].tags['retries'], 1)
+
+    def test_stream_decorator_declares_a_rate_limiter(self):
+        limiter = RateLimiter(20, burst=1)
+        widgets = make_stream_class('Widgets', rows=4)
+        original = widgets.sync
+        def sync(self, state):
+            for record in original(self, state):
+                self.client.get()
+                yield record
+        widgets.sync = sync
+        Tap.streams = {}
+        stream('widgets', rate_limiter=limiter)(widgets)
+        tap = self.make_tap()
+        tap.create_client(lambda config: mock.Mock())
+        start = time.monotonic()
+        self.sync(tap)
+        # One call a burst, then 3 more at 20/s
+        self.assertGreater(time.monotonic() - start, 0.12)
+
+class TestStreamRetries(SyncTestCase):
+    def make_flaky_class(self, failures, rows=6, **attrs):
+        attempts = []
+        def sync(self, state):
+            attempts.append(self.bookmark)
+            for i in range(rows):
+                if len(attempts) <= failures and i == 4:
+                    raise ConnectionError("connection reset")
+                yield {'id': i, 'updated_at': '2018-01-{:02d}T00:00:00Z'.format(i + 2)}
+        make_stream_class('Widgets', sync=sync, bookmark_strategy=every_n(2), retry_sync_on=ConnectionError,
+                          sync_retry_delay=0.01, **attrs)
+        return attempts
+
+    def sync_capturing_failures(self, tap):
+        """ Syncs, returning the messages written and the failures raised, if any. """
+        catalog = Catalog.from_dict(self.discover(tap))
+        output = io.StringIO()
+        failures = None
+        with contextlib.redirect_stdout(output):
+            try:
+                tap.do_sync(CONFIG, catalog, {})
+            except StreamSyncFailures as ex:
+                failures = ex
+        return [json.loads(line) for line in output.getvalue().splitlines()], failures
+
+    def test_stream_restarts_from_last_checkpoint(self):
+        attempts = self.make_flaky_class(failures=2)
+        messages = self.sync(self.make_tap())
+        # Checkpointed after the 4th record, so retries start from its replication key
+        self.assertEqual(attempts, [CONFIG['start_date']] + ['2018-01-05T00:00:00.000000Z'] * 2)
+        self.assertEqual(messages[-1]['value']['bookmarks']['widgets']['updated_at'],
+                         '2018-01-07T00:00:00.000000Z')
+
+    def test_failures_are_raised_together_after_other_streams(self):
+        self.make_flaky_class(failures=10, max_sync_retries=1)
+        make_stream_class('Gadgets')
+        messages, failures = self.sync_capturing_failures(self.make_tap())
+        self.assertEqual(list(failures.errors), ['widgets'])
+        self.assertEqual(len([m for m in messages if m['type'] == 'RECORD' and m['stream'] == 'gadgets']), 3)
+
+    def test_retry_budget_is_shared(self):
+        attempts = self.make_flaky_class(failures=10, max_sync_retries=5)
+        _, failures = self.sync_capturing_failures(self.make_tap(sync_retry_budget=2))
+        self.assertIsNotNone(failures)
+        self.assertEqual(len(attempts), 3)
+
+    def test_setup_retry_can_reset_state(self):
+        def setup_retry(state, exception):
+            state['bookmarks']['widgets']['updated_at'] = '2018-01-03T00:00:00Z'
+        attempts = self.make_flaky_class(failures=1, setup_retry=setup_retry)
+        self.sync(self.make_tap())
+        self.assertEqual(attempts[1], '2018-01-03T00:00:00Z')
+
+class TestInstrumentedSync(SyncTestCase):
+    def test_stages_are_timed(self):
+        make_stream_class('Widgets', rows=10, delay=0.01)
+        reports = []
+        sink = mock.Mock(emit=reports.append)
+        messages = self.sync(self.make_tap(instrumentation=Instrumentation(sample_every=2, sinks=[sink])))
+        self.assertEqual(len([m for m in messages if m['type'] == 'RECORD']), 10)
+        stages = {(entry['stream'], entry['stage']): entry for entry in reports[0]['stages']}
+        self.assertEqual({key for key in stages if key[0] == 'widgets'},
+                         {('widgets', stage) for stage in ['fetch', 'transform', 'write', 'serialize']})
+        self.assertEqual(stages[('widgets', 'transform')]['count'], 5)
+        # The stream sleeps before each record, which is where the time goes
+        self.assertGreater(stages[('widgets', 'fetch')]['min'], 0.009)
+        self.assertIn((None, 'output'), stages)
+
+class TestBookmarkMonitoring(SyncTestCase):
+    def test_out_of_order_records_are_reported(self):
+        def sync(self, state):
+            for i, day in enumerate([1, 3, 2, 4]):
+                yield {'id': i, 'updated_at': '2018-01-{:02d}T00:00:00Z'.format(day)}
+        make_stream_class('Widgets', sync=sync)
+        with mock.patch('burler.taps.LOGGER') as logger:
+            self.sync(self.make_tap(bookmark_monitor_sample=1))
+        logger.info.assert_any_call("%s: %s ordering - %s", 'widgets', 'updated_at',
+                                    "ASC: 2, DESC: 1 (2 changes in ordering)")
+        self.assertEqual(logger.warning.call_count, 1)
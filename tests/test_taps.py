@@ -1,4 +1,6 @@
-from unittest import TestCase
+import sys
+import types
+from unittest import TestCase, mock
 from burler.taps import Tap
 from burler.exceptions import ConfigValidationException, StreamsNotFound
 
@@ -76,6 +78,13 @@ class TestTapConfigValidation(TestCase):
         with self.assertRaises(ConfigValidationException):
             tap.validate_config(conf)
 
+    def test_unrelated_module_named_schema_is_ignored(self):
+        with mock.patch.dict(sys.modules, {'schema': types.ModuleType('schema'),
+                                           'voluptuous': types.ModuleType('voluptuous')}):
+            tap = Tap(config_spec=['start_date'])
+        with self.assertRaises(ConfigValidationException):
+            tap.validate_config({})
+
 class TestImportStreams(TestCase):
     def tearDown(self):
         Tap.streams = {}
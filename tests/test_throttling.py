@@ -0,0 +1,165 @@
+import time
+import asyncio
+from unittest import TestCase, mock
+from concurrent.futures import ThreadPoolExecutor
+from burler.throttling import RateLimiter, RetryPolicy, ThrottleStats, ThrottledClient, throttle, retry_after, is_transient
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__("HTTP {}".format(status_code))
+        self.response = mock.Mock(status_code=status_code, headers=headers or {})
+
+class FlakyClient():
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.calls = 0
+        self.closed = False
+
+    def get(self, value):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return value
+
+    def close(self):
+        self.closed = True
+
+class TestRateLimiter(TestCase):
+    def test_burst_then_steady_rate(self):
+        limiter = RateLimiter(20, per=1)
+        start = time.monotonic()
+        for _ in range(30):
+            limiter.acquire()
+        # 20 in the initial burst, then 10 more at 20/s
+        self.assertGreater(time.monotonic() - start, 0.45)
+        self.assertLess(time.monotonic() - start, 0.7)
+
+    def test_limit_is_shared_across_threads(self):
+        limiter = RateLimiter(10, per=0.5, burst=1)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: limiter.acquire(), range(9)))
+        self.assertGreater(time.monotonic() - start, 0.35)
+
+    def test_defer_pauses_everyone(self):
+        limiter = RateLimiter(100)
+        limiter.defer(0.2)
+        self.assertGreater(limiter.reserve(), 0.15)
+
+class TestRetry(TestCase):
+    def test_transient_errors(self):
+        self.assertTrue(is_transient(HTTPError(429)))
+        self.assertTrue(is_transient(HTTPError(503)))
+        self.assertTrue(is_transient(ConnectionResetError()))
+        self.assertFalse(is_transient(HTTPError(404)))
+        self.assertFalse(is_transient(ValueError()))
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after(HTTPError(429, {'Retry-After': '3'})), 3.0)
+        self.assertIsNone(retry_after(HTTPError(429)))
+        self.assertIsNone(retry_after(ValueError()))
+
+    def test_backoff_is_jittered_and_capped(self):
+        policy = RetryPolicy(base_delay=1, factor=2, max_delay=5)
+        delays = [policy.backoff(10) for _ in range(100)]
+        self.assertTrue(all(0 <= d <= 5 for d in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_retries_then_succeeds(self):
+        client = FlakyClient([HTTPError(503), HTTPError(503)])
+        stats = ThrottleStats()
+        get = throttle(client.get, retry=RetryPolicy(base_delay=0.01), stats=stats)
+        self.assertEqual(get(7), 7)
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(stats.to_dict()['retries'], 2)
+
+    def test_gives_up(self):
+        client = FlakyClient([HTTPError(503)] * 3 + [HTTPError(404)])
+        get = throttle(client.get, retry=RetryPolicy(base_delay=0.01, max_tries=2))
+        with self.assertRaises(HTTPError):
+            get(1)
+        self.assertEqual(client.calls, 2)
+        with self.assertRaises(HTTPError):
+            throttle(FlakyClient([HTTPError(404)]).get, retry=RetryPolicy())(1)
+
+    def test_retry_after_defers_the_limiter(self):
+        limiter = RateLimiter(100)
+        client = FlakyClient([HTTPError(429, {'Retry-After': '0.2'})])
+        stats = ThrottleStats()
+        start = time.monotonic()
+        throttle(client.get, limiter, RetryPolicy(), stats)(1)
+        self.assertGreater(time.monotonic() - start, 0.15)
+        self.assertGreater(stats.to_dict()['throttled_seconds'], 0.15)
+
+    def test_async_calls(self):
+        attempts = []
+        async def get(value):
+            attempts.append(value)
+            if len(attempts) == 1:
+                raise HTTPError(502)
+            return value
+        get = throttle(get, RateLimiter(100), RetryPolicy(base_delay=0.01))
+        self.assertEqual(asyncio.run(get(3)), 3)
+        self.assertEqual(attempts, [3, 3])
+
+    def test_generators_are_throttled_as_they_are_iterated(self):
+        calls = []
+        def pages(count):
+            calls.append(count)
+            if len(calls) == 1:
+                raise HTTPError(503) # Before the first page, so it's called again
+            for page in range(count):
+                yield [page]
+        stats = ThrottleStats()
+        get_pages = throttle(pages, RateLimiter(20, burst=1), RetryPolicy(base_delay=0.01), stats)
+        start = time.monotonic()
+        self.assertEqual(list(get_pages(3)), [[0], [1], [2]])
+        self.assertEqual(calls, [3, 3])
+        # A token for each try of the first page, then each page, at 20/s after the first
+        self.assertGreater(time.monotonic() - start, 0.15)
+        self.assertEqual(stats.to_dict()['retries'], 1)
+
+    def test_ending_a_generator_takes_no_token(self):
+        limiter = RateLimiter(1, per=3600, burst=2)
+        def pages():
+            yield [0]
+            yield [1]
+        self.assertEqual(list(throttle(pages, limiter)()), [[0], [1]])
+        # Two pages took the two tokens, and the call that ended it didn't wait for a third
+        self.assertAlmostEqual(limiter._tokens, 0, places=2)
+
+    def test_generator_is_not_retried_after_yielding(self):
+        calls = []
+        def pages():
+            calls.append(1)
+            yield [0]
+            raise HTTPError(503)
+        get_pages = throttle(pages, retry=RetryPolicy(base_delay=0.01))
+        with self.assertRaises(HTTPError):
+            list(get_pages())
+        self.assertEqual(calls, [1])
+
+    def test_async_generators(self):
+        attempts = []
+        async def pages():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise HTTPError(502)
+            yield [0]
+            yield [1]
+        get_pages = throttle(pages, RateLimiter(100), RetryPolicy(base_delay=0.01))
+        async def collect():
+            return [page async for page in get_pages()]
+        self.assertEqual(asyncio.run(collect()), [[0], [1]])
+        self.assertEqual(len(attempts), 2)
+
+class TestThrottledClient(TestCase):
+    def test_methods_are_throttled_and_close_passes_through(self):
+        client = FlakyClient([HTTPError(500)])
+        stats = ThrottleStats()
+        throttled = ThrottledClient(client, retry=RetryPolicy(base_delay=0.01), stats=stats)
+        self.assertEqual(throttled.get(5), 5)
+        self.assertEqual(throttled.calls, 2)
+        throttled.close()
+        self.assertTrue(client.closed)
+        self.assertEqual(stats.to_dict()['calls'], 2)
@@ -0,0 +1,73 @@
+import copy
+import decimal
+from unittest import TestCase
+from singer import Transformer
+from singer.transform import SchemaMismatch
+from burler.transform import CompiledTransform
+
+class TestCompiledTransform(TestCase):
+    schema = {'type': 'object',
+              'properties': {
+                  'id': {'type': 'integer'},
+                  'name': {'type': ['null', 'string']},
+                  'amount': {'type': ['null', 'string'], 'format': 'singer.decimal'},
+                  'score': {'type': ['null', 'number']},
+                  'active': {'type': 'boolean'},
+                  'updated_at': {'type': 'string', 'format': 'date-time'},
+                  'tags': {'type': 'array', 'items': {'type': 'string'}},
+                  'address': {'type': ['null', 'object'],
+                              'properties': {'city': {'type': 'string'},
+                                             'zip': {'type': ['integer', 'string']}}},
+                  'either': {'anyOf': [{'type': 'integer'}, {'type': 'string'}]},
+                  'extra': {'type': 'object',
+                            'patternProperties': {'^n_': {'type': 'number'}}},
+                  'untyped': {}}}
+
+    mdata = {(): {'selected': True},
+             ('properties', 'id'): {'inclusion': 'automatic'},
+             ('properties', 'name'): {'inclusion': 'available', 'selected': True},
+             ('properties', 'score'): {'inclusion': 'available', 'selected': False},
+             ('properties', 'address', 'properties', 'zip'): {'inclusion': 'unsupported'}}
+
+    record = {'id': '1,234',
+              'name': None,
+              'amount': decimal.Decimal('1.50'),
+              'score': '2.5',
+              'active': 'false',
+              'updated_at': '2018-01-01T12:00:00Z',
+              'tags': [1, 'b'],
+              'address': {'city': 'Philadelphia', 'zip': 19103, 'country': 'US'},
+              'either': 'x',
+              'extra': {'n_a': '1', 'other': 2},
+              'untyped': {'any': ['thing']},
+              'not_in_schema': True}
+
+    def assert_matches_transformer(self, record, schema, mdata=None):
+        with Transformer() as transformer:
+            expected = transformer.transform(copy.deepcopy(record), copy.deepcopy(schema), mdata)
+        actual = CompiledTransform(schema, mdata).transform(copy.deepcopy(record))
+        self.assertEqual(expected, actual)
+        return actual
+
+    def test_matches_transformer_without_metadata(self):
+        self.assert_matches_transformer(self.record, self.schema)
+
+    def test_matches_transformer_with_metadata(self):
+        result = self.assert_matches_transformer(self.record, self.schema, self.mdata)
+        self.assertNotIn('score', result)
+        self.assertNotIn('zip', result['address'])
+
+    def test_transform_is_reusable_across_records(self):
+        transformer = CompiledTransform(self.schema, self.mdata)
+        first = transformer.transform(copy.deepcopy(self.record))
+        second = transformer.transform(copy.deepcopy(self.record))
+        self.assertEqual(first, second)
+        self.assertIn('not_in_schema', transformer.removed)
+        self.assertIn('score', transformer.filtered)
+
+    def test_mismatch_raises_transformer_error(self):
+        with self.assertRaises(SchemaMismatch) as expected:
+            Transformer().transform({'id': 'abc'}, self.schema)
+        with self.assertRaises(SchemaMismatch) as actual:
+            CompiledTransform(self.schema).transform({'id': 'abc'})
+        self.assertEqual(str(expected.exception), str(actual.exception))
@@ -0,0 +1,115 @@
+import asyncio
+import datetime
+from unittest import TestCase, mock
+from burler.validation import BookmarkMonitor, ensure_ordering
+from burler.exceptions import OrderingViolation
+
+def timestamps(days):
+    return ['2018-01-{:02d}T00:00:00.000000Z'.format(day) for day in days]
+
+class TestBookmarkMonitor(TestCase):
+    def track_all(self, monitor, values):
+        for value in values:
+            monitor.track_bookmark_order({'updated_at': value}, 'updated_at')
+        return monitor
+
+    def test_runs_of_orderings(self):
+        monitor = self.track_all(BookmarkMonitor(), timestamps([1, 2, 3, 3, 2, 1, 4]))
+        self.assertEqual(list(monitor.sorting_map), [['ASC', 2], ['EQUAL', 1], ['DESC', 2]])
+        self.assertEqual((monitor.last_ordering, monitor.count), ('ASC', 1))
+        self.assertEqual(monitor.totals, {'ASC': 3, 'EQUAL': 1, 'DESC': 2})
+        self.assertEqual(monitor.summary(), "ASC: 3, DESC: 2, EQUAL: 1 (3 changes in ordering)")
+
+    def test_runs_are_bounded(self):
+        monitor = self.track_all(BookmarkMonitor(max_runs=2), timestamps([1, 2, 1, 2, 1, 2]))
+        self.assertEqual(list(monitor.sorting_map), [['ASC', 1], ['DESC', 1]])
+        self.assertEqual(monitor.runs, 4)
+        self.assertEqual(monitor.totals, {'ASC': 3, 'DESC': 2})
+
+    def test_same_format_is_compared_without_parsing(self):
+        with mock.patch('burler.validation.singer.utils.strptime_to_utc') as strptime:
+            self.track_all(BookmarkMonitor(), timestamps(range(1, 29)))
+        strptime.assert_not_called()
+
+    def test_changed_format_is_parsed(self):
+        # As strings, '2018-01-02T00:00:00Z' < '2018-01-02T00:00:00.5Z' < '2018-01-01T23:00:00-02:00'
+        monitor = self.track_all(BookmarkMonitor(), ['2018-01-02T00:00:00.5Z', '2018-01-02T00:00:00Z',
+                                                     '2018-01-01T23:00:00-02:00', '2018-01-02T00:00:00+00:00'])
+        self.assertEqual(list(monitor.sorting_map), [['DESC', 1], ['ASC', 1]])
+        self.assertEqual(monitor.last_ordering, 'DESC')
+
+    def test_other_formats_are_parsed(self):
+        # As text, '01/02/2018' is before '12/01/2017'
+        monitor = self.track_all(BookmarkMonitor(), ['12/01/2017', '01/02/2018', '01/03/2018'])
+        self.assertEqual(monitor.totals, {'ASC': 2})
+        self.assertEqual(monitor.summary(), "ASC: 2 (0 changes in ordering)")
+
+    def test_datetimes(self):
+        days = [datetime.datetime(2018, 1, day, tzinfo=datetime.timezone.utc) for day in [1, 2, 1]]
+        monitor = self.track_all(BookmarkMonitor(), days)
+        self.assertEqual(list(monitor.sorting_map), [['ASC', 1]])
+        self.assertEqual(monitor.last_ordering, 'DESC')
+
+    def test_sampling(self):
+        # Only days 2, 4 and 6 are looked at
+        monitor = self.track_all(BookmarkMonitor(sample_every=2), timestamps([9, 2, 1, 4, 9, 6]))
+        self.assertEqual(monitor.totals, {'ASC': 2})
+        self.assertEqual(monitor.seen, 6)
+
+    def test_on_change(self):
+        on_change = mock.Mock()
+        values = timestamps([1, 2, 3, 1])
+        self.track_all(BookmarkMonitor(on_change=on_change), values)
+        self.assertEqual(on_change.call_args_list, [
+            mock.call(None, 'ASC', 1, values[0], values[1], {'updated_at': values[1]}),
+            mock.call('ASC', 'DESC', 2, values[2], values[3], {'updated_at': values[3]})])
+
+class TestEnsureOrdering(TestCase):
+    def test_generator(self):
+        @ensure_ordering('updated_at', 'ASC')
+        def records(days):
+            for value in timestamps(days):
+                yield {'updated_at': value}
+
+        self.assertEqual(len(list(records([1, 2, 2, 3]))), 4)
+        emitted = []
+        with self.assertRaisesRegex(OrderingViolation, "records: updated_at went from '2018-01-03.*' "
+                                    "to '2018-01-02.*', expected ascending order"):
+            for record in records([1, 3, 2]):
+                emitted.append(record)
+        self.assertEqual(len(emitted), 2)
+
+    def test_strict_descending_list(self):
+        @ensure_ordering('updated_at', 'DESC', strict=True)
+        def records(days):
+            return [{'updated_at': value} for value in timestamps(days)]
+
+        self.assertEqual(len(records([3, 2, 1])), 3)
+        with self.assertRaises(OrderingViolation):
+            records([3, 3])
+
+    def test_on_violation(self):
+        violations = []
+        @ensure_ordering('updated_at', on_violation=violations.append)
+        def records(self, state):
+            yield from ({'updated_at': value} for value in timestamps([1, 3, 2, 4]))
+
+        self.assertEqual(len(list(records(None, {}))), 4)
+        self.assertEqual(len(violations), 1)
+
+    def test_async_generator(self):
+        @ensure_ordering('updated_at')
+        async def records(days):
+            for value in timestamps(days):
+                yield {'updated_at': value}
+
+        async def collect(days):
+            return [record async for record in records(days)]
+
+        self.assertEqual(len(asyncio.run(collect([1, 2]))), 2)
+        with self.assertRaises(OrderingViolation):
+            asyncio.run(collect([2, 1]))
+
+    def test_invalid_ordering(self):
+        with self.assertRaises(ValueError):
+            ensure_ordering('updated_at', 'asc')
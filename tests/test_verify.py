@@ -0,0 +1,40 @@
+import io
+from unittest import TestCase
+from burler.verify import VerifyReport, compare_to_baseline
+
+class TestVerifyReport(TestCase):
+    def run_report(self):
+        report = VerifyReport()
+        report.start()
+        writer = report.create_writer(output=io.StringIO())
+        writer.write_state({})
+        writer.write_schema('things', {'type': 'object'}, ['id'])
+        for i in range(10):
+            writer.write_record('things', {'id': i})
+        writer.write_state({'bookmarks': {'things': {'updated_at': '2018-01-02T00:00:00Z'}}})
+        writer.write_state({'bookmarks': {'things': {'updated_at': '2018-01-01T00:00:00Z'}}})
+        report.finish()
+        return report
+
+    def test_report_counts_records_and_state(self):
+        report = self.run_report().to_dict()
+        self.assertEqual(report['streams']['things']['records'], 10)
+        self.assertGreater(report['streams']['things']['bytes'], 0)
+        self.assertEqual(report['state']['count'], 3)
+
+    def test_report_flags_bookmark_moving_backwards(self):
+        report = self.run_report()
+        bookmark = report.to_dict()['bookmarks']['things'][0]
+        self.assertEqual([value for _, value in bookmark['history']],
+                         ['2018-01-02T00:00:00Z', '2018-01-01T00:00:00Z'])
+        self.assertTrue(bookmark['moved_backwards'])
+        self.assertIn("moved backwards", report.summary())
+
+    def test_compare_to_baseline_finds_regressions(self):
+        report = {'streams': {'fast': {'records_per_second': 95.0},
+                              'slow': {'records_per_second': 50.0}}}
+        baseline = {'streams': {'fast': {'records_per_second': 100.0},
+                                'slow': {'records_per_second': 100.0}}}
+        regressions = compare_to_baseline(report, baseline, max_regression=0.1)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('slow'))
@@ -0,0 +1,48 @@
+import time
+import datetime
+from unittest import TestCase
+from burler.windows import date_windows, sync_windows
+
+UTC = datetime.timezone.utc
+START = datetime.datetime(2018, 1, 1, tzinfo=UTC)
+
+class Windowed():
+    window_size = datetime.timedelta(days=1)
+
+    def __init__(self, max_concurrent_windows=1, delays=None):
+        self.max_concurrent_windows = max_concurrent_windows
+        self.delays = delays or {}
+
+    def sync_window(self, state, start, end):
+        time.sleep(self.delays.get(start.day, 0))
+        yield {'start': start, 'end': end}
+
+class TestDateWindows(TestCase):
+    def test_last_window_is_truncated(self):
+        windows = list(date_windows(START, START + datetime.timedelta(days=2, hours=12),
+                                    datetime.timedelta(days=1)))
+        self.assertEqual([end - start for start, end in windows],
+                         [datetime.timedelta(days=1), datetime.timedelta(days=1), datetime.timedelta(hours=12)])
+        self.assertEqual(windows[-1][1], START + datetime.timedelta(days=2, hours=12))
+
+    def test_no_windows_when_caught_up(self):
+        self.assertEqual(list(date_windows(START, START, datetime.timedelta(days=1))), [])
+
+    def test_size_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            list(date_windows(START, START + datetime.timedelta(days=1), datetime.timedelta(0)))
+
+class TestSyncWindows(TestCase):
+    def test_windows_are_emitted_in_order(self):
+        # The first window is the slowest, so later windows finish before it
+        instance = Windowed(max_concurrent_windows=4, delays={1: 0.1})
+        results = list(sync_windows(instance, {}, '2018-01-01T00:00:00Z', START + datetime.timedelta(days=6)))
+        self.assertEqual([end.day for end, _ in results], [2, 3, 4, 5, 6, 7])
+        self.assertEqual([records[0]['start'].day for _, records in results], [1, 2, 3, 4, 5, 6])
+
+    def test_windows_are_fetched_in_parallel(self):
+        instance = Windowed(max_concurrent_windows=4, delays={day: 0.1 for day in range(1, 9)})
+        start = time.monotonic()
+        list(sync_windows(instance, {}, START, START + datetime.timedelta(days=8)))
+        # Serially this takes at least 8 windows * 0.1s = 0.8s
+        self.assertLess(time.monotonic() - start, 0.5)
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from burler import xsd, schema_types
+from burler.exceptions import XSDTranslationError, NoWSDLLocationSpecified
+
+RESOURCES = os.path.join(os.path.dirname(__file__), 'resources', 'xsd')
+
+class TestXSDCompiler(TestCase):
+    def setUp(self):
+        self.compiler = xsd.XSDCompiler()
+        self.compiler.load(os.path.join(RESOURCES, 'service.wsdl'))
+
+    def test_includes_and_imports_are_loaded(self):
+        self.assertEqual({os.path.basename(path) for path in self.compiler.files},
+                         {'service.wsdl', 'billing-types.xsd', 'common.xsd'})
+
+    def test_complex_type_with_extension(self):
+        properties = self.compiler.compile('Invoice')['properties']
+        self.assertEqual(list(properties), ['Id', 'UpdatedAt', 'Amount', 'Status', 'BillTo', 'Lines',
+                                            'PaidOn', 'DueOn', 'currency', 'draft'])
+        self.assertEqual(properties['Id'], {'type': 'integer'})
+        self.assertEqual(properties['UpdatedAt'], {'type': ['null', 'string'], 'format': 'date-time'})
+        self.assertEqual(properties['Status'], {'type': 'string'})
+        self.assertEqual(properties['currency'], {'type': 'string'})
+        self.assertEqual(properties['draft'], {'type': ['null', 'boolean']})
+
+    def test_simple_content_lists_and_occurrence(self):
+        properties = self.compiler.compile('Invoice')['properties']
+        self.assertEqual(properties['Amount']['properties'], {'value': {'type': 'number'},
+                                                              'currency': {'type': ['null', 'string']}})
+        self.assertEqual(properties['BillTo']['type'], ['null', 'object'])
+        self.assertEqual(properties['Lines']['type'], ['null', 'array'])
+        self.assertEqual(properties['Lines']['items']['properties']['Codes'],
+                         {'type': 'array', 'items': {'type': 'string'}})
+        self.assertEqual(properties['PaidOn'], {'type': ['null', 'string']})
+
+    def test_recursive_element_is_cut_off(self):
+        category = self.compiler.compile('GetInvoiceResponse')['properties']['Category']
+        self.assertEqual(category['properties']['Category'], {'type': ['null', 'array'], 'items': {}})
+
+    def test_missing_type_raises(self):
+        with self.assertRaises(XSDTranslationError):
+            self.compiler.compile('CreditNote')
+
+class TestWSDLSchemaType(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        for name in os.listdir(RESOURCES):
+            shutil.copy(os.path.join(RESOURCES, name), self.directory)
+        self.wsdl = os.path.join(self.directory, 'service.wsdl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_compiled_schema_is_cached_until_a_dependency_changes(self):
+        get_schema = schema_types.wsdl(filepath=self.wsdl, type_name='Invoice', cache_dir=self.cache_dir)
+        first = get_schema()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        compiled = []
+        original = xsd.XSDCompiler.compile
+        def compile_type(compiler, type_name):
+            compiled.append(type_name)
+            return original(compiler, type_name)
+        xsd.XSDCompiler.compile = compile_type
+        try:
+            self.assertEqual(get_schema(), first)
+            self.assertEqual(compiled, [])
+
+            common = os.path.join(self.directory, 'common.xsd')
+            with open(common) as f:
+                content = f.read()
+            with open(common, 'w') as f:
+                f.write(content.replace('name="Street"', 'name="Line1"'))
+            self.assertIn('Line1', get_schema()['properties']['BillTo']['properties'])
+            self.assertEqual(compiled, ['Invoice'])
+        finally:
+            xsd.XSDCompiler.compile = original
+
+    def test_location_and_type_are_required(self):
+        with self.assertRaises(NoWSDLLocationSpecified):
+            schema_types.wsdl()()
+        with self.assertRaises(XSDTranslationError):
+            schema_types.wsdl(filepath=self.wsdl)()